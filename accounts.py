@@ -1,10 +1,10 @@
 #accounts.py
 
-import sqlite3
+import db
 
 
 def initialize_db():
-    conn = sqlite3.connect('accounts.db')
+    conn = db.get_connection('accounts')
     c = conn.cursor()
 
     # Create users table
@@ -24,9 +24,7 @@ def initialize_db():
     conn.close()
 
 def get_db_connection():
-    conn = sqlite3.connect('accounts.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_connection('accounts')
 
 def create_user(username, email, password, name):
     conn = get_db_connection()
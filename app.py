@@ -1,48 +1,82 @@
+import os
+
 from flask import Flask, render_template, session, redirect, url_for, request
 from flask_cors import CORS
 
-from extensions import bcrypt
+import assets
+import compression
+import db
+import metrics
+import migrations
+import profiling
+import querytrace
 from routes.auth_routes import auth_bp
 from routes.task_routes import task_bp
 from routes.collab_routes import collab_bp
+from routes.sync_routes import sync_bp
 
-from database import initialize_db
-from tasks import initialize_db as initialize_tasks_db
-from collab_lists import initialize_db as initialize_collab_lists_db
-from collab_members import initialize_db as initialize_collab_members_db
-
-app = Flask(__name__)
-bcrypt.init_app(app)
-app.secret_key = 'mysupersecretkey'
-CORS(app)
-
-initialize_db()
-initialize_tasks_db()
-initialize_collab_lists_db()
-initialize_collab_members_db()
-
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(task_bp)
-app.register_blueprint(collab_bp)
+# TODO_AUTO_MIGRATE=0: refuse to start on an outdated schema instead of
+# migrating (deployments that run `python -m migrations` as a release step)
+AUTO_MIGRATE = os.environ.get('TODO_AUTO_MIGRATE', '1') != '0'
 
-PROTECTED_PATHS = ('/my-tasks', '/tasks', '/collab_lists', '/auth/logout')
+PROTECTED_PATHS = ('/my-tasks', '/tasks', '/collab_lists', '/sync', '/auth/logout')
 
 
-@app.after_request
 def add_no_cache_headers(response):
     """Prevent browsers from caching authenticated pages so sessions remain consistent."""
     if session.get('user_id'):
-        if any(request.path.startswith(path) for path in PROTECTED_PATHS):
+        # ETag responses keep their private/revalidate headers from http_cache
+        if any(request.path.startswith(path) for path in PROTECTED_PATHS) and not response.headers.get('ETag'):
             response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '0'
     return response
 
-@app.route('/')
+
 def home():
     if 'user_id' in session:
         return redirect(url_for('task_bp.tasks_page'))
     return render_template('base.html')
 
+
+def prepare_databases(apply=AUTO_MIGRATE):
+    """The one startup path for the schema: a version check per database, DDL only when behind"""
+    applied = []
+    for name in migrations.databases():
+        applied += migrations.ensure_current(name, apply=apply)
+    # Don't keep boot connections: with gunicorn's preload_app they would be
+    # inherited by every forked worker
+    db.close_all()
+    return applied
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.secret_key = 'mysupersecretkey'
+    if config:
+        app.config.update(config)
+    CORS(app)
+    # metrics first: its after_request then runs last and sees the compressed size
+    metrics.init_app(app)
+    profiling.init_app(app)
+    querytrace.init_app(app)
+    compression.init_app(app)
+    assets.init_app(app)
+
+    prepare_databases()
+
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(task_bp)
+    app.register_blueprint(collab_bp)
+    app.register_blueprint(sync_bp)
+
+    app.after_request(add_no_cache_headers)
+    app.add_url_rule('/', 'home', home)
+    return app
+
+
+# `gunicorn app:app` (see gunicorn.conf.py for preload_app)
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5002)
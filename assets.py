@@ -0,0 +1,303 @@
+#assets.py
+# Static asset pipeline: content-hashed file names, a manifest, critical CSS.
+#
+#   python assets.py build   copy static/ to static/dist/ as name.<hash>.ext,
+#                            write dist/manifest.json and per-page critical CSS,
+#                            then precompress everything (compression.py)
+#   python assets.py fonts   download the Google web fonts into static/fonts/
+#   python assets.py icons <fa-solid-900.ttf>
+#                            rebuild the Font Awesome subset (needs fonttools)
+#
+# At runtime url_for('static', filename='style.css') resolves to the hashed
+# copy listed in the manifest, and hashed files are served as immutable for a
+# year. Without a build everything falls back to the plain files.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.request
+
+from flask import request
+
+import compression
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Pages whose above-the-fold CSS is inlined: page -> template it renders
+CRITICAL_PAGES = {
+    'login': 'login.html',
+    'board': 'tasks.html',
+}
+CRITICAL_STYLESHEET = 'style.css'
+
+# Font Awesome glyphs used by the templates and static/js (see static/css/icons.css)
+ICONS = {
+    'archive': 0xf187, 'edit': 0xf044, 'plus': 0x2b, 'sign-out-alt': 0xf2f5, 'times': 0xf00d,
+    'trash': 0xf1f8, 'undo': 0xf0e2, 'user-circle': 0xf2bd, 'user-plus': 0xf234, 'users': 0xf0c0,
+}
+ICON_FONT = 'fonts/fa-solid-subset.woff2'
+
+# Google fonts self-hosted by `python assets.py fonts`: css file -> css2 family query
+GOOGLE_FONTS = {
+    'fonts/pixelify-sans.css': 'Pixelify+Sans:wght@400..700',
+}
+GOOGLE_FONT_SUBSETS = ('latin',)
+
+_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+_manifest = {}
+_critical = {}
+
+
+# --- build ---------------------------------------------------------------
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [d for d in dirs if d != DIST]
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            yield os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+
+
+def _hashed_name(path, data):
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest}{ext}'
+
+
+def _rewrite_urls(css, css_path, manifest, prefix=None):
+    """Point url() references in a stylesheet at hashed files.
+
+    References stay relative unless prefix is given (used for inlined CSS,
+    where relative urls would resolve against the page).
+    """
+    base = os.path.dirname(css_path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(base, url.split('?')[0].split('#')[0])).replace(os.sep, '/')
+        if target not in manifest:
+            return match.group(0)
+        if prefix is not None:
+            return f'url({quote}{prefix}/{manifest[target]}{quote})'
+        hashed = os.path.relpath(manifest[target], os.path.join(DIST, base)).replace(os.sep, '/')
+        return f'url({quote}{hashed}{quote})'
+    return _URL.sub(replace, css)
+
+
+def build(static_folder=STATIC_DIR, static_url='/static'):
+    """Write hashed copies, the manifest and critical CSS to static/dist"""
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {}
+    # Stylesheets last: their hashes depend on the hashed names they reference
+    paths = sorted(_source_files(static_folder), key=lambda path: (path.endswith('.css'), path))
+    for path in paths:
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = _rewrite_urls(data.decode('utf-8'), path, manifest).encode('utf-8')
+        hashed = f'{DIST}/{_hashed_name(path, data)}'
+        target = os.path.join(static_folder, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        manifest[path] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    with open(os.path.join(static_folder, CRITICAL_STYLESHEET), encoding='utf-8') as f:
+        stylesheet = f.read()
+    for page, template in CRITICAL_PAGES.items():
+        classes, ids = _template_selectors(template)
+        css = _rewrite_urls(critical_rules(stylesheet, classes, ids), CRITICAL_STYLESHEET, manifest,
+                            prefix=static_url)
+        with open(os.path.join(dist, f'critical-{page}.css'), 'w', encoding='utf-8') as f:
+            f.write(css)
+
+    compression.precompress_static(dist)
+    return manifest
+
+
+# --- critical CSS --------------------------------------------------------
+
+def _template_selectors(template):
+    """Classes and ids in the server-rendered markup of a page and base.html"""
+    markup = ''
+    for name in ('base.html', template):
+        with open(os.path.join(TEMPLATES_DIR, name), encoding='utf-8') as f:
+            markup += f.read()
+    classes = set()
+    for value in re.findall(r'''class\s*=\s*["']([^"']*)["']''', markup):
+        classes.update(value.split())
+    ids = set(re.findall(r'''id\s*=\s*["']([\w-]+)["']''', markup))
+    return classes, ids
+
+
+def _blocks(css):
+    """Top-level (prelude, body) pairs of a stylesheet; bare statements are skipped"""
+    depth = 0
+    start = body_start = 0
+    prelude = ''
+    for i, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:i].strip()
+                body_start = i + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                yield prelude, css[body_start:i]
+                start = i + 1
+        elif char == ';' and depth == 0:
+            start = i + 1
+
+
+def _selector_matches(selector, classes, ids):
+    return (set(re.findall(r'\.(-?[_a-zA-Z][\w-]*)', selector)) <= classes
+            and set(re.findall(r'#(-?[_a-zA-Z][\w-]*)', selector)) <= ids)
+
+
+def critical_rules(css, classes, ids):
+    """Rules whose selectors only use the given classes/ids (plus element selectors).
+
+    @font-face, @keyframes and @import are left to the full stylesheet.
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    out = []
+    for prelude, body in _blocks(css):
+        if prelude.startswith('@media'):
+            inner = critical_rules(body, classes, ids)
+            if inner:
+                out.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            continue
+        elif any(_selector_matches(selector, classes, ids) for selector in prelude.split(',')):
+            declarations = ' '.join(body.split())
+            out.append(f"{' '.join(prelude.split())}{{{declarations}}}")
+    return '\n'.join(out)
+
+
+# --- fonts ---------------------------------------------------------------
+
+def fetch_google_fonts(static_folder=STATIC_DIR):
+    """Download the GOOGLE_FONTS families (woff2, GOOGLE_FONT_SUBSETS only) into static/fonts"""
+    # A modern browser user agent, so Google serves woff2 split by unicode range
+    headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                             'Chrome/120.0 Safari/537.36'}
+    written = []
+    for css_path, family in GOOGLE_FONTS.items():
+        url = f'https://fonts.googleapis.com/css2?family={family}&display=swap'
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+            css = response.read().decode('utf-8')
+        faces = []
+        for subset, face in re.findall(r'/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*{[^}]*})', css):
+            if subset not in GOOGLE_FONT_SUBSETS:
+                continue
+            remote = _URL.search(face).group(2)
+            stem = os.path.splitext(os.path.basename(css_path))[0]
+            font_path = f'fonts/{stem}-{subset}.woff2'
+            with urllib.request.urlopen(remote, timeout=30) as response:
+                data = response.read()
+            with open(os.path.join(static_folder, font_path), 'wb') as f:
+                f.write(data)
+            written.append(font_path)
+            faces.append(face.replace(remote, os.path.basename(font_path)))
+        with open(os.path.join(static_folder, css_path), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(faces) + '\n')
+        written.append(css_path)
+    return written
+
+
+def subset_icons(source_font, static_folder=STATIC_DIR):
+    """Rebuild the icon font with only the ICONS glyphs (needs fonttools and brotli)"""
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    font = subset.load_font(source_font, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=ICONS.values())
+    subsetter.subset(font)
+    subset.save_font(font, os.path.join(static_folder, ICON_FONT), options)
+    return ICON_FONT
+
+
+# --- runtime -------------------------------------------------------------
+
+def load_manifest(static_folder=STATIC_DIR):
+    global _manifest
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    _critical.clear()
+    return _manifest
+
+
+def asset_exists(path):
+    return path in _manifest or os.path.isfile(os.path.join(STATIC_DIR, path))
+
+
+def critical_css(page):
+    """Inline CSS for a page, or '' when assets haven't been built"""
+    if page not in _critical:
+        try:
+            with open(os.path.join(STATIC_DIR, DIST, f'critical-{page}.css'), encoding='utf-8') as f:
+                _critical[page] = f.read()
+        except FileNotFoundError:
+            _critical[page] = ''
+    return _critical[page]
+
+
+def _hashed_static_url(endpoint, values):
+    if endpoint == 'static':
+        hashed = _manifest.get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+
+def _cache_hashed_assets(response):
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and (request.view_args or {}).get('filename', '').startswith(DIST + '/')):
+        response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def init_app(app):
+    load_manifest(app.static_folder)
+    app.url_defaults(_hashed_static_url)
+    app.after_request(_cache_hashed_assets)
+    app.jinja_env.globals.update(critical_css=critical_css, asset_exists=asset_exists)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'build':
+        manifest = build()
+        print(f'wrote {len(manifest)} hashed files to static/{DIST}/')
+    elif command == 'fonts':
+        for path in fetch_google_fonts():
+            print(f'wrote static/{path}')
+    elif command == 'icons' and len(sys.argv) == 3:
+        print(f'wrote static/{subset_icons(sys.argv[2])}')
+    else:
+        print('usage: python assets.py [build | fonts | icons <fa-solid-900.ttf>]')
+        sys.exit(1)
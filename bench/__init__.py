@@ -0,0 +1,11 @@
+#bench/__init__.py
+# Load-testing and benchmark suite (python -m bench --help).
+#
+#   python -m bench seed --dir bench_data --users 100000 --tasks 5000000 --lists 20000
+#   python -m bench run --dir bench_data --concurrency 16 --save bench/baselines/main.json
+#   python -m bench run --dir bench_data --concurrency 16 --compare bench/baselines/main.json
+#
+# `seed` builds a synthetic data set from the real migrations, `run` drives
+# the real endpoints over HTTP and reports throughput and p50/p95/p99 per
+# endpoint, and `compare` diffs two saved results. Baselines only compare
+# meaningfully against runs on the same machine, data set and settings.
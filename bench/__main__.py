@@ -0,0 +1,123 @@
+#bench/__main__.py
+# python -m bench {seed,run,compare,plans,boot,postgres}
+
+import argparse
+import json
+import sys
+
+from bench import boot, load, plans, postgres, seed
+
+
+def _seed(args):
+    seed.seed(args.dir, users=args.users, tasks=args.tasks, lists=args.lists, min_members=args.min_members,
+              max_members=args.max_members, list_share=args.list_share, random_seed=args.seed,
+              rounds=args.bcrypt_rounds, force=args.force)
+    return 0
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _report_comparison(baseline, current, threshold):
+    lines, regressions = load.compare(baseline, current, threshold)
+    print('\n'.join(lines))
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+def _run(args):
+    document = load.run(args.dir, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup,
+                        endpoints=args.endpoints.split(',') if args.endpoints else load.ENDPOINTS,
+                        server=args.server, workers=args.workers, threads=args.threads,
+                        worker_class=args.worker_class,
+                        copy=not args.no_copy, random_seed=args.seed)
+    print(load.format_results(document))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f'saved {args.save}')
+    if args.compare:
+        return _report_comparison(_load(args.compare), document, args.threshold)
+    return 0
+
+
+def _compare(args):
+    return _report_comparison(_load(args.baseline), _load(args.current), args.threshold)
+
+
+def _plans(args):
+    return plans.main(update=args.update)
+
+
+def _boot(args):
+    return boot.main(repeat=args.repeat, budget_ms=args.budget_ms, save=args.save)
+
+
+def _postgres(args):
+    return postgres.main(writers=args.writers, tasks_each=args.tasks)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m bench')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('seed', help='create a synthetic data set')
+    p.add_argument('--dir', default='bench_data')
+    p.add_argument('--users', type=int, default=1000)
+    p.add_argument('--tasks', type=int, default=50000)
+    p.add_argument('--lists', type=int, default=100)
+    p.add_argument('--min-members', type=int, default=2)
+    p.add_argument('--max-members', type=int, default=500)
+    p.add_argument('--list-share', type=float, default=0.3, help='fraction of tasks on collaborative lists')
+    p.add_argument('--bcrypt-rounds', type=int, help='password hash cost (default: TODO_BCRYPT_ROUNDS)')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--force', action='store_true', help='replace existing databases in --dir')
+    p.set_defaults(handler=_seed)
+
+    p = commands.add_parser('run', help='benchmark the endpoints against a seeded data set')
+    p.add_argument('--dir', default='bench_data')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--duration', type=float, default=10, help='measured seconds per endpoint')
+    p.add_argument('--warmup', type=float, default=2, help='unrecorded seconds before each endpoint')
+    p.add_argument('--endpoints', help=f"comma-separated subset of {','.join(load.ENDPOINTS)}")
+    p.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    p.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    p.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker (sync/gthread workers)')
+    p.add_argument('--worker-class', default='gevent', help='gunicorn worker class (gevent, as deployed, or sync)')
+    p.add_argument('--no-copy', action='store_true', help='serve --dir itself instead of a scratch copy')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--save', help='write the results as JSON (a baseline)')
+    p.add_argument('--compare', help='baseline JSON to compare against; exits 1 on regression')
+    p.add_argument('--threshold', type=float, default=0.10, help='allowed p95/throughput change (0.10 = 10%%)')
+    p.set_defaults(handler=_run)
+
+    p = commands.add_parser('compare', help='compare two saved results')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--threshold', type=float, default=0.10)
+    p.set_defaults(handler=_compare)
+
+    p = commands.add_parser('plans', help='check the query plans of every statement the app issues')
+    p.add_argument('--update', action='store_true', help='re-record bench/query_plans.txt')
+    p.set_defaults(handler=_plans)
+
+    p = commands.add_parser('boot', help='measure import, boot and worker fork times')
+    p.add_argument('--repeat', type=int, default=5)
+    p.add_argument('--budget-ms', type=float, help='fail if the median cold boot is slower')
+    p.add_argument('--save', help='write the results as JSON')
+    p.set_defaults(handler=_boot)
+
+    p = commands.add_parser('postgres', help='check the PostgreSQL backend (TODO_DATABASE_URL) in a scratch schema')
+    p.add_argument('--writers', type=int, default=8, help='concurrent writer threads')
+    p.add_argument('--tasks', type=int, default=25, help='list tasks each writer creates')
+    p.set_defaults(handler=_postgres)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
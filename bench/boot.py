@@ -0,0 +1,141 @@
+#bench/boot.py
+# Startup benchmark: python -m bench boot [--repeat N] [--budget-ms MS]
+#
+# Each measurement is a fresh interpreter on a scratch data directory:
+#   first boot     import app on empty databases (every migration runs)
+#   cold boot      import app with the schema current - what a new worker
+#                  or an autoscaled instance pays without preload_app
+#   create_app     a second create_app() in an already-imported process
+#   fork to ready  preload_app's cost: fork the booted process and serve a
+#                  first database-backed request in the child
+# plus the SQL statements issued during a cold boot (DDL should be zero) and
+# the slowest modules app.py imports, from python -X importtime.
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DDL = ('CREATE', 'ALTER', 'DROP')
+TOP_IMPORTS = 8
+
+# Runs in the child interpreter; prints one JSON line
+_PROBE = r'''
+import json, os, time
+started = time.perf_counter()
+import db
+statements = []
+db.add_statement_observer(lambda cursor, sql, params, seconds: sql and statements.append(sql.split()[0].upper()))
+import app
+booted = time.perf_counter()
+boot_statements = list(statements)
+app.create_app()
+recreated = time.perf_counter()
+
+read_fd, write_fd = os.pipe()
+forked = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    app.app.test_client().post('/auth/login', json={'username': 'nobody', 'password': 'x'})
+    os.write(write_fd, str(time.perf_counter() - forked).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+fork_seconds = float(os.read(read_fd, 64))
+print(json.dumps({'boot': booted - started, 'create_app': recreated - booted, 'fork': fork_seconds,
+                  'statements': boot_statements}))
+'''
+
+
+def _probe(data_dir, importtime=False):
+    env = dict(os.environ, TODO_DATA_DIR=data_dir, PYTHONPATH=ROOT)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', _PROBE]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise SystemExit(f'boot probe failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def _top_imports(importtime_output):
+    """(cumulative ms, module) for the slowest modules imported directly by app.py"""
+    children, imports = [], []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # importtime indents two spaces per nesting level; a module is listed after its imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == 'app':
+                imports = children
+            children = []
+    return sorted(imports, reverse=True)[:TOP_IMPORTS]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def _summary(values):
+    values = [_ms(value) for value in values]
+    return {'median_ms': round(statistics.median(values), 1), 'min_ms': min(values), 'max_ms': max(values)}
+
+
+def run(repeat=5):
+    data_dir = tempfile.mkdtemp(prefix='todo-boot-')
+    try:
+        first, _ = _probe(data_dir)
+        cold = [_probe(data_dir) for _ in range(repeat)]
+        _, importtime_output = _probe(data_dir, importtime=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    statements = cold[0][0]['statements']
+    return {
+        'first_boot_ms': _ms(first['boot']),
+        'first_boot_statements': len(first['statements']),
+        'cold_boot': _summary(result['boot'] for result, _ in cold),
+        'create_app': _summary(result['create_app'] for result, _ in cold),
+        'fork_to_ready': _summary(result['fork'] for result, _ in cold),
+        'boot_statements': len(statements),
+        'boot_ddl': sum(statement in DDL for statement in statements),
+        'slowest_imports': [{'module': name, 'cumulative_ms': round(ms, 1)}
+                            for ms, name in _top_imports(importtime_output)],
+        'repeat': repeat,
+    }
+
+
+def format_results(results):
+    lines = [
+        f"first boot (migrating)  {results['first_boot_ms']} ms, {results['first_boot_statements']} statements",
+    ]
+    for key, label in (('cold_boot', 'cold boot'), ('create_app', 'create_app'), ('fork_to_ready', 'fork to ready')):
+        r = results[key]
+        lines.append(f"{label:<24}{r['median_ms']} ms median ({r['min_ms']}-{r['max_ms']})")
+    lines.append(f"{'boot statements':<24}{results['boot_statements']} ({results['boot_ddl']} DDL)")
+    lines.append('slowest imports in app.py:')
+    for entry in results['slowest_imports']:
+        lines.append(f"  {entry['cumulative_ms']:>8} ms  {entry['module']}")
+    return '\n'.join(lines)
+
+
+def main(repeat=5, budget_ms=None, save=None):
+    results = run(repeat)
+    print(format_results(results))
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved {save}')
+    failed = False
+    if results['boot_ddl']:
+        print(f"FAIL cold boot issued {results['boot_ddl']} DDL statement(s)")
+        failed = True
+    if budget_ms is not None and results['cold_boot']['median_ms'] > budget_ms:
+        print(f"FAIL cold boot median {results['cold_boot']['median_ms']} ms is over the {budget_ms} ms budget")
+        failed = True
+    return 1 if failed else 0
@@ -0,0 +1,336 @@
+#bench/load.py
+# Fixed-concurrency load against the real app over HTTP.
+#
+# The app runs in its own process (werkzeug's threaded server, or gunicorn)
+# on a copy of a seeded data directory, so writes made by the benchmark
+# never leak into the next run. Each endpoint is measured in its own phase:
+# `concurrency` virtual users, each a logged-in seeded user on a keep-alive
+# connection, call it back to back for `duration` seconds after a short
+# unrecorded warmup.
+
+import gzip
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import db
+from bench.seed import WORDS, load_manifest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATUSES = ('pending', 'in_progress', 'completed')
+SERVER_START_TIMEOUT = 60
+BASELINE_FORMAT = 1
+
+
+class Client:
+    """One keep-alive HTTP connection carrying one user's session cookie"""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookie = None
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, method, path, body=None):
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, body=data, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        if response.getheader('Content-Encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        return response.status, payload
+
+    def close(self):
+        self.conn.close()
+
+
+class VirtualUser:
+    def __init__(self, port, user_id, list_id, task_ids, manifest, rng):
+        self.client = Client(port)
+        self.user_id = user_id
+        self.username = f'user{user_id}'
+        self.list_id = list_id
+        self.task_ids = task_ids
+        self.manifest = manifest
+        self.rng = rng
+
+    def login(self):
+        self.client.cookie = None
+        return self.client.request('POST', '/auth/login',
+                                   {'username': self.username, 'password': self.manifest['password']})
+
+    def board(self):
+        return self.client.request('GET', '/tasks')
+
+    def list_board(self):
+        return self.client.request('GET', f'/collab_lists/{self.list_id}/tasks')
+
+    def status_drag(self):
+        task_id = self.rng.choice(self.task_ids)
+        return self.client.request('PUT', f'/tasks/{task_id}/status', {'status': self.rng.choice(STATUSES)})
+
+    def search(self):
+        return self.client.request('GET', f'/tasks/search?q={self.rng.choice(WORDS)}')
+
+    def collab_lists(self):
+        return self.client.request('GET', '/collab_lists')
+
+    def member_add(self):
+        candidate = self.rng.randint(1, self.manifest['users'])
+        return self.client.request('POST', f'/collab_lists/{self.list_id}/members',
+                                   {'username_or_email': f'user{candidate}'})
+
+
+# Phase name -> VirtualUser method, in run order
+ENDPOINTS = ('login', 'board', 'list_board', 'status_drag', 'search', 'collab_lists', 'member_add')
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _copy_data(data_dir):
+    copy = tempfile.mkdtemp(prefix='todo-bench-')
+    # The seeder closes cleanly, so there is no -wal to carry over
+    for path in db.database_files(data_dir):
+        shutil.copy2(path, os.path.join(copy, os.path.basename(path)))
+    return copy
+
+
+def start_server(data_dir, port, server='werkzeug', workers=2, threads=8, bcrypt_rounds=None,
+                 worker_class='gevent'):
+    env = dict(os.environ, TODO_DATA_DIR=os.path.abspath(data_dir), PYTHONPATH=ROOT)
+    if bcrypt_rounds:
+        env['TODO_BCRYPT_ROUNDS'] = str(bcrypt_rounds)
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--threads', str(threads), '--worker-class', worker_class,
+                   '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'bench.server', str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'server did not start within {SERVER_START_TIMEOUT} s')
+
+
+def pick_users(data_dir, count, rng):
+    """(user_id, list_id, personal task ids) for list owners that have personal tasks"""
+    lists = sqlite3.connect(db.db_path('collab_lists', data_dir))
+    tasks = sqlite3.connect(db.db_path('tasks', data_dir))
+    owners = lists.execute('SELECT owner_id, MIN(id) FROM collab_lists GROUP BY owner_id ORDER BY owner_id').fetchall()
+    picked = []
+    for owner_id, list_id in owners:
+        task_ids = [row[0] for row in tasks.execute(
+            'SELECT id FROM tasks WHERE user_id = ? AND collab_list_id IS NULL LIMIT 500', (owner_id,))]
+        if task_ids:
+            picked.append((owner_id, list_id, task_ids))
+        if len(picked) == count:
+            break
+    lists.close()
+    tasks.close()
+    if not picked:
+        raise SystemExit('no list owner has personal tasks; seed with more tasks or lists')
+    # Fewer suitable users than virtual users: some share an account
+    return [picked[i % len(picked)] for i in range(count)]
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return 0.0
+    rank = math.ceil(fraction * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def summarize(latencies, statuses, errors, seconds):
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'throughput': round(len(ordered) / seconds, 1) if seconds else 0.0,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def run_phase(users, endpoint, duration, warmup):
+    """Every virtual user calls one endpoint back to back; returns the summary"""
+    results = [([], {}, [0]) for _ in users]
+    start = threading.Barrier(len(users) + 1)
+    timing = {}
+
+    def work(user, result):
+        latencies, statuses, errors = result
+        call = getattr(user, endpoint)
+        start.wait()
+        record_from = timing['record_from']
+        stop_at = timing['stop_at']
+        while True:
+            began = time.perf_counter()
+            if began >= stop_at:
+                break
+            try:
+                status, _ = call()
+            except (http.client.HTTPException, OSError):
+                status = None
+            elapsed = time.perf_counter() - began
+            if began < record_from:
+                continue
+            if status is None or status >= 500:
+                errors[0] += 1
+            if status is not None:
+                statuses[status] = statuses.get(status, 0) + 1
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=work, args=(user, result), daemon=True) for user, result in zip(users, results)]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    timing['record_from'] = now + warmup
+    timing['stop_at'] = now + warmup + duration
+    start.wait()
+    for thread in threads:
+        thread.join()
+
+    latencies, statuses, errors = [], {}, 0
+    for user_latencies, user_statuses, user_errors in results:
+        latencies += user_latencies
+        errors += user_errors[0]
+        for code, count in user_statuses.items():
+            statuses[code] = statuses.get(code, 0) + count
+    return summarize(latencies, statuses, errors, duration)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(data_dir, concurrency=8, duration=10, warmup=2, endpoints=ENDPOINTS, server='werkzeug',
+        workers=2, threads=8, copy=True, random_seed=1, worker_class='gevent'):
+    """Benchmark each endpoint in turn; returns the baseline document"""
+    manifest = load_manifest(data_dir)
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"unknown endpoint(s): {', '.join(sorted(unknown))}")
+    rng = random.Random(random_seed)
+    picks = pick_users(data_dir, concurrency, rng)
+
+    served_dir = _copy_data(data_dir) if copy else data_dir
+    port = _free_port()
+    process = start_server(served_dir, port, server, workers, threads, manifest.get('bcrypt_rounds'), worker_class)
+    users = [VirtualUser(port, user_id, list_id, task_ids, manifest, random.Random(rng.random()))
+             for user_id, list_id, task_ids in picks]
+    results = {}
+    try:
+        for user in users:
+            status, _ = user.login()
+            if status != 200:
+                raise SystemExit(f'login as {user.username} failed with {status}')
+        for endpoint in endpoints:
+            print(f'[bench] {endpoint}: {concurrency} users for {duration} s', flush=True)
+            results[endpoint] = run_phase(users, endpoint, duration, warmup)
+    finally:
+        for user in users:
+            user.client.close()
+        process.terminate()
+        process.wait(timeout=30)
+        if copy:
+            shutil.rmtree(served_dir, ignore_errors=True)
+
+    return {
+        'format': BASELINE_FORMAT,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()}, {os.cpu_count()} cpus',
+        'config': {'concurrency': concurrency, 'duration': duration, 'warmup': warmup, 'server': server,
+                   'workers': workers if server == 'gunicorn' else 1, 'threads': threads if server == 'gunicorn' else None,
+                   'worker_class': worker_class if server == 'gunicorn' else None},
+        'data': manifest,
+        'endpoints': results,
+    }
+
+
+def format_results(document):
+    lines = [f"{'endpoint':<14}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}  statuses"]
+    for endpoint, result in document['endpoints'].items():
+        statuses = ' '.join(f'{code}:{count}' for code, count in result['statuses'].items())
+        lines.append(f"{endpoint:<14}{result['throughput']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                     f"{result['p99_ms']:>9}{result['max_ms']:>9}{result['errors']:>8}  {statuses}")
+    return '\n'.join(lines)
+
+
+def _data_shape(document):
+    return {key: value for key, value in document.get('data', {}).items() if key != 'seconds'}
+
+
+def compare(baseline, current, threshold=0.10):
+    """Per-endpoint changes against a baseline; returns (report lines, regressions)"""
+    lines = [f"{'endpoint':<14}" + ''.join(f'{label:>24}' for label in ('req/s', 'p50 ms', 'p95 ms', 'p99 ms'))]
+    regressions = []
+
+    def cell(old, new):
+        change = (new - old) / old * 100 if old else 0.0
+        return f'{old:.1f} -> {new:.1f} ({change:+.0f}%)'.rjust(24)
+
+    for endpoint, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if old is None:
+            lines.append(f'{endpoint:<14}  (not in baseline)')
+            continue
+        lines.append(f'{endpoint:<14}' + ''.join(cell(old[key], new[key])
+                                                  for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')))
+        if old['p95_ms'] and new['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append(f"{endpoint}: p95 {old['p95_ms']:.1f} ms -> {new['p95_ms']:.1f} ms")
+        if old['throughput'] and new['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append(f"{endpoint}: throughput {old['throughput']:.1f} -> {new['throughput']:.1f} req/s")
+        if new['errors'] > old['errors']:
+            regressions.append(f"{endpoint}: errors {old['errors']} -> {new['errors']}")
+    if baseline.get('config') != current.get('config') or _data_shape(baseline) != _data_shape(current):
+        lines.append('note: baseline was recorded with a different configuration or data set')
+    return lines, regressions
@@ -0,0 +1,248 @@
+#bench/plans.py
+# Query-plan regression check: python -m bench plans [--update]
+#
+# Seeds a small synthetic data set, drives the auth, task, collab list,
+# member and sync code paths through the app, and EXPLAINs every distinct
+# statement they issue (shapes normalized as in querytrace). It fails when
+#   - a plan scans tasks, collab_lists or users (SCAN <table>, through an
+#     index or not, reads the whole table),
+#   - a plan differs from the one recorded in bench/query_plans.txt; each
+#     change is shown as a unified diff, or
+#   - a request raises QueryBudgetExceeded: the app runs with querytrace on
+#     in strict mode, so a view over its @query_budget or a likely N+1 fails
+# Run with --update to re-record after an intended plan change.
+
+import difflib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+
+from flask import got_request_exception, has_request_context, request
+
+import collab_lists
+import collab_members
+import db
+import querytrace
+import tasks
+from bench import seed
+
+PLANS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans.txt')
+HOT_TABLES = ('tasks', 'collab_lists', 'users')
+_SCAN = re.compile(r'\bSCAN (%s)\b(?!_)' % '|'.join(HOT_TABLES))
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+# Small enough to seed in seconds, big enough that boards span pages
+DATA_SET = dict(users=300, tasks=20000, lists=40, min_members=2, max_members=50, rounds=4)
+
+
+class PlanCapture:
+    """Statement observer recording the plan of every new statement shape"""
+
+    def __init__(self):
+        self.plans = {}
+        self.labels = {}
+        self.label = None
+        self.budget_failures = []
+
+    def request_failed(self, sender, exception, **extra):
+        """got_request_exception receiver: keep querytrace's strict-mode failures"""
+        if isinstance(exception, querytrace.QueryBudgetExceeded):
+            self.budget_failures.append(str(exception))
+
+    def __call__(self, cursor, sql, params, seconds):
+        if sql is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return
+        shape = querytrace.normalize(sql)
+        if has_request_context() and request.url_rule is not None:
+            label = f'{request.method} {request.url_rule.rule}'
+        else:
+            label = self.label
+        self.labels.setdefault(shape, set()).add(label)
+        if shape not in self.plans:
+            self.plans[shape] = explain(cursor, sql, params)
+
+
+def explain(cursor, sql, params):
+    """EXPLAIN QUERY PLAN as indented lines, run on the statement's own connection"""
+    plan = cursor.connection.cursor(sqlite3.Cursor)
+    plan.execute('EXPLAIN QUERY PLAN ' + sql, params if params is not None else ())
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in plan.fetchall():
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def _json(response):
+    return response.get_json(silent=True) or {}
+
+
+def exercise(client, capture, manifest):
+    """Call every route and data function whose statements are checked"""
+    password = manifest['password']
+
+    # auth
+    client.post('/auth/register', json={'username': 'planner', 'email': 'planner@bench.invalid',
+                                        'password': password, 'name': 'Planner'})
+    client.post('/auth/logout')
+    client.post('/auth/login', json={'username': 'user1', 'password': password})
+    client.get('/auth/profile')
+    client.post('/auth/profile', json={'username': 'user1', 'name': 'Renamed', 'current_password': password,
+                                       'new_password': password})
+    token = _json(client.post('/auth/forgot_password', json={'email': 'user1@bench.invalid'})).get('reset_token')
+    client.post(f'/auth/reset_password/{token}', json={'password': password})
+    client.post('/auth/login', json={'username': 'user1', 'password': password})
+
+    # personal board
+    client.get('/tasks')
+    client.get('/tasks?status=pending&priority=High')
+    client.get('/tasks?include_archived=true')
+    client.get('/tasks?archived_only=true')
+    page = _json(client.get('/tasks?limit=50'))
+    client.get(f"/tasks?limit=50&cursor={page.get('next_cursor')}")
+    client.get('/tasks?search=budget')
+    client.get('/tasks/search?q=budget')
+    client.get('/tasks/search?q=rev&archived_only=true')
+
+    task = _json(client.post('/tasks', json={'title': 'plan check', 'priority': 'High'})).get('task', {})
+    task_id = task.get('id')
+    client.get(f'/tasks/{task_id}')
+    client.put(f'/tasks/{task_id}', json={'title': 'plan check 2', 'due_date': '2026-12-01'})
+    client.put(f'/tasks/{task_id}/status', json={'status': 'completed'})
+    client.post(f'/tasks/{task_id}/archive')
+    client.post(f'/tasks/{task_id}/unarchive')
+    client.post('/tasks/batch', json={'operations': [
+        {'op': 'create', 'title': 'batch one'},
+        {'op': 'update', 'id': task_id, 'title': 'batch renamed'},
+        {'op': 'status', 'id': task_id, 'status': 'pending'},
+        {'op': 'archive', 'id': task_id},
+        {'op': 'delete', 'id': task_id},
+    ]})
+
+    # collaborative lists
+    client.get('/collab_lists')
+    list_id = _json(client.post('/collab_lists', json={'name': 'Plan list'})).get('list', {}).get('id')
+    client.put(f'/collab_lists/{list_id}', json={'name': 'Plan list 2'})
+    member = _json(client.post(f'/collab_lists/{list_id}/members', json={'username_or_email': 'user2'}))
+    client.get(f'/collab_lists/{list_id}')
+    list_task = _json(client.post('/tasks', json={'title': 'shared', 'collab_list_id': list_id})).get('task', {})
+    client.get(f'/tasks?collab_list_id={list_id}')
+    client.get(f'/collab_lists/{list_id}/tasks')
+    client.put(f"/tasks/{list_task.get('id')}/status", json={'status': 'in_progress'})
+    client.get('/sync')
+    sync_token = _json(client.get('/sync')).get('token')
+    client.delete(f"/collab_lists/{list_id}/members/{member.get('user', {}).get('id')}")
+    client.delete(f"/tasks/{list_task.get('id')}")
+    client.get(f'/sync?since={sync_token}')
+    client.delete(f'/collab_lists/{list_id}')
+
+    # Data functions no route reaches yet
+    direct = [
+        ('tasks.get_tasks_due', lambda: tasks.get_tasks_due(1, '2026-06-30')),
+        ('tasks.get_tasks_for_collab_list', lambda: tasks.get_tasks_for_collab_list(1)),
+        ('collab_lists.get_collab_list_by_id', lambda: collab_lists.get_collab_list_by_id(1)),
+        ('collab_lists.get_collab_lists_by_owner', lambda: collab_lists.get_collab_lists_by_owner(1)),
+        ('collab_lists.get_list_owner_id', lambda: collab_lists.get_list_owner_id(1)),
+        ('collab_members.get_list_members', lambda: collab_members.get_list_members(1)),
+        ('collab_members.is_member_in_list', lambda: collab_members.is_member_in_list(1, 1)),
+        ('collab_members.is_user_owner', lambda: collab_members.is_user_owner(1, 1)),
+        ('collab_members.count_collab_members', lambda: collab_members.count_collab_members(1)),
+        ('collab_members.get_collab_lists_for_user', lambda: collab_members.get_collab_lists_for_user(1)),
+    ]
+    for label, call in direct:
+        capture.label = label
+        call()
+    capture.label = None
+
+
+def capture_plans():
+    """Seed a scratch data set, run every code path and return the capture"""
+    data_dir = tempfile.mkdtemp(prefix='todo-plans-')
+    try:
+        manifest = seed.seed(data_dir, **DATA_SET)
+        # Before the app is created, so its init_app installs the tracer
+        querytrace.ENABLED = querytrace.STRICT = True
+        # Imported after seeding so the app opens the scratch databases
+        from app import app
+
+        capture = PlanCapture()
+        db.add_statement_observer(capture)
+        got_request_exception.connect(capture.request_failed, app)
+        try:
+            exercise(app.test_client(), capture, manifest)
+        finally:
+            got_request_exception.disconnect(capture.request_failed, app)
+            db.remove_statement_observer(capture)
+        return capture
+    finally:
+        db.close_all()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def scans(plan):
+    return [line.strip() for line in plan if _SCAN.search(line)]
+
+
+def format_plans(capture):
+    blocks = []
+    for shape in sorted(capture.plans):
+        labels = ', '.join(sorted(label for label in capture.labels[shape] if label))
+        blocks.append('\n'.join([f'== {shape}', f'-- {labels}'] + capture.plans[shape]))
+    return '# Recorded query plans (python -m bench plans --update)\n\n' + '\n\n'.join(blocks) + '\n'
+
+
+def parse_plans(text):
+    """shape -> plan lines from a recorded plans file"""
+    plans = {}
+    for block in text.split('\n\n'):
+        lines = block.split('\n')
+        if lines and lines[0].startswith('== '):
+            plans[lines[0][3:]] = [line for line in lines[2:] if line]
+    return plans
+
+
+def check(capture, recorded):
+    """Problems found, as printable strings"""
+    problems = [f'query budget exceeded: {failure}' for failure in capture.budget_failures]
+    for shape, plan in sorted(capture.plans.items()):
+        used_by = ', '.join(sorted(label for label in capture.labels[shape] if label))
+        found = scans(plan)
+        if found:
+            problems.append(f'full scan ({"; ".join(found)}) in {used_by}:\n  {shape}')
+        if shape not in recorded:
+            problems.append(f'new statement, not recorded (run with --update) in {used_by}:\n  {shape}')
+        elif recorded[shape] != plan:
+            diff = difflib.unified_diff(recorded[shape], plan, 'recorded', 'current', lineterm='')
+            problems.append(f'plan changed in {used_by}:\n  {shape}\n' + '\n'.join('  ' + line for line in diff))
+    return problems
+
+
+def main(update=False):
+    capture = capture_plans()
+    if update:
+        with open(PLANS_FILE, 'w') as f:
+            f.write(format_plans(capture))
+        print(f'recorded {len(capture.plans)} statement plans in {os.path.relpath(PLANS_FILE)}')
+        found = [shape for shape, plan in capture.plans.items() if scans(plan)]
+        for shape in found:
+            print(f'warning: full scan: {shape}')
+        for failure in capture.budget_failures:
+            print(f'FAIL query budget exceeded: {failure}')
+        return 1 if found or capture.budget_failures else 0
+
+    try:
+        with open(PLANS_FILE) as f:
+            recorded = parse_plans(f.read())
+    except FileNotFoundError:
+        recorded = {}
+    problems = check(capture, recorded)
+    gone = sorted(set(recorded) - set(capture.plans))
+    for shape in gone:
+        print(f'no longer issued (run with --update to forget): {shape}')
+    for problem in problems:
+        print(f'FAIL {problem}\n')
+    print(f'{len(capture.plans)} statements checked, {len(problems)} problem(s)')
+    return 1 if problems else 0
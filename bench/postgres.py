@@ -0,0 +1,241 @@
+#bench/postgres.py
+# PostgreSQL backend check: TODO_DATABASE_URL=postgresql://... python -m bench postgres
+#
+# Runs in a scratch schema (todo_check, dropped before and after), so the
+# rest of the database is left alone. It checks
+#   - smoke: the auth, task, batch, search, collab list, member, sync and
+#     ETag paths through the app's test client
+#   - unlocked writers: while one transaction holds a task write open,
+#     writers on other boards still commit, and a sync token taken meanwhile
+#     doesn't skip the held write once it commits
+#   - concurrent writers: --writers threads create and move tasks on a
+#     shared list and their own boards while a member syncs in a loop; every
+#     write must be stored, reach the syncing member and be announced on the
+#     list's event feed exactly once
+# It exits 1 on the first failure.
+
+import os
+import queue
+import threading
+import time
+
+SCHEMA = 'todo_check'
+PASSWORD = 'check-password'
+
+
+class CheckFailed(AssertionError):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def _admin(sql):
+    import db
+    import db_postgres
+
+    conn = db_postgres._connect(db.DATABASE_URL)
+    try:
+        conn.cursor().execute(sql)
+    finally:
+        conn.close()
+
+
+def _client(app, username):
+    client = app.test_client()
+    response = client.post('/auth/register', json={'username': username, 'email': f'{username}@check.invalid',
+                                                   'password': PASSWORD, 'name': username.title()})
+    expect(response.status_code == 200 and response.get_json()['success'], f'register {username}: {response.data!r}')
+    return client
+
+
+def _json(response, status=200):
+    expect(response.status_code == status,
+           f'{response.request.method} {response.request.path}: {response.status_code}, expected {status}')
+    return response.get_json()
+
+
+def smoke(app):
+    alice, bob, eve = (_client(app, name) for name in ('alice', 'bob', 'eve'))
+
+    task = _json(alice.post('/tasks', json={'title': 'Buy milk', 'description': 'whole'}), 201)['task']
+    expect(eve.get(f"/tasks/{task['id']}").status_code == 403, 'a stranger can read a task')
+    moved = _json(alice.put(f"/tasks/{task['id']}/status", json={'status': 'in_progress'}))['task']
+    expect(moved['status'] == 'in_progress', 'status change not stored')
+    expect(any(t['id'] == task['id'] for t in _json(alice.get('/tasks/search?q=mil'))['tasks']), 'search misses')
+
+    list_id = _json(alice.post('/collab_lists', json={'name': 'Team'}), 201)['list']['id']
+    _json(alice.post(f'/collab_lists/{list_id}/members', json={'username_or_email': 'bob'}))
+    shared = _json(bob.post('/tasks', json={'title': 'Shared', 'collab_list_id': list_id}), 201)['task']
+    expect(eve.put(f"/tasks/{shared['id']}/status", json={'status': 'completed'}).status_code == 403,
+           'a stranger can move a list task')
+    lists = _json(bob.get('/collab_lists'))['lists']
+    expect([(l['id'], l['member_count'], l['owner_name']) for l in lists] == [(list_id, 2, 'Alice')],
+           f'collab lists: {lists}')
+
+    ids = [_json(alice.post('/tasks', json={'title': f'page {i}'}), 201)['task']['id'] for i in range(5)]
+    seen, cursor = [], None
+    while True:
+        page = _json(alice.get('/tasks?limit=2' + (f'&cursor={cursor}' if cursor else '')))
+        seen += [t['id'] for t in page['tasks']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    expect(seen == [t['id'] for t in _json(alice.get('/tasks'))['tasks']], 'pages differ from the full board')
+
+    results = _json(alice.post('/tasks/batch', json={'operations': [
+        {'op': 'create', 'title': 'batched', 'collab_list_id': list_id},
+        {'op': 'status', 'id': ids[0], 'status': 'completed'},
+        {'op': 'delete', 'id': ids[1]},
+        {'op': 'delete', 'id': shared['id'] + 1000},
+    ]}))['results']
+    expect([r['success'] for r in results] == [True, True, True, False], f'batch: {results}')
+
+    token = _json(bob.get('/sync'))['token']
+    etag = bob.get('/collab_lists').headers['ETag']
+    expect(bob.get('/collab_lists', headers={'If-None-Match': etag}).status_code == 304, 'no 304 for /collab_lists')
+    _json(alice.put(f'/collab_lists/{list_id}', json={'name': 'Team 2'}))
+    expect(bob.get('/collab_lists', headers={'If-None-Match': etag}).status_code == 200, 'stale /collab_lists 304')
+    _json(alice.delete(f"/tasks/{shared['id']}"))
+    changes = _json(bob.get(f'/sync?since={token}'))
+    expect([l['id'] for l in changes['lists']] == [list_id], f"sync lists: {changes['lists']}")
+    expect([t['id'] for t in changes['deleted_tasks']] == [shared['id']], f"sync deletes: {changes['deleted_tasks']}")
+    _json(alice.delete(f'/collab_lists/{list_id}'))
+    changes = _json(bob.get(f"/sync?since={changes['token']}"))
+    expect(changes['removed_list_ids'] == [list_id], f"sync removals: {changes['removed_list_ids']}")
+
+
+def unlocked_writers(app):
+    import db
+
+    carol, dave = _client(app, 'carol'), _client(app, 'dave')
+    list_id = _json(carol.post('/collab_lists', json={'name': 'Held'}), 201)['list']['id']
+    _json(carol.post(f'/collab_lists/{list_id}/members', json={'username_or_email': 'dave'}))
+    token = _json(carol.get('/sync'))['token']
+    etag = carol.get('/tasks').headers['ETag']
+
+    held = db.get_connection('tasks')
+    try:
+        carol_id = held.execute("SELECT id FROM users WHERE username = 'carol'").fetchone()[0]
+        held_id = held.execute('INSERT INTO tasks (user_id, title) VALUES (?, ?) RETURNING id',
+                               (carol_id, 'held open')).fetchone()[0]
+        done = threading.Event()
+
+        def other_board():
+            _json(dave.post('/tasks', json={'title': 'meanwhile', 'collab_list_id': list_id}), 201)
+            done.set()
+
+        threading.Thread(target=other_board, daemon=True).start()
+        expect(done.wait(5), 'a write on another board waited for an open transaction')
+        changes = _json(carol.get(f'/sync?since={token}'))
+        expect([t['title'] for t in changes['tasks']] == ['meanwhile'], f"sync during the write: {changes['tasks']}")
+        token = changes['token']
+        held.commit()
+    finally:
+        held.close()
+    changes = _json(carol.get(f'/sync?since={token}'))
+    expect(held_id in [t['id'] for t in changes['tasks']], 'sync skipped a write that committed late')
+    expect(carol.get('/tasks', headers={'If-None-Match': etag}).status_code == 200, 'stale /tasks 304')
+
+
+def concurrent_writers(app, writers, tasks_each):
+    import events
+
+    owner = _client(app, 'owner')
+    list_id = _json(owner.post('/collab_lists', json={'name': 'Busy'}), 201)['list']['id']
+    clients = [_client(app, f'writer{n}') for n in range(writers)]
+    for n in range(writers):
+        _json(owner.post(f'/collab_lists/{list_id}/members', json={'username_or_email': f'writer{n}'}))
+    token = _json(owner.get('/sync'))['token']
+
+    events.POLL_INTERVAL = 0.05
+    hub = events.get_hub()
+    feed = hub.subscribe(list_id)
+    created, failures, synced = [], [], set()
+    stop = threading.Event()
+
+    def write(client, n):
+        try:
+            for i in range(tasks_each):
+                task = _json(client.post('/tasks', json={'title': f'w{n}-{i}', 'collab_list_id': list_id}), 201)['task']
+                _json(client.post('/tasks', json={'title': f'own {n}-{i}'}), 201)
+                _json(client.put(f"/tasks/{task['id']}/status", json={'status': 'in_progress'}))
+                created.append(task['id'])
+        except Exception as e:
+            failures.append(f'writer {n}: {e}')
+
+    def follow():
+        nonlocal token
+        try:
+            while not stop.is_set():
+                changes = _json(owner.get(f'/sync?since={token}'))
+                synced.update(t['id'] for t in changes['tasks'])
+                token = changes['token']
+        except Exception as e:
+            failures.append(f'sync: {e}')
+
+    threads = [threading.Thread(target=write, args=(client, n)) for n, client in enumerate(clients)]
+    syncer = threading.Thread(target=follow)
+    started = time.perf_counter()
+    syncer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    stop.set()
+    syncer.join()
+    synced.update(t['id'] for t in _json(owner.get(f'/sync?since={token}'))['tasks'])
+
+    expect(not failures, '; '.join(failures))
+    expect(len(created) == writers * tasks_each, f'{len(created)} of {writers * tasks_each} writes returned')
+    stored = {t['id'] for t in _json(owner.get(f'/collab_lists/{list_id}/tasks'))['tasks']}
+    expect(stored == set(created), f'{len(set(created) - stored)} list tasks missing')
+    expect(set(created) <= synced, f'sync missed {len(set(created) - synced)} tasks')
+
+    announced = {}
+    deadline = time.time() + 5
+    while sum(announced.values()) < len(created) * 2 and time.time() < deadline:
+        try:
+            event = feed.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if event.kind in ('task_created', 'task_moved'):
+            announced[(event.kind, event.task_id)] = announced.get((event.kind, event.task_id), 0) + 1
+    hub.unsubscribe(list_id, feed)
+    expect(all(count == 1 for count in announced.values()), 'an event was announced twice')
+    missing = [task_id for task_id in created
+               if ('task_created', task_id) not in announced or ('task_moved', task_id) not in announced]
+    expect(not missing, f'{len(missing)} tasks missing from the event feed')
+    return writers * tasks_each * 3 / seconds
+
+
+def main(writers=8, tasks_each=25):
+    import db
+
+    if db.BACKEND != 'postgres':
+        print('set TODO_DATABASE_URL to a PostgreSQL database to check')
+        return 1
+    # libpq reads PGOPTIONS on every connect: every connection, the app's
+    # pool included, works in the scratch schema
+    os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={SCHEMA}".strip()
+    os.environ.setdefault('TODO_BCRYPT_WORKERS', '0')
+    _admin(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}')
+    try:
+        from app import app
+
+        app.testing = True
+        for label, check in (('smoke', smoke), ('unlocked writers', unlocked_writers)):
+            check(app)
+            print(f'{label}: ok')
+        rate = concurrent_writers(app, writers, tasks_each)
+        print(f'concurrent writers: ok ({writers} writers, {rate:.0f} writes/s)')
+    except CheckFailed as e:
+        print(f'FAIL {e}')
+        return 1
+    finally:
+        db.close_all()
+        _admin(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    return 0
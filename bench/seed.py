@@ -0,0 +1,222 @@
+#bench/seed.py
+# Synthetic data for benchmarks, written straight into a data directory.
+#
+# The schema comes from the real migrations. Rows are bulk-inserted with
+# the triggers dropped (FTS, seq stamping, board versions, event feeds)
+# and the derived data is rebuilt once at the end, which is orders of
+# magnitude faster than going through the triggers row by row.
+#
+# Shapes, all reproducible from --seed:
+#   - users are user<id> / user<id>@bench.invalid, all with PASSWORD
+#   - list i is owned by user ((i - 1) % users) + 1, so the lowest user ids
+#     own lists; member counts are log-uniform in [min_members, max_members]
+#   - personal tasks are skewed towards low user ids (a few heavy boards,
+#     a long tail of small ones); list tasks are spread evenly
+
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+
+import db
+import migrations
+import passwords
+
+PASSWORD = 'bench-password'
+MANIFEST = 'bench.json'
+CHUNK = 50000
+
+WORDS = ('report', 'invoice', 'meeting', 'design', 'review', 'deploy', 'budget', 'release', 'backup',
+         'customer', 'roadmap', 'hiring', 'migration', 'security', 'audit', 'launch', 'website', 'mobile',
+         'onboarding', 'newsletter', 'feedback', 'sprint', 'retro', 'contract', 'payroll', 'inventory',
+         'marketing', 'analytics', 'dashboard', 'support', 'training', 'workshop', 'vendor', 'renewal')
+STATUSES = ('pending', 'in_progress', 'completed')
+PRIORITIES = ('Low', 'Medium', 'High')
+
+
+def _log(message):
+    print(f'[seed] {message}', flush=True)
+
+
+def _connect(name):
+    conn = sqlite3.connect(db.db_path(name), isolation_level=None)
+    conn.execute('PRAGMA synchronous = OFF')
+    return conn
+
+
+def _drop_triggers(conn):
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    return [sql for _, sql in triggers]
+
+
+def _restore_triggers(conn, triggers):
+    for sql in triggers:
+        conn.execute(sql)
+
+
+def _insert(conn, sql, rows):
+    """executemany in CHUNK-sized transactions; returns the row count"""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK:
+            conn.execute('BEGIN')
+            conn.executemany(sql, batch)
+            conn.execute('COMMIT')
+            total += len(batch)
+            batch = []
+    if batch:
+        conn.execute('BEGIN')
+        conn.executemany(sql, batch)
+        conn.execute('COMMIT')
+        total += len(batch)
+    return total
+
+
+def _member_count(rng, low, high):
+    return int(math.exp(rng.uniform(math.log(low), math.log(high + 1)))) if high > low else low
+
+
+def _title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def seed_users(users, password_hash):
+    conn = _connect('users')
+    triggers = _drop_triggers(conn)
+    count = _insert(conn, 'INSERT INTO users (id, username, email, password_hash, name) VALUES (?, ?, ?, ?, ?)',
+                    ((i, f'user{i}', f'user{i}@bench.invalid', password_hash, f'Bench User {i}')
+                     for i in range(1, users + 1)))
+    _restore_triggers(conn, triggers)
+    conn.close()
+    return count
+
+
+def seed_lists(rng, users, lists, min_members, max_members):
+    """Lists and memberships; returns the member count of every list"""
+    conn = _connect('collab_lists')
+    triggers = _drop_triggers(conn)
+    owners = [((i - 1) % users) + 1 for i in range(1, lists + 1)]
+    _insert(conn, 'INSERT INTO collab_lists (id, name, owner_id, seq) VALUES (?, ?, ?, ?)',
+            ((i, f'{_title(rng)} list', owners[i - 1], i) for i in range(1, lists + 1)))
+
+    sizes = []
+
+    def members():
+        seq = lists
+        for list_id, owner in enumerate(owners, start=1):
+            size = min(users, _member_count(rng, min_members, max_members))
+            sizes.append(size)
+            others = set()
+            while len(others) < size - 1:
+                candidate = rng.randint(1, users)
+                if candidate != owner:
+                    others.add(candidate)
+            seq += 1
+            yield list_id, owner, 'owner', seq
+            for user_id in sorted(others):
+                seq += 1
+                yield list_id, user_id, 'member', seq
+
+    count = _insert(conn, 'INSERT INTO list_members (list_id, user_id, role, seq) VALUES (?, ?, ?, ?)', members())
+    conn.execute('UPDATE list_seq SET value = ?', (lists + count,))
+    _restore_triggers(conn, triggers)
+    conn.close()
+    return sizes, count
+
+
+def seed_tasks(rng, users, lists, tasks, list_share):
+    conn = _connect('tasks')
+    triggers = _drop_triggers(conn)
+    owners = [((i - 1) % users) + 1 for i in range(1, lists + 1)]
+
+    def rows():
+        for task_id in range(1, tasks + 1):
+            if lists and rng.random() < list_share:
+                list_id = rng.randint(1, lists)
+                user_id = owners[list_id - 1]
+            else:
+                list_id = None
+                # Squaring a uniform draw piles tasks onto the low user ids
+                user_id = int(users * rng.random() ** 2) + 1
+            due = f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}' if rng.random() < 0.4 else None
+            yield (task_id, user_id, _title(rng), f'{_title(rng)} notes', rng.choice(PRIORITIES),
+                   rng.choice(STATUSES), due, list_id, int(rng.random() < 0.05), task_id)
+
+    count = _insert(conn, '''
+        INSERT INTO tasks (id, user_id, title, description, priority, status, due_date, collab_list_id, archived, seq)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows())
+    _log('rebuilding search index and board versions')
+    conn.execute('UPDATE task_seq SET value = ?', (tasks,))
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+    conn.execute('''
+        INSERT OR REPLACE INTO board_versions (board, version)
+        SELECT CASE WHEN collab_list_id IS NULL THEN 'u' || user_id ELSE 'l' || collab_list_id END, MAX(seq)
+        FROM tasks
+        GROUP BY collab_list_id IS NULL, CASE WHEN collab_list_id IS NULL THEN user_id ELSE collab_list_id END
+    ''')
+    _restore_triggers(conn, triggers)
+    conn.close()
+    return count
+
+
+def seed(data_dir, users=1000, tasks=50000, lists=100, min_members=2, max_members=500,
+         list_share=0.3, random_seed=1, rounds=None, force=False):
+    """Create a fresh data directory of synthetic data; returns the manifest"""
+    os.makedirs(data_dir, exist_ok=True)
+    db.close_all()
+    db.DATA_DIR = data_dir
+    existing = [path for path in db.database_files(data_dir) if os.path.exists(path)]
+    if existing and not force:
+        raise SystemExit(f'{data_dir} already has databases; pass --force to replace them')
+    for path in existing:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    # Forget the replaced files' layout; a fresh data set gets the default one
+    db.close_all()
+
+    lists = min(lists, users)
+    min_members = max(1, min_members)
+    max_members = max(min_members, max_members)
+    rng = random.Random(random_seed)
+    started = time.perf_counter()
+    for name in ('users', 'tasks', 'collab_lists'):
+        migrations.migrate(name)
+    db.close_all()
+
+    # Every user shares one hash; the server is run at the same cost so logins never rehash
+    rounds = rounds or passwords.ROUNDS
+    password_hash = passwords.hash_password(PASSWORD, rounds)
+
+    _log(f'{users} users')
+    seed_users(users, password_hash)
+    _log(f'{lists} lists')
+    sizes, memberships = seed_lists(rng, users, lists, min_members, max_members)
+    _log(f'{tasks} tasks')
+    seed_tasks(rng, users, lists, tasks, list_share)
+
+    manifest = {
+        'users': users, 'tasks': tasks, 'lists': lists, 'memberships': memberships,
+        'min_members': min_members, 'max_members': max_members, 'largest_list': max(sizes, default=0),
+        'list_share': list_share, 'seed': random_seed, 'password': PASSWORD, 'bcrypt_rounds': rounds,
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+    with open(os.path.join(data_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    _log(f"done in {manifest['seconds']} s")
+    return manifest
+
+
+def load_manifest(data_dir):
+    try:
+        with open(os.path.join(data_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f'{data_dir} has not been seeded; run python -m bench seed first')
@@ -0,0 +1,20 @@
+#bench/server.py
+# python -m bench.server <port>: the app on werkzeug's threaded WSGI server,
+# without per-request logging. TODO_DATA_DIR picks the data set.
+
+import logging
+import sys
+
+from werkzeug.serving import make_server
+
+from app import app
+
+
+def main(port):
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]))
@@ -1,51 +1,26 @@
 #collab_lists.py
 
-import sqlite3
-import os
 import json
 
-def initialize_db():
-    # Check if database file exists and is corrupted, delete if so
-    db_file = 'collab_lists.db'
-    if os.path.exists(db_file):
-        try:
-            # Try to open and verify the database
-            test_conn = sqlite3.connect(db_file)
-            test_conn.execute('SELECT 1')
-            test_conn.close()
-        except (sqlite3.DatabaseError, sqlite3.Error):
-            # Database is corrupted, delete it
-            os.remove(db_file)
-    
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
+import db
+import migrations
+import shards
 
-    # Create collab_lists table with members as JSON array
-    c.execute('''
-            CREATE TABLE IF NOT EXISTS collab_lists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                members TEXT DEFAULT '[]',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-    ''')
-    conn.commit()
-    conn.close()
+def initialize_db():
+    # Schema (including list_members) lives in migrations/collab_lists
+    migrations.ensure_current('collab_lists')
 
 def get_db_connection():
-    conn = sqlite3.connect('collab_lists.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_connection('collab_lists')
 
 def create_collab_list(owner_id, name):
     conn = get_db_connection()
     c = conn.cursor()
     
-    # Create empty members array with owner_id as first member
-    initial_members = json.dumps([owner_id])
-    c.execute('INSERT INTO collab_lists (name, members) VALUES (?, ?)', (name, initial_members))
-    list_id = c.lastrowid
+    # Owner is stored on the list and as the first row in list_members
+    c.execute('INSERT INTO collab_lists (name, owner_id) VALUES (?, ?) RETURNING id', (name, owner_id))
+    list_id = c.fetchone()[0]
+    c.execute("INSERT INTO list_members (list_id, user_id, role) VALUES (?, ?, 'owner')", (list_id, owner_id))
     conn.commit()
     
     c.execute('SELECT * FROM collab_lists WHERE id = ?', (list_id,))
@@ -62,43 +37,171 @@ def get_collab_list_by_id(list_id):
     conn.close()
     return collab_list
 
-def get_collab_lists_by_owner(owner_id):
+def get_collab_list_for_user(list_id, user_id):
+    """Fetch a list with the user's role on it (None if not a member) in one query"""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute('SELECT * FROM collab_lists ORDER BY created_at DESC')
-    all_lists = c.fetchall()
+    c.execute('''
+        SELECT collab_lists.*, list_members.role
+        FROM collab_lists
+        LEFT JOIN list_members
+            ON list_members.list_id = collab_lists.id AND list_members.user_id = ?
+        WHERE collab_lists.id = ?
+    ''', (user_id, list_id))
+    collab_list = c.fetchone()
     conn.close()
+    return collab_list
 
-    # Filter lists where the requester is the owner (first member in members array)
-    owned_lists = []
-    for collab_list in all_lists:
-        members = json.loads(collab_list['members']) if collab_list['members'] else []
-        if members and members[0] == owner_id:
-            owned_lists.append(collab_list)
+def get_collab_list_summaries(user_id):
+    """Every list the user owns or belongs to, with owner name, member count
+    and open task counts by status, from a single query.
 
+    users and tasks live in attached databases. Owned lists come first,
+    then alphabetical. With sharded tasks the counts come from one query per
+    shard holding any of the lists.
+    """
+    sharded = shards.enabled()
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT collab_lists.id, collab_lists.name, collab_lists.owner_id, collab_lists.created_at,
+               list_members.role,
+               users.name AS owner_name,
+               (SELECT COUNT(*) FROM list_members AS all_members
+                WHERE all_members.list_id = collab_lists.id) AS member_count{'' if sharded else _TASK_COUNTS}
+        FROM list_members
+        JOIN collab_lists ON collab_lists.id = list_members.list_id
+        LEFT JOIN users ON users.id = collab_lists.owner_id
+        WHERE list_members.user_id = ?
+        ORDER BY list_members.role = 'owner' DESC, lower(collab_lists.name)
+    ''', (user_id,))
+    summaries = c.fetchall()
+    conn.close()
+    if sharded:
+        counts = _sharded_task_counts([row['id'] for row in summaries])
+        summaries = [dict(row, **counts.get(row['id'], _NO_TASKS)) for row in summaries]
+    return summaries
+
+# Open task counts by status, when the tasks are reachable from the lists' connection
+_TASK_COUNTS = ''',
+               (SELECT COUNT(*) FROM tasks
+                WHERE tasks.collab_list_id = collab_lists.id AND tasks.archived = 0
+                  AND tasks.status = 'pending') AS pending_count,
+               (SELECT COUNT(*) FROM tasks
+                WHERE tasks.collab_list_id = collab_lists.id AND tasks.archived = 0
+                  AND tasks.status = 'in_progress') AS in_progress_count,
+               (SELECT COUNT(*) FROM tasks
+                WHERE tasks.collab_list_id = collab_lists.id AND tasks.archived = 0
+                  AND tasks.status = 'completed') AS completed_count'''
+_NO_TASKS = {'pending_count': 0, 'in_progress_count': 0, 'completed_count': 0}
+
+def _sharded_task_counts(list_ids):
+    """{list id: open task counts by status} from every shard holding one of the lists"""
+    counts = {}
+    for name, ids in shards.list_databases(list_ids).items():
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute('''
+            SELECT collab_list_id, status, COUNT(*) AS count FROM tasks
+            WHERE collab_list_id IN (SELECT value FROM json_each(?)) AND archived = 0
+            GROUP BY collab_list_id, status
+        ''', (json.dumps(ids),))
+        for row in c.fetchall():
+            key = f"{row['status']}_count"
+            if key in _NO_TASKS:
+                counts.setdefault(row['collab_list_id'], dict(_NO_TASKS))[key] = row['count']
+        conn.close()
+    return counts
+
+def get_collab_lists_version(user_id):
+    """Version token for the user's /collab_lists response.
+
+    Combines the collab_lists change counter, the user name counter (owner
+    names are part of the response) and the newest task change on any of
+    the user's lists (so are task counts).
+    """
+    if shards.enabled():
+        return _sharded_collab_lists_version(user_id)
+    if db.BACKEND == 'postgres':
+        return _postgres_collab_lists_version(user_id)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT (SELECT value FROM list_seq) AS list_version,
+               (SELECT value FROM user_seq) AS user_version,
+               (SELECT MAX(version) FROM board_versions
+                WHERE board IN (SELECT 'l' || list_id FROM list_members WHERE user_id = ?)) AS task_version
+    ''', (user_id,))
+    result = c.fetchone()
+    conn.close()
+    return f"{result['list_version']}.{result['user_version']}.{result['task_version'] or 0}"
+
+def _postgres_collab_lists_version(user_id):
+    # Postgres stamps aren't handed out in commit order (see
+    # migrations/postgres/users/0004), so neither the list_seq watermark nor
+    # a MAX() is sure to move when a change commits. Digest the stamps of the
+    # user's lists, their members and their boards instead: every change
+    # writes a stamp no other transaction shares, or removes a row.
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT (SELECT md5(string_agg(collab_lists.id || ':' || collab_lists.seq || ':'
+                                      || members.user_id || ':' || members.seq, ','
+                                      ORDER BY collab_lists.id, members.user_id))
+                FROM list_members AS mine
+                JOIN collab_lists ON collab_lists.id = mine.list_id
+                JOIN list_members AS members ON members.list_id = mine.list_id
+                WHERE mine.user_id = ?) AS list_version,
+               (SELECT value FROM user_seq) AS user_version,
+               (SELECT md5(string_agg(board || ':' || version, ',' ORDER BY board)) FROM board_versions
+                WHERE board IN (SELECT 'l' || list_id FROM list_members WHERE user_id = ?)) AS task_version
+    ''', (user_id, user_id))
+    result = c.fetchone()
+    conn.close()
+    return f"{result['list_version'] or 0}.{result['user_version']}.{result['task_version'] or 0}"
+
+def _sharded_collab_lists_version(user_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT (SELECT value FROM list_seq), (SELECT value FROM user_seq)')
+    list_version, user_version = c.fetchone()
+    c.execute('SELECT list_id FROM list_members WHERE user_id = ?', (user_id,))
+    list_ids = [row['list_id'] for row in c.fetchall()]
+    conn.close()
+    # Each shard has its own counter, so every one holding a list is part of the version
+    versions = []
+    for name, ids in sorted(shards.list_databases(list_ids).items()):
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute("SELECT MAX(version) FROM board_versions WHERE board IN (SELECT 'l' || value FROM json_each(?))",
+                  (json.dumps(ids),))
+        versions.append(f'{name}:{c.fetchone()[0] or 0}')
+        conn.close()
+    return f"{list_version}.{user_version}.{','.join(versions)}"
+
+def get_collab_lists_by_owner(owner_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM collab_lists WHERE owner_id = ? ORDER BY created_at DESC', (owner_id,))
+    owned_lists = c.fetchall()
+    conn.close()
     return owned_lists
 
 def get_list_owner_id(list_id):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute('SELECT members FROM collab_lists WHERE id = ?', (list_id,))
+    c.execute('SELECT owner_id FROM collab_lists WHERE id = ?', (list_id,))
     result = c.fetchone()
     conn.close()
-    
-    if result:
-        members = json.loads(result['members']) if result['members'] else []
-        return members[0] if members else None
-    return None
+    return result['owner_id'] if result else None
 
 def edit_collab_list(list_id, new_name, owner_id):
-    owner = get_list_owner_id(list_id)
-    if owner != owner_id:
-        return False
-
     conn = get_db_connection()
     c = conn.cursor()
 
-    c.execute("UPDATE collab_lists SET name = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (new_name, list_id))
+    # Only the owner may rename; the check is part of the UPDATE
+    c.execute("UPDATE collab_lists SET name = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND owner_id = ?",
+              (new_name, list_id, owner_id))
     updated = c.rowcount > 0
 
     conn.commit()
@@ -107,26 +210,38 @@ def edit_collab_list(list_id, new_name, owner_id):
     return updated
 
 def delete_collab_list(list_id, owner_id):
-    owner = get_list_owner_id(list_id)
-    if owner != owner_id:
-        return False
-
-    # Delete tasks for this list (safe try)
-    try:
-        tasks_conn = sqlite3.connect("tasks.db")
-        tc = tasks_conn.cursor()
-        tc.execute("DELETE FROM tasks WHERE collab_list_id = ?", (list_id,))
-        tasks_conn.commit()
-        tasks_conn.close()
-    except Exception as e:
-        print(f"[WARNING] Failed to delete tasks for list {list_id}: {e}")
-
-    # Delete list itself
+    """Delete a list with its tasks and memberships in one transaction.
+
+    Only the owner may delete. tasks is reachable from this connection (the
+    same file in the single layout, attached in the split layout), so either
+    everything goes or nothing does. Sharded, the tasks are in their shard's
+    file and are deleted right after the list: without it nobody can reach
+    them anyway.
+    """
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("DELETE FROM collab_lists WHERE id = ?", (list_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
-
-    return deleted
\ No newline at end of file
+    try:
+        # Lock first so the ownership check still holds when we delete
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT 1 FROM collab_lists WHERE id = ? AND owner_id = ?', (list_id, owner_id))
+        if c.fetchone() is None:
+            conn.rollback()
+            return False
+        if not shards.enabled():
+            c.execute("DELETE FROM tasks WHERE collab_list_id = ?", (list_id,))
+        c.execute("DELETE FROM list_members WHERE list_id = ?", (list_id,))
+        c.execute("DELETE FROM collab_lists WHERE id = ?", (list_id,))
+        deleted = c.rowcount > 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if deleted and shards.enabled():
+        conn = db.get_connection(shards.database_for(collab_list_id=list_id))
+        conn.execute("DELETE FROM tasks WHERE collab_list_id = ?", (list_id,))
+        conn.commit()
+        conn.close()
+    return deleted
@@ -1,86 +1,116 @@
 #collab_members.py
 
-import sqlite3
-import json
-import os
+import db
 
 def initialize_db():
+    # list_members is created and migrated with the collab_lists schema
     pass
 
 def get_db_connection():
-    conn = sqlite3.connect('collab_lists.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_connection('collab_lists')
 
-def add_member_to_list(list_id, user_id):
-    """Add a member to collab list's members array"""
+def add_member_to_list(list_id, user_id, role='member'):
+    """Add a member to a collab list. Returns False if the list is missing or user is already a member"""
     conn = get_db_connection()
     c = conn.cursor()
-    
-    c.execute('SELECT members FROM collab_lists WHERE id = ?', (list_id,))
-    result = c.fetchone()
-    
-    if result:
-        members = json.loads(result['members']) if result['members'] else []
-        if user_id not in members:
-            members.append(user_id)
-        
-        c.execute('UPDATE collab_lists SET members = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                  (json.dumps(members), list_id))
-        conn.commit()
-    
+    c.execute('''
+        INSERT OR IGNORE INTO list_members (list_id, user_id, role)
+        SELECT id, ?, ? FROM collab_lists WHERE id = ?
+    ''', (user_id, role, list_id))
+    added = c.rowcount > 0
+    conn.commit()
     conn.close()
-    return result is not None
+    return added
 
 def remove_member_from_list(list_id, user_id):
-    """Remove a member from collab list's members array"""
+    """Remove a member from a collab list (the owner row is never removed)"""
     conn = get_db_connection()
     c = conn.cursor()
-    
-    c.execute('SELECT members FROM collab_lists WHERE id = ?', (list_id,))
-    result = c.fetchone()
-    
-    if result:
-        members = json.loads(result['members']) if result['members'] else []
-        members = [m for m in members if m != user_id]
-        
-        c.execute('UPDATE collab_lists SET members = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                  (json.dumps(members), list_id))
-        conn.commit()
-    
+    c.execute("DELETE FROM list_members WHERE list_id = ? AND user_id = ? AND role != 'owner'", (list_id, user_id))
+    removed = c.rowcount > 0
+    conn.commit()
     conn.close()
-    return result is not None
+    return removed
 
 def get_list_members(list_id):
-    """Get all members from a collab list"""
+    """Get all member IDs of a collab list, owner first"""
     conn = get_db_connection()
     c = conn.cursor()
-    
-    c.execute('SELECT members FROM collab_lists WHERE id = ?', (list_id,))
-    result = c.fetchone()
+    c.execute('''
+        SELECT user_id FROM list_members
+        WHERE list_id = ?
+        ORDER BY role = 'owner' DESC, added_at, user_id
+    ''', (list_id,))
+    members = [row['user_id'] for row in c.fetchall()]
+    conn.close()
+    return members
+
+def get_list_member_details(list_id):
+    """Members of a list with their user details, owner first then by name, in one query (users is attached)"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT users.id, users.username, users.name, users.email, list_members.role
+        FROM list_members
+        JOIN users ON users.id = list_members.user_id
+        WHERE list_members.list_id = ?
+        ORDER BY list_members.role = 'owner' DESC, lower(users.name)
+    ''', (list_id,))
+    members = c.fetchall()
     conn.close()
-    
-    return json.loads(result['members']) if result and result['members'] else []
+    return members
 
 def is_member_in_list(list_id, user_id):
     """Check if user is a member of the list"""
-    members = get_list_members(list_id)
-    return user_id in members
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM list_members WHERE list_id = ? AND user_id = ?', (list_id, user_id))
+    result = c.fetchone()
+    conn.close()
+    return result is not None
 
 def is_user_owner(list_id, user_id):
-    """Check if user is the owner of a list (first member is owner)"""
-    members = get_list_members(list_id)
-    return len(members) > 0 and members[0] == user_id
+    """Check if user is the owner of a list"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM collab_lists WHERE id = ? AND owner_id = ?', (list_id, user_id))
+    result = c.fetchone()
+    conn.close()
+    return result is not None
+
+def get_list_access(list_id, user_id):
+    """Resolve a list and the user's role on it in one query.
+
+    Returns (list_exists, role) where role is 'owner', 'member' or None.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT collab_lists.id, list_members.role
+        FROM collab_lists
+        LEFT JOIN list_members
+            ON list_members.list_id = collab_lists.id AND list_members.user_id = ?
+        WHERE collab_lists.id = ?
+    ''', (user_id, list_id))
+    result = c.fetchone()
+    conn.close()
+    if not result:
+        return False, None
+    return True, result['role']
 
 def count_collab_members(list_id):
     """Count total members in a list"""
-    members = get_list_members(list_id)
-    return len(members)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*) FROM list_members WHERE list_id = ?', (list_id,))
+    count = c.fetchone()[0]
+    conn.close()
+    return count
 
 # Legacy function names for backward compatibility
 def add_collab_member(collab_list_id, user_id, role='member'):
-    """Legacy function - adds member to list (role parameter ignored with JSON storage)"""
-    return add_member_to_list(collab_list_id, user_id)
+    """Legacy function - adds member to list"""
+    return add_member_to_list(collab_list_id, user_id, role=role)
 
 def get_collab_members(collab_list_id):
     """Legacy function - returns member IDs as list"""
@@ -90,16 +120,9 @@ def get_collab_lists_for_user(user_id):
     """Get all collaborative lists that a user is a member of"""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute('SELECT id, members FROM collab_lists')
-    all_lists = c.fetchall()
+    c.execute('SELECT list_id FROM list_members WHERE user_id = ?', (user_id,))
+    user_lists = [row['list_id'] for row in c.fetchall()]
     conn.close()
-    
-    user_lists = []
-    for row in all_lists:
-        members = json.loads(row['members']) if row['members'] else []
-        if user_id in members:
-            user_lists.append(row['id'])
-    
     return user_lists
 
 def remove_collab_member(collab_list_id, user_id):
@@ -108,4 +131,4 @@ def remove_collab_member(collab_list_id, user_id):
 
 def is_user_member(collab_list_id, user_id):
     """Check if user is a member of the list"""
-    return is_member_in_list(collab_list_id, user_id)
\ No newline at end of file
+    return is_member_in_list(collab_list_id, user_id)
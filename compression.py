@@ -0,0 +1,205 @@
+#compression.py
+# gzip/brotli response compression and precompressed static files.
+#
+# Dynamic responses above MIN_SIZE are compressed per request; big or
+# streamed bodies are compressed chunk by chunk so the first bytes go out
+# before the whole body is encoded. Static files are served from .br/.gz
+# siblings written ahead of time by `python compression.py`, so they cost no
+# CPU per request. brotli is optional; without it everything falls back to gzip.
+#
+# Strong ETags get an encoding suffix ("abc" -> "abc-gzip") because the
+# compressed bytes are a different representation; http_cache accepts both.
+
+import gzip
+import mimetypes
+import os
+import sys
+import zlib
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.environ.get('TODO_COMPRESS_MIN_SIZE', 1024))
+STREAM_MIN_SIZE = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Precompressed files are built once, so spend the CPU there
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/vnd.todo.compact+json',
+    'application/msgpack',
+    'application/javascript',
+    'image/svg+xml',
+)
+STATIC_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.map')
+
+
+def _compressible(mimetype):
+    if mimetype == 'text/event-stream':
+        # Each event must reach the client as soon as it is written
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def accepted_encoding():
+    """'br', 'gzip' or None, from the request's Accept-Encoding"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress = self._compressor.process
+            self.finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.finish = self._compressor.flush
+
+
+def _encode_stream(chunks, encoding):
+    encoder = _Encoder(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def _slices(data):
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+def compress_response(response):
+    """after_request hook: compress the body if the client and content allow it"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not _compressible(response.mimetype or '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        body = response.response
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        if len(data) < STREAM_MIN_SIZE:
+            encoder = _Encoder(encoding)
+            response.set_data(encoder.compress(data) + encoder.finish())
+            body = None
+        else:
+            body = _slices(data)
+
+    if body is not None:
+        response.response = _encode_stream(body, encoding)
+        response.headers.pop('Content-Length', None)
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{'gzip' if encoding == 'gzip' else 'br'}")
+    return response
+
+
+def _is_current(sibling, source):
+    """A precompressed file is only used while it is at least as new as its source"""
+    try:
+        return os.path.getmtime(sibling) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def serve_static(filename):
+    """Static view that prefers a precompressed .br/.gz sibling"""
+    static_folder = current_app.static_folder
+    encoding = accepted_encoding()
+    if encoding and filename.endswith(STATIC_EXTENSIONS):
+        sibling = f"{filename}.{'br' if encoding == 'br' else 'gz'}"
+        if _is_current(os.path.join(static_folder, sibling), os.path.join(static_folder, filename)):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, sibling, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+    response = send_from_directory(static_folder, filename)
+    if filename.endswith(STATIC_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
+    app.view_functions['static'] = serve_static
+
+
+def precompress_static(static_folder):
+    """Write .gz (and .br when brotli is installed) next to every text asset.
+
+    Files are rewritten only when the source is newer than the sibling.
+    Returns the list of files written.
+    """
+    written = []
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            targets = [('.gz', _gzip)]
+            if brotli is not None:
+                targets.append(('.br', _brotli))
+            for suffix, compress in targets:
+                target = path + suffix
+                if _is_current(target, path):
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compress(data))
+                written.append(target)
+    return written
+
+
+def _gzip(data):
+    # mtime=0 keeps the output byte-for-byte reproducible between builds
+    return gzip.compress(data, compresslevel=STATIC_GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=STATIC_BROTLI_QUALITY)
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    written = precompress_static(folder)
+    for path in written:
+        print(f'wrote {path} ({os.path.getsize(path)} bytes)')
+    if brotli is None:
+        print('brotli is not installed: wrote .gz files only')
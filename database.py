@@ -1,26 +1,9 @@
-import sqlite3
+import db
+import migrations
 
 def initialize_db():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-
-    # Create users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            name TEXT NOT NULL,
-            reset_token TEXT,
-            reset_token_expires DATETIME,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # Schema lives in migrations/users; this applies whatever is pending
+    migrations.ensure_current('users')
 
 def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_connection('users')
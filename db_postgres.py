@@ -0,0 +1,457 @@
+#db_postgres.py
+# PostgreSQL backend for db.py, selected by TODO_DATABASE_URL.
+#
+# The data modules keep one SQL dialect - SQLite's - and the sqlite3
+# connection interface (execute/fetch*/commit/rollback/close). This module
+# hands out connections with that interface over psycopg2:
+#   - a pool per worker process, shared by its threads; close() returns the
+#     connection to it
+#   - each statement is translated once (? and :name placeholders,
+#     INSERT OR IGNORE, json_each, main. qualifiers, BEGIN modes) and cached
+#   - reads and writes run as server-side prepared statements, one PREPARE
+#     per connection and statement shape, so repeated statements skip parsing
+#     and planning
+#   - transactions follow sqlite3: autocommit until the first INSERT, UPDATE
+#     or DELETE (or an explicit BEGIN), then open until commit()/rollback()
+#   - copy_rows() streams bulk loads through COPY. Only the SQLite import
+#     (migrations/to_postgres.py) uses it: the app's batch creates need the
+#     ids INSERT ... RETURNING hands back, which COPY can't return
+# SQL functions the dialect relies on (datetime()) are created by the
+# PostgreSQL migrations in migrations/postgres/.
+
+import collections
+import collections.abc
+import functools
+import os
+import re
+import threading
+import time
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+
+import db
+
+# Connections per worker process; threads wait for one when all are busy
+POOL_SIZE = int(os.environ.get('TODO_PG_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('TODO_PG_POOL_TIMEOUT', 30))
+# TODO_PG_PREPARE=0 sends plain statements instead, for transaction-pooling
+# proxies (PgBouncer) that can't keep prepared statements per connection
+PREPARE = os.environ.get('TODO_PG_PREPARE', '1') != '0'
+# Prepared statements kept per connection (least recently used are deallocated)
+MAX_PREPARED = db.STATEMENT_CACHE_SIZE
+
+_DML = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+_PREPARABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+# Whole statements with a different meaning in PostgreSQL. sqlite3's BEGIN
+# IMMEDIATE takes the write lock up front; here writers only lock the rows
+# they touch. A deferred BEGIN is used for consistent multi-statement reads,
+# which needs a snapshot for the whole transaction.
+_STATEMENTS = {
+    'BEGIN': 'BEGIN ISOLATION LEVEL REPEATABLE READ',
+    'BEGIN DEFERRED': 'BEGIN ISOLATION LEVEL REPEATABLE READ',
+    'BEGIN IMMEDIATE': 'BEGIN',
+    'BEGIN EXCLUSIVE': 'BEGIN',
+}
+
+_REWRITES = (
+    (re.compile(r'\bjson_each\(([^()]*)\)'), r'json_array_elements_text(\1)'),
+    (re.compile(r'\bSELECT value FROM json_array_elements_text'), 'SELECT value::bigint FROM json_array_elements_text'),
+    (re.compile(r'\bmain\.(?=\w)'), ''),
+)
+_INSERT_OR_IGNORE = re.compile(r'^(\s*)INSERT OR IGNORE INTO\b(.*?)[\s;]*$', re.S | re.I)
+_CURRENT_TIMESTAMP = re.compile(r'\bCURRENT_TIMESTAMP\b')
+# String literals and $$ bodies are copied as they are; the rest is scanned
+# for ? and :name placeholders (not :: casts)
+_TOKENS = re.compile(r"'(?:[^']|'')*'|\$\$.*?\$\$|(?<![:\w]):([A-Za-z_]\w*)|\?", re.S)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection became free within TODO_PG_POOL_TIMEOUT seconds"""
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    """SQLite-dialect statement -> (PostgreSQL statement with $n placeholders, parameter keys).
+
+    Keys are positions for ? placeholders and names for :name ones; a name
+    used twice maps to the same $n.
+    """
+    statement = ' '.join(sql.split()).upper().rstrip(';')
+    if statement in _STATEMENTS:
+        return _STATEMENTS[statement], ()
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    if statement.startswith(_DML + ('SELECT', 'WITH')):
+        # Column defaults use datetime('now') too, so stored timestamps keep SQLite's text format
+        sql = _CURRENT_TIMESTAMP.sub("datetime('now')", sql)
+    sql = _INSERT_OR_IGNORE.sub(r'\1INSERT INTO\2 ON CONFLICT DO NOTHING', sql)
+
+    keys = []
+
+    def placeholder(match):
+        text = match.group(0)
+        if text[0] in "'$":
+            return text
+        if text == '?':
+            keys.append(len(keys))
+            return f'${len(keys)}'
+        name = match.group(1)
+        if name not in keys:
+            keys.append(name)
+        return f'${keys.index(name) + 1}'
+
+    return _TOKENS.sub(placeholder, sql), tuple(keys)
+
+
+@functools.lru_cache(maxsize=1024)
+def _pyformat(sql):
+    """$n placeholders -> psycopg2's %(pn)s, for statements that aren't prepared"""
+    return re.sub(r'\$(\d+)', r'%(p\1)s', sql.replace('%', '%%'))
+
+
+def _bind(keys, params):
+    """Parameter values in $n order"""
+    if params is None:
+        params = ()
+    if isinstance(params, collections.abc.Mapping):
+        return [params[key] for key in keys]
+    if len(params) != len(keys):
+        raise psycopg2.ProgrammingError(f'Incorrect number of bindings supplied. The current statement '
+                                        f'uses {len(keys)}, and there are {len(params)} supplied.')
+    return list(params)
+
+
+def _type(value):
+    # Typed so values in select lists and bare comparisons resolve the same
+    # way SQLite treats them; everything else is inferred from context
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'bigint'
+    if isinstance(value, float):
+        return 'double precision'
+    return 'unknown'
+
+
+class Cursor:
+    """sqlite3.Cursor look-alike; rows support row['column'], row[0] and dict(row)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        self.rowcount = -1
+        self.lastrowid = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _timed(self, method, sql, params, *args):
+        if not db._statement_observers:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            db._notify(self, sql, params, time.perf_counter() - start)
+
+    def execute(self, sql, params=()):
+        self._timed(self._execute, sql, params, sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        def run():
+            total = 0
+            for params in seq_of_params:
+                self._execute(sql, params)
+                total += max(self.rowcount, 0)
+            self.rowcount = total
+        self._timed(run, sql, None)
+        return self
+
+    def _execute(self, sql, params):
+        statement, keys = translate(sql)
+        values = _bind(keys, params)
+        begin = not self.connection.in_transaction and sql.lstrip()[:7].upper().startswith(_DML)
+        if PREPARE and statement.lstrip()[:6].upper().startswith(_PREPARABLE):
+            self._execute_prepared(statement, values, begin)
+        else:
+            text = _pyformat(statement) if values else statement
+            args = {f'p{n}': value for n, value in enumerate(values, 1)} if values else None
+            self._cursor.execute(('BEGIN; ' if begin else '') + text, args)
+        self.rowcount = self._cursor.rowcount
+
+    def _execute_prepared(self, statement, values, begin):
+        types = tuple(_type(value) for value in values)
+        name, prepare = self.connection.prepared(statement, types)
+        if prepare:
+            try:
+                self._cursor.execute(prepare)
+            except Exception:
+                # Nothing was prepared, so there is nothing to deallocate
+                del self.connection._prepared[(statement, types)]
+                raise
+        execute = f"EXECUTE {name} ({', '.join(['%s'] * len(values))})" if values else f'EXECUTE {name}'
+        try:
+            self._cursor.execute(('BEGIN; ' if begin else '') + execute, values or None)
+        except psycopg2.errors.FeatureNotSupported:
+            # "cached plan must not change result type": a migration altered a
+            # table behind this connection's prepared statement. Prepare again,
+            # unless the failed statement was part of the caller's transaction.
+            self.connection.forget(statement)
+            if begin:
+                self.connection.rollback()
+            if self.connection.in_transaction:
+                raise
+            self._execute_prepared(statement, values, begin)
+
+    def explain(self, sql, params):
+        """EXPLAIN lines for a statement, untimed; a failure doesn't abort the caller's transaction"""
+        statement, keys = translate(sql)
+        values = _bind(keys, params)
+        plan = self.connection.raw.cursor()
+        savepoint = self.connection.in_transaction
+        try:
+            if savepoint:
+                plan.execute('SAVEPOINT explain')
+            plan.execute('EXPLAIN ' + (_pyformat(statement) if values else statement),
+                         {f'p{n}': value for n, value in enumerate(values, 1)} or None)
+            lines = [row[0] for row in plan.fetchall()]
+            if savepoint:
+                plan.execute('RELEASE SAVEPOINT explain')
+            return lines
+        except psycopg2.Error as e:
+            if savepoint:
+                plan.execute('ROLLBACK TO SAVEPOINT explain')
+            return [f'(plan unavailable: {str(e).strip()})']
+
+    def fetchone(self):
+        return self._timed(self._fetch, None, None, self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(self._fetch, None, None, self._cursor.fetchmany, size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._timed(self._fetch, None, None, self._cursor.fetchall)
+
+    def _fetch(self, method, *args):
+        if self._cursor.description is None:
+            # sqlite3 returns nothing for statements without a result set
+            return None if method == self._cursor.fetchone else []
+        return method(*args)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """sqlite3.Connection look-alike over a pooled psycopg2 connection"""
+
+    # Accepted for sqlite3 compatibility; rows always support names and indexes
+    row_factory = None
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._prepared = collections.OrderedDict()
+        # Names no longer used, deallocated outside a transaction
+        self._stale = []
+        self._next_name = 0
+
+    @property
+    def in_transaction(self):
+        return self.raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, factory=None):
+        return Cursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def prepared(self, statement, types):
+        """(name, PREPARE statement or None if already prepared) for a statement and parameter types"""
+        key = (statement, types)
+        name = self._prepared.get(key)
+        if name is not None:
+            self._prepared.move_to_end(key)
+            return name, None
+        if len(self._prepared) >= MAX_PREPARED:
+            self._stale.append(self._prepared.popitem(last=False)[1])
+        if self._stale and not self.in_transaction:
+            self.raw.cursor().execute('; '.join(f'DEALLOCATE {stale}' for stale in self._stale))
+            self._stale.clear()
+        self._next_name += 1
+        name = self._prepared[key] = f'todo_{self._next_name}'
+        parameters = f" ({', '.join(types)})" if types else ''
+        return name, f'PREPARE {name}{parameters} AS {statement}'
+
+    def forget(self, statement):
+        """Stop using the prepared statements of a statement; deallocated by the next prepared()"""
+        for key in [key for key in self._prepared if key[0] == statement]:
+            self._stale.append(self._prepared.pop(key))
+
+    def commit(self):
+        if self.in_transaction:
+            self.raw.cursor().execute('COMMIT')
+
+    def rollback(self):
+        if self.in_transaction:
+            self.raw.cursor().execute('ROLLBACK')
+
+    def close(self):
+        release(self)
+
+    def really_close(self):
+        self.raw.close()
+
+
+class Pool:
+    """Connections of one worker process, borrowed by its threads"""
+
+    def __init__(self, dsn, size):
+        self.dsn = dsn
+        self.size = size
+        self.idle = []
+        self.open = 0
+        self.available = threading.Condition()
+
+    def get(self):
+        """(connection, reused)"""
+        deadline = time.monotonic() + POOL_TIMEOUT
+        with self.available:
+            while not self.idle and self.open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.available.wait(remaining):
+                    raise PoolTimeout(f'no database connection free after {POOL_TIMEOUT:g} s '
+                                      f'(TODO_PG_POOL_SIZE={self.size})')
+            if self.idle:
+                return self.idle.pop(), True
+            self.open += 1
+        try:
+            return Connection(_connect(self.dsn)), False
+        except BaseException:
+            with self.available:
+                self.open -= 1
+                self.available.notify()
+            raise
+
+    def put(self, conn):
+        """True if the connection was kept, False if it was broken and closed"""
+        with self.available:
+            if conn.raw.closed:
+                self.open -= 1
+                kept = False
+            else:
+                self.idle.append(conn)
+                kept = True
+            self.available.notify()
+        return kept
+
+    def close_idle(self):
+        with self.available:
+            idle, self.idle = self.idle, []
+            self.open -= len(idle)
+            self.available.notify_all()
+        for conn in idle:
+            conn.really_close()
+
+
+def _connect(dsn):
+    raw = psycopg2.connect(dsn)
+    # Transactions are opened explicitly, as sqlite3 does (see Cursor._execute)
+    raw.autocommit = True
+    return raw
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _current_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                # A forked worker gets its own pool; the parent's sockets are
+                # left alone (closing them would end the parent's sessions)
+                _pool, _pool_pid = Pool(db.DATABASE_URL, POOL_SIZE), pid
+    return _pool
+
+
+def get_connection():
+    conn, reused = _current_pool().get()
+    db._count('hits' if reused else 'misses')
+    return conn
+
+
+def release(conn):
+    if not conn.raw.closed and conn.in_transaction:
+        # Never hand out a connection with uncommitted work
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            conn.really_close()
+    db._count('released' if _current_pool().put(conn) else 'discarded')
+
+
+def close_all():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close_idle()
+
+
+def idle_count():
+    return len(_pool.idle) if _pool is not None and _pool_pid == os.getpid() else 0
+
+
+class _CopyStream:
+    """File-like object feeding rows to COPY ... FROM STDIN in text format"""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+
+    def read(self, size=-1):
+        # Whole lines of about size characters; COPY doesn't need exact sizes
+        lines, length = [], 0
+        for row in self.rows:
+            line = '\t'.join(map(_copy_value, row)) + '\n'
+            lines.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        self.count += len(lines)
+        return ''.join(lines)
+
+    readline = read
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if value.__class__ is str:
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value)
+
+
+def copy_rows(conn, table, columns, rows):
+    """Bulk-load an iterable of row tuples into table with COPY; returns the number of rows"""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    stream = _CopyStream(rows)
+    start = time.perf_counter()
+    conn.raw.cursor().copy_expert(sql, stream, size=1 << 16)
+    if db._statement_observers:
+        db._notify(conn.cursor(), sql, None, time.perf_counter() - start)
+    return stream.count
@@ -0,0 +1,247 @@
+#events.py
+# In-process fan-out of collaborative list events for Server-Sent Events.
+#
+# Writers never talk to the hub: triggers append to task_events (tasks
+# database) and member_events (collab_lists database). One watcher thread per process polls
+# PRAGMA data_version, which changes whenever any other connection - in this
+# worker or another gunicorn worker - commits, then reads the new event rows
+# and drops them on the queues of that list's subscribers. Idle subscribers
+# just wait on their queue. PostgreSQL has neither data_version nor event ids
+# in commit order; there the watcher rereads, every poll, the events stamped
+# above the last commit-visibility watermark (migrations/postgres/users/0004)
+# and skips the ones it has already delivered.
+# With sharded tasks (shards.py) every shard has its own task_events, and the
+# watcher keeps a connection on each.
+#
+# Each open stream occupies a request handler for as long as the page stays
+# open, so streams are only served where that is cheap: gunicorn's gevent
+# worker (a greenlet per stream) or the threaded development server. Under a
+# sync gunicorn worker the endpoint answers 503 and pages don't subscribe.
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import db
+import shards
+
+POLL_INTERVAL = float(os.environ.get('TODO_EVENTS_POLL_INTERVAL', 0.25))
+EVENT_RETENTION_MINUTES = 60
+PRUNE_EVERY_SECONDS = 300
+SUBSCRIBER_QUEUE_SIZE = 500
+
+# 'auto' (default), '1' to always serve streams or '0' to never serve them
+LIVE_EVENTS = os.environ.get('TODO_LIVE_EVENTS', 'auto')
+
+# Events that end a member's stream
+REVOKING_EVENTS = ('member_removed', 'list_deleted')
+
+
+class ListEvent:
+    def __init__(self, event_id, kind, list_id, task_id=None, user_id=None, task=None):
+        self.id = event_id
+        self.kind = kind
+        self.list_id = list_id
+        self.task_id = task_id
+        self.user_id = user_id
+        self.task = task
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._watcher = None
+        self._last_task_event = {}
+        self._last_member_event = None
+        self._watermark = None
+        self._delivered = set()
+        self._last_prune = 0
+
+    def subscribe(self, list_id):
+        """Register interest in a list; returns the queue events arrive on"""
+        events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(list_id, set()).add(events)
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name='list-events', daemon=True)
+                self._watcher.start()
+        return events
+
+    def unsubscribe(self, list_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(list_id)
+            if subscribers:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[list_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.list_id, ()))
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # A stalled client: replace its backlog with a single resync hint
+                with events.mutex:
+                    events.queue.clear()
+                events.put_nowait(ListEvent(event.id, 'resync', event.list_id))
+
+    def _watch(self):
+        # Dedicated connections, one per tasks database: data_version only moves
+        # for *other* connections' commits. All of them see member_events; the
+        # first one reads them.
+        names = shards.all_databases()
+        conns = [db.get_connection(name) for name in names]
+        try:
+            cursors = dict(zip(names, (conn.cursor() for conn in conns)))
+            if db.BACKEND == 'postgres':
+                self._watermark = None
+                self._dispatch_postgres(conns[0], publish=False)
+            else:
+                for name, c in cursors.items():
+                    self._last_task_event[name] = c.execute('SELECT COALESCE(MAX(id), 0) FROM main.task_events').fetchone()[0]
+                self._last_member_event = conns[0].execute('SELECT COALESCE(MAX(id), 0) FROM member_events').fetchone()[0]
+            versions = None
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._watcher = None
+                        return
+                if db.BACKEND == 'postgres':
+                    self._dispatch_postgres(conns[0])
+                else:
+                    current = tuple(self._version(name, c) for name, c in cursors.items())
+                    if current != versions:
+                        versions = current
+                        self._dispatch(cursors)
+                if time.time() - self._last_prune > PRUNE_EVERY_SECONDS:
+                    self._prune(conns)
+                time.sleep(POLL_INTERVAL)
+        finally:
+            for conn in conns:
+                conn.close()
+
+    def _version(self, name, c):
+        """Changes whenever events may have been added"""
+        return tuple(c.execute(f'PRAGMA {schema}.data_version').fetchone()[0]
+                     for schema in ('main',) + db.attached(name))
+
+    def _dispatch(self, cursors):
+        with self._lock:
+            list_ids = json.dumps(list(self._subscribers))
+
+        for name, c in cursors.items():
+            # Read up to a fixed high-water mark so rows committed meanwhile aren't skipped
+            task_upto = c.execute('SELECT COALESCE(MAX(id), 0) FROM main.task_events').fetchone()[0]
+            c.execute('''
+                SELECT task_events.id AS event_id, task_events.kind, task_events.list_id,
+                       task_events.task_id, tasks.*
+                FROM main.task_events
+                LEFT JOIN tasks ON tasks.id = task_events.task_id AND task_events.kind != 'task_deleted'
+                WHERE task_events.id > ? AND task_events.id <= ?
+                  AND task_events.list_id IN (SELECT value FROM json_each(?))
+                ORDER BY task_events.id
+            ''', (self._last_task_event[name], task_upto, list_ids))
+            for row in c.fetchall():
+                task = dict(row) if row['title'] is not None else None
+                self._publish(ListEvent(row['event_id'], row['kind'], row['list_id'], task_id=row['task_id'], task=task))
+            self._last_task_event[name] = task_upto
+
+        c = next(iter(cursors.values()))
+        member_upto = c.execute('SELECT COALESCE(MAX(id), 0) FROM member_events').fetchone()[0]
+        c.execute('''
+            SELECT id, kind, list_id, user_id FROM member_events
+            WHERE id > ? AND id <= ? AND list_id IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        ''', (self._last_member_event, member_upto, list_ids))
+        for row in c.fetchall():
+            self._publish(ListEvent(row['id'], row['kind'], row['list_id'], user_id=row['user_id']))
+        self._last_member_event = member_upto
+
+    def _dispatch_postgres(self, conn, publish=True):
+        # Events stamped at or below the new watermark can't be joined by a
+        # late commit, so only the delivered ones above it are remembered
+        with self._lock:
+            list_ids = json.dumps(list(self._subscribers))
+
+        c = conn.cursor()
+        c.execute('BEGIN')
+        watermark = c.execute('SELECT change_watermark()').fetchone()[0]
+        since = watermark if self._watermark is None else self._watermark
+        c.execute('''
+            SELECT task_events.id AS event_id, task_events.stamp, task_events.kind, task_events.list_id,
+                   task_events.task_id, tasks.*
+            FROM task_events
+            LEFT JOIN tasks ON tasks.id = task_events.task_id AND task_events.kind != 'task_deleted'
+            WHERE task_events.stamp > ? AND task_events.list_id IN (SELECT value FROM json_each(?))
+            ORDER BY task_events.stamp, task_events.id
+        ''', (since, list_ids))
+        task_rows = c.fetchall()
+        c.execute('''
+            SELECT id, stamp, kind, list_id, user_id FROM member_events
+            WHERE stamp > ? AND list_id IN (SELECT value FROM json_each(?))
+            ORDER BY stamp, id
+        ''', (since, list_ids))
+        member_rows = c.fetchall()
+        conn.commit()
+
+        delivered = set()
+        for row in task_rows:
+            key = ('task', row['event_id'])
+            if row['stamp'] > watermark:
+                delivered.add(key)
+            if publish and key not in self._delivered:
+                task = dict(row) if row['title'] is not None else None
+                self._publish(ListEvent(row['event_id'], row['kind'], row['list_id'], task_id=row['task_id'], task=task))
+        for row in member_rows:
+            key = ('member', row['id'])
+            if row['stamp'] > watermark:
+                delivered.add(key)
+            if publish and key not in self._delivered:
+                self._publish(ListEvent(row['id'], row['kind'], row['list_id'], user_id=row['user_id']))
+        self._delivered = delivered
+        self._watermark = watermark
+
+    def _prune(self, conns):
+        self._last_prune = time.time()
+        cutoff = f'-{EVENT_RETENTION_MINUTES} minutes'
+        for conn in conns:
+            conn.execute("DELETE FROM main.task_events WHERE created_at < datetime('now', ?)", (cutoff,))
+            conn.commit()
+        conns[0].execute("DELETE FROM member_events WHERE created_at < datetime('now', ?)", (cutoff,))
+        conns[0].commit()
+
+
+_hub = None
+_hub_pid = None
+
+
+def get_hub():
+    """The event hub for this process (a forked worker gets its own)"""
+    global _hub, _hub_pid
+    if _hub is None or _hub_pid != os.getpid():
+        _hub = EventHub()
+        _hub_pid = os.getpid()
+    return _hub
+
+
+def streaming_supported():
+    """Whether this process can hold event streams open without tying up a
+    worker. Checked per call: with preload_app the app is imported before
+    the gevent worker patches the standard library."""
+    if LIVE_EVENTS != 'auto':
+        return LIVE_EVENTS == '1'
+    # gunicorn's arbiter exports SERVER_SOFTWARE to its workers
+    if not os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        return True
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
@@ -1,5 +0,0 @@
-#extensions.py
-
-from flask_bcrypt import Bcrypt
-
-bcrypt = Bcrypt()
@@ -0,0 +1,201 @@
+#group_commit.py
+# Group commit for SQLite writes: TODO_GROUP_COMMIT=1.
+#
+# Normally every request thread commits its own write. Each commit takes the
+# file's write lock, so under load the others queue on busy_timeout (or give
+# up with "database is locked"), and every one of them pays its own commit.
+# With group commit on, the data modules hand their mutations to one writer
+# thread per database file instead. The writer takes what has queued up -
+# waiting up to WINDOW_MS for more, at most MAX_BATCH operations - and
+# applies the batch in one transaction: one write lock and one commit for
+# all of them. Each operation runs in its own savepoint, so one that fails is
+# rolled back alone and only its caller sees the error.
+#
+# An operation is a function operation(cursor, *args) that runs its
+# statements and returns its result rows; it never commits. submit() returns
+# a concurrent.futures.Future for that result, run() waits for it. With group
+# commit off - and always with PostgreSQL, which has row locks and stamps
+# changes without a shared counter (migrations/postgres/users/0004), so it
+# has no single writer - operations run inline on the caller's own
+# connection, so the data modules keep one code path.
+#
+# The writer is per process: gunicorn workers still take the lock in turn,
+# but once per batch rather than once per request. Its statements run on
+# the writer thread, so per-request SQL counts (querytrace, metrics) leave
+# them out; /metrics has the writer's own batch counters.
+#
+# A caller waits at most TIMEOUT_SECONDS. If the writer hasn't reached its
+# operation by then, the operation is withdrawn and never runs. If the writer
+# is already running it, it may still commit. run() raises WriteTimeout
+# either way; .withdrawn tells the two cases apart (see task_routes).
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import db
+
+ENABLED = os.environ.get('TODO_GROUP_COMMIT') == '1' and db.BACKEND == 'sqlite'
+# Longest the writer waits for more operations before committing a batch
+WINDOW_MS = float(os.environ.get('TODO_GROUP_COMMIT_WINDOW_MS', 1))
+# Most operations committed together
+MAX_BATCH = int(os.environ.get('TODO_GROUP_COMMIT_MAX_BATCH', 64))
+# Longest a caller waits for its result
+TIMEOUT_SECONDS = float(os.environ.get('TODO_GROUP_COMMIT_TIMEOUT', 30))
+
+_lock = threading.Lock()
+_writers = {}
+_writers_pid = None
+_stats = {'batches': 0, 'operations': 0, 'failed': 0, 'max_batch': 0,
+          'commit_seconds': 0.0, 'queue_wait_seconds': 0.0}
+
+
+class WriteTimeout(Exception):
+    """The writer didn't finish an operation within TIMEOUT_SECONDS"""
+
+    def __init__(self, withdrawn):
+        super().__init__('write withdrawn' if withdrawn else 'write still in progress')
+        # True: it never ran. False: the writer had started it, so it may still commit
+        self.withdrawn = withdrawn
+
+
+class _Writer:
+    """The writer thread of one database file"""
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._loop, name=f'group-commit-{name}', daemon=True)
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + WINDOW_MS / 1000
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._apply(batch)
+            except BaseException as e:
+                # Never leave a caller waiting, and keep the thread alive for the next batch
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _apply(self, batch):
+        started = time.time()
+        results = []
+        failed = 0
+        conn = db.get_connection(self.name)
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            for operation, args, future, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    # The caller gave up before its turn
+                    continue
+                c.execute('SAVEPOINT operation')
+                try:
+                    result = operation(c, *args)
+                except Exception as e:
+                    c.execute('ROLLBACK TO operation')
+                    c.execute('RELEASE operation')
+                    future.set_exception(e)
+                    failed += 1
+                    continue
+                c.execute('RELEASE operation')
+                results.append((future, result))
+            conn.commit()
+        finally:
+            conn.close()
+        for future, result in results:
+            future.set_result(result)
+        _record(batch, failed, started, time.time() - started)
+
+
+def _record(batch, failed, started, seconds):
+    with _lock:
+        _stats['batches'] += 1
+        _stats['operations'] += len(batch)
+        _stats['failed'] += failed
+        _stats['max_batch'] = max(_stats['max_batch'], len(batch))
+        _stats['commit_seconds'] += seconds
+        _stats['queue_wait_seconds'] += sum(max(0.0, started - submitted) for _, _, _, submitted in batch)
+
+
+def _writer(name):
+    """The writer for a logical database's file in this process (a forked worker gets its own)"""
+    global _writers_pid
+    path = db.db_path(name)
+    with _lock:
+        if _writers_pid != os.getpid():
+            # Threads don't survive a fork
+            _writers.clear()
+            _writers_pid = os.getpid()
+        writer = _writers.get(path)
+        created = writer is None
+        if created:
+            # In the single layout every logical database shares one file, and so one writer
+            writer = _writers[path] = _Writer(name)
+    if created:
+        # Started outside _lock: under gevent Thread.start() yields, and a
+        # preloaded app's _lock is a real lock that would block every greenlet
+        writer.thread.start()
+    return writer
+
+
+def _run_inline(name, operation, args):
+    conn = db.get_connection(name)
+    c = conn.cursor()
+    try:
+        result = operation(c, *args)
+        conn.commit()
+    finally:
+        # Rolls back whatever wasn't committed
+        conn.close()
+    return result
+
+
+def submit(name, operation, *args):
+    """Queue operation(cursor, *args) for the writer of a logical database; returns a Future of its result"""
+    future = Future()
+    if not ENABLED:
+        try:
+            future.set_result(_run_inline(name, operation, args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    _writer(name).queue.put((operation, args, future, time.time()))
+    return future
+
+
+def run(name, operation, *args):
+    """Apply operation(cursor, *args) in a committed transaction and return its result"""
+    if not ENABLED:
+        return _run_inline(name, operation, args)
+    future = submit(name, operation, *args)
+    try:
+        return future.result(timeout=TIMEOUT_SECONDS)
+    except TimeoutError:
+        # Withdraw it if the writer hasn't started on it yet
+        raise WriteTimeout(withdrawn=future.cancel()) from None
+
+
+def stats():
+    """Batch counts and timings for this process"""
+    with _lock:
+        stats = dict(_stats)
+    stats['avg_batch'] = stats['operations'] / stats['batches'] if stats['batches'] else 0.0
+    stats['enabled'] = ENABLED
+    stats['window_ms'] = WINDOW_MS
+    stats['max_batch_size'] = MAX_BATCH
+    return stats
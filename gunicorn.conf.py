@@ -0,0 +1,21 @@
+#gunicorn.conf.py
+# Read by gunicorn from the working directory (gunicorn -c gunicorn.conf.py app:app).
+#
+# preload_app: the master imports the app and checks the schema once, then
+# forks workers that start serving immediately. app.create_app() closes its
+# boot connections, and the connection pool, bcrypt pool and event hub are
+# all per-process, so nothing opened in the master leaks into a worker.
+#
+# worker_class: gevent serves each request on a greenlet, so an open live
+# events stream (GET /collab_lists/<id>/events) costs a socket rather than a
+# worker. With GUNICORN_WORKER_CLASS=sync the app stops offering streams
+# (events.streaming_supported) and threads sets the request concurrency.
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
@@ -0,0 +1,59 @@
+#http_cache.py
+# Conditional GET helpers: strong ETags derived from cheap board versions.
+#
+# Views compute a version before reading any rows; if the client's
+# If-None-Match matches they return 304 straight away. Tagged responses are
+# private and must be revalidated every time, so a logged-out browser never
+# reuses them without asking the server (which then demands a login).
+
+import hashlib
+
+from flask import request, make_response
+
+# Bump when the JSON shape of tagged endpoints changes
+ETAG_FORMAT_VERSION = 1
+
+REVALIDATE = 'private, no-cache, must-revalidate'
+
+
+def make_etag(user_id, *versions):
+    """Strong ETag for the current request path/query, user and data versions"""
+    key = '|'.join(str(part) for part in (
+        ETAG_FORMAT_VERSION, user_id, request.full_path, request.headers.get('Accept', ''), *versions
+    ))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+# compression.py tags gzip/brotli bodies as "<etag>-gzip" / "<etag>-br"
+ENCODING_SUFFIXES = ('', '-gzip', '-br')
+
+
+def _matching(etag):
+    """The variant of etag the client sent in If-None-Match, if any"""
+    for suffix in ENCODING_SUFFIXES:
+        if etag + suffix in request.if_none_match:
+            return etag + suffix
+    return None
+
+
+def is_fresh(etag):
+    """True if the client already holds the representation with this ETag"""
+    return _matching(etag) is not None
+
+
+def tag(response, etag):
+    response = make_response(response)
+    if response.status_code >= 400:
+        # An error (e.g. 406) is not a representation the client can revalidate
+        return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE
+    response.vary.update(('Cookie', 'Accept'))
+    response.headers.pop('Pragma', None)
+    response.headers.pop('Expires', None)
+    return response
+
+
+def not_modified(etag):
+    # Echo the variant the client holds so its cached copy stays valid
+    return tag(make_response('', 304), _matching(etag) or etag)
@@ -0,0 +1,196 @@
+#metrics.py
+# Per-request performance metrics in Prometheus text format at /metrics.
+#
+# Recording is a few dict/list updates under a lock per request; label
+# formatting and exposition only happen when /metrics is scraped. SQL
+# statements are counted and timed through db's statement observers, so
+# every module using the connection layer is covered.
+#
+# Each process keeps its own numbers. Under gunicorn a scrape reads one
+# worker, identified by the "worker" label on every series.
+#
+# Access: set TODO_METRICS_TOKEN and scrape with "Authorization: Bearer
+# <token>". The peer address is never trusted - behind a reverse proxy on
+# the same host every request looks local - so without a token /metrics is
+# not served (404) and nothing is collected. TODO_METRICS=0 does the same.
+
+import bisect
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+import db
+import group_commit
+import passwords
+
+ENABLED = os.environ.get('TODO_METRICS', '1') != '0'
+TOKEN = os.environ.get('TODO_METRICS_TOKEN')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self, extra):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = _labels(dict(zip(self.labels, label_values), **extra))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _simple(name, kind, help_text, value, extra):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name}{{{_labels(extra)}}} {value}']
+
+
+REQUEST_LATENCY = Histogram('todo_http_request_duration_seconds', 'Time spent handling a request',
+                            LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
+RESPONSE_SIZE = Histogram('todo_http_response_size_bytes', 'Response body size as sent (after compression)',
+                          SIZE_BUCKETS, ('endpoint',))
+REQUEST_SQL_COUNT = Histogram('todo_sql_statements_per_request', 'SQL statements executed per request',
+                              SQL_COUNT_BUCKETS, ('endpoint',))
+REQUEST_SQL_TIME = Histogram('todo_sql_seconds_per_request', 'Time spent in SQLite (execute and fetch) per request',
+                             SQL_TIME_BUCKETS, ('endpoint',))
+
+_local = threading.local()
+_totals_lock = threading.Lock()
+_totals = {'statements': 0, 'sql_seconds': 0.0}
+
+
+def _observe_statement(cursor, sql, params, seconds):
+    if sql is not None:
+        _local.sql_count = getattr(_local, 'sql_count', 0) + 1
+    _local.sql_seconds = getattr(_local, 'sql_seconds', 0.0) + seconds
+
+
+def sql_usage():
+    """(statements, seconds) recorded on this thread since the request started"""
+    return getattr(_local, 'sql_count', 0), getattr(_local, 'sql_seconds', 0.0)
+
+
+def _start_request():
+    _local.sql_count = 0
+    _local.sql_seconds = 0.0
+    g.metrics_started = time.perf_counter()
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = _endpoint()
+    REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+    if not response.is_streamed:
+        RESPONSE_SIZE.observe(response.calculate_content_length() or 0, endpoint)
+    statements, seconds = sql_usage()
+    REQUEST_SQL_COUNT.observe(statements, endpoint)
+    REQUEST_SQL_TIME.observe(seconds, endpoint)
+    with _totals_lock:
+        _totals['statements'] += statements
+        _totals['sql_seconds'] += seconds
+    return response
+
+
+def _authorized():
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied.encode(), f'Bearer {TOKEN}'.encode())
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    extra = {'worker': os.getpid()}
+    lines = []
+    for histogram in (REQUEST_LATENCY, RESPONSE_SIZE, REQUEST_SQL_COUNT, REQUEST_SQL_TIME):
+        lines += histogram.expose(extra)
+
+    with _totals_lock:
+        totals = dict(_totals)
+    lines += _simple('todo_sql_statements_total', 'counter', 'SQL statements executed by requests',
+                     totals['statements'], extra)
+    lines += _simple('todo_sql_seconds_total', 'counter', 'Time spent in SQLite by requests',
+                     totals['sql_seconds'], extra)
+
+    hashing = passwords.pool_stats()
+    lines += _simple('todo_password_hashes_total', 'counter', 'bcrypt hashes and checks completed',
+                     hashing['hashes'] + hashing['checks'], extra)
+    lines += _simple('todo_password_hash_seconds_total', 'counter', 'Time spent inside bcrypt',
+                     hashing['hash_seconds'], extra)
+    lines += _simple('todo_password_queue_wait_seconds_total', 'counter', 'Time bcrypt jobs waited for a free process',
+                     hashing['queue_wait_seconds'], extra)
+    lines += _simple('todo_password_rejected_total', 'counter', 'bcrypt jobs rejected with 429 (pool full or timed out)',
+                     hashing['rejected'] + hashing['timeouts'], extra)
+    lines += _simple('todo_password_pool_restarts_total', 'counter', 'bcrypt pools replaced after a process died',
+                     hashing['restarts'], extra)
+
+    writes = group_commit.stats()
+    lines += _simple('todo_group_commit_batches_total', 'counter', 'Transactions committed by the group-commit writer',
+                     writes['batches'], extra)
+    lines += _simple('todo_group_commit_operations_total', 'counter', 'Writes applied by the group-commit writer',
+                     writes['operations'], extra)
+    lines += _simple('todo_group_commit_queue_wait_seconds_total', 'counter',
+                     'Time writes waited for their batch to start', writes['queue_wait_seconds'], extra)
+
+    pool = db.pool_stats()
+    lines += _simple('todo_db_pool_hits_total', 'counter', 'Connections reused from the pool', pool['hits'], extra)
+    lines += _simple('todo_db_pool_misses_total', 'counter', 'Connections opened', pool['misses'], extra)
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    if not _authorized():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    response = Response(render(), mimetype='text/plain; version=0.0.4')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def init_app(app):
+    if not ENABLED or not TOKEN:
+        return
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    db.add_statement_observer(_observe_statement)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,187 @@
+#migrations/__init__.py
+# Versioned schema migrations.
+#
+# Each database has a directory of ordered migration files
+# (migrations/<database>/NNNN_description.py) exposing upgrade(c), where c is
+# a cursor inside an open transaction. Applied versions are recorded in that
+# database's version table, so every migration runs exactly once: split
+# layout files each have a schema_version table, the single layout file one
+# schema_version_<database> per logical database.
+#
+# Task shards (tasks-<n>.db, see shards.py) are migrated like a split layout
+# tasks.db: the tasks migrations, recorded in the file's schema_version.
+#
+# PostgreSQL (TODO_DATABASE_URL) has its own migration files, written in its
+# dialect, under migrations/postgres/<database>/, recorded the same way as the
+# single layout.
+#
+# App startup goes through ensure_current(): when the stored version already
+# matches the newest migration file it is a single SELECT - no DDL, no
+# write lock - so workers boot fast and never contend with each other.
+
+import functools
+import importlib.util
+import os
+import re
+import zlib
+
+import db
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Databases with a migrations/<name>/ directory, in the order they are migrated
+DATABASES = ('users', 'tasks', 'collab_lists')
+
+
+def databases():
+    """Every database to migrate: DATABASES, then the task shards if tasks are sharded"""
+    return DATABASES + tuple(db.shard_name(shard) for shard in range(db.shard_count()))
+
+
+_FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class SchemaOutdated(RuntimeError):
+    """A database is behind the code and migrating at startup is turned off"""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def load(self):
+        spec = importlib.util.spec_from_file_location(f'migrations_{self.version:04d}_{self.name}', self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def __repr__(self):
+        return f'<Migration {self.version:04d}_{self.name}>'
+
+
+def migrations_dir(name, backend=None):
+    if db.is_shard(name):
+        name = 'tasks'
+    if (backend or db.BACKEND) == 'postgres':
+        return os.path.join(MIGRATIONS_DIR, 'postgres', name)
+    return os.path.join(MIGRATIONS_DIR, name)
+
+
+def discover(name, backend=None):
+    """All migrations for a logical database, in version order"""
+    directory = migrations_dir(name, backend)
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f'Duplicate migration versions in {directory}')
+    return migrations
+
+
+def version_table(name, layout=None):
+    """Table recording the applied migrations of a logical database"""
+    if db.is_shard(name):
+        return 'schema_version'
+    return 'schema_version' if (layout or db.layout()) == 'split' else f'schema_version_{name}'
+
+
+def _ensure_version_table(conn, name):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS main.{version_table(name)} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def current_version(conn, name):
+    row = conn.execute(f'SELECT MAX(version) FROM main.{version_table(name)}').fetchone()
+    return row[0] or 0
+
+
+@functools.lru_cache(maxsize=None)
+def latest_version(name, backend=None):
+    migrations = discover(name, backend)
+    return migrations[-1].version if migrations else 0
+
+
+def stored_version(name):
+    """Version recorded in a database, without creating anything (0 if never migrated)"""
+    conn = db.get_connection(name)
+    try:
+        return current_version(conn, name)
+    except db.MISSING_TABLE_ERRORS:
+        # No schema_version table yet
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+
+def ensure_current(name, apply=True):
+    """Bring a database up to date, or check that it is when apply is False.
+
+    Returns the migrations applied (none when the stored version is current).
+    Raises SchemaOutdated if the database is behind and apply is False.
+    """
+    stored, latest = stored_version(name), latest_version(name)
+    if stored >= latest:
+        return []
+    if not apply:
+        raise SchemaOutdated(f'{name} database is at schema version {stored}, the code needs {latest}; '
+                             f'run python -m migrations')
+    return migrate(name)
+
+
+def migrate(name):
+    """Apply every pending migration for a logical database.
+
+    Each migration runs in its own IMMEDIATE transaction, so concurrent
+    workers booting at the same time serialize and skip work already done.
+    Returns the list of migrations applied by this call.
+    """
+    conn = db.get_connection(name)
+    try:
+        return migrate_connection(conn, name)
+    finally:
+        conn.close()
+
+
+def migrate_connection(conn, name):
+    """migrate() on an open connection, e.g. to a file being built (a new task shard)"""
+    try:
+        _ensure_version_table(conn, name)
+        applied = []
+        for migration in discover(name):
+            if migration.version <= current_version(conn, name):
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            if db.BACKEND == 'postgres':
+                # PostgreSQL's BEGIN takes no lock; serialize migrating processes explicitly
+                conn.execute('SELECT pg_advisory_xact_lock(?)', (zlib.crc32(f'migrate {name}'.encode()),))
+            # Another process may have applied it while we waited for the lock
+            if migration.version <= current_version(conn, name):
+                conn.commit()
+                continue
+            c = conn.cursor()
+            migration.load().upgrade(c)
+            c.execute(f'INSERT INTO main.{version_table(name)} (version, name) VALUES (?, ?)',
+                      (migration.version, migration.name))
+            conn.commit()
+            applied.append(migration)
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def status(name):
+    """(current_version, latest_version) for a logical database"""
+    return stored_version(name), latest_version(name)
@@ -0,0 +1,36 @@
+#migrations/__main__.py
+# python -m migrations [--status] [--check-plans]
+
+import sys
+
+import migrations
+from migrations.plan_checks import check_plans
+
+
+def main(argv):
+    if '--status' in argv:
+        for name in migrations.databases():
+            current, latest = migrations.status(name)
+            state = 'up to date' if current == latest else f'{latest - current} pending'
+            print(f'{name}: version {current}/{latest} ({state})')
+        return 0
+
+    for name in migrations.databases():
+        for migration in migrations.migrate(name):
+            print(f'{name}: applied {migration.version:04d}_{migration.name}')
+
+    if '--check-plans' in argv:
+        failed = 0
+        for label, ok, plan in check_plans():
+            print(f"[{'ok' if ok else 'FAIL'}] {label}")
+            for line in plan:
+                print(f'       {line}')
+            failed += not ok
+        if failed:
+            print(f'{failed} query plan check(s) failed')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
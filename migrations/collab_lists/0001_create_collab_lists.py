@@ -0,0 +1,18 @@
+"""Create the collab_lists table with an indexed owner_id column"""
+
+
+def upgrade(c):
+    c.execute('''
+            CREATE TABLE IF NOT EXISTS collab_lists (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                members TEXT DEFAULT '[]',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                owner_id INTEGER
+            )
+    ''')
+    c.execute('PRAGMA table_info(collab_lists)')
+    if 'owner_id' not in [row[1] for row in c.fetchall()]:
+        c.execute('ALTER TABLE collab_lists ADD COLUMN owner_id INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_collab_lists_owner ON collab_lists (owner_id, created_at)')
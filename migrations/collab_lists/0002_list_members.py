@@ -0,0 +1,34 @@
+"""Normalized list_members table, migrated from the legacy JSON members column"""
+
+import json
+
+
+def upgrade(c):
+    # One row per (list, user); the primary key doubles as the list_id index
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_members (
+            list_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL DEFAULT 'member',
+            added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (list_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_list_members_user ON list_members (user_id, list_id)')
+
+    # Lists without an owner predate list_members; the first JSON member is the owner
+    c.execute('SELECT id, members FROM collab_lists WHERE owner_id IS NULL')
+    for list_id, raw_members in c.fetchall():
+        try:
+            members = json.loads(raw_members) if raw_members else []
+        except ValueError:
+            members = []
+        if not members:
+            continue
+
+        owner_id = members[0]
+        c.execute('UPDATE collab_lists SET owner_id = ? WHERE id = ?', (owner_id, list_id))
+        c.executemany(
+            'INSERT OR IGNORE INTO list_members (list_id, user_id, role) VALUES (?, ?, ?)',
+            [(list_id, user_id, 'owner' if user_id == owner_id else 'member') for user_id in members]
+        )
@@ -0,0 +1,58 @@
+"""Change sequence for lists and memberships, plus membership tombstones.
+
+Deleting a list removes its list_members rows first, so a tombstone per
+(list, user) covers both "removed from list" and "list deleted".
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL,
+            pruned_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO list_seq (id, value) VALUES (1, 0)')
+
+    for table in ('collab_lists', 'list_members'):
+        c.execute(f'PRAGMA table_info({table})')
+        if 'seq' not in [row[1] for row in c.fetchall()]:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_member_tombstones (
+            list_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_list_member_tombstones_user ON list_member_tombstones (user_id, seq)')
+
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS collab_lists_seq_insert AFTER INSERT ON collab_lists BEGIN
+        UPDATE list_seq SET value = value + 1;
+        UPDATE collab_lists SET seq = (SELECT value FROM list_seq) WHERE id = new.id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS collab_lists_seq_update AFTER UPDATE ON collab_lists WHEN new.seq = old.seq BEGIN
+        UPDATE list_seq SET value = value + 1;
+        UPDATE collab_lists SET seq = (SELECT value FROM list_seq) WHERE id = new.id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS list_members_seq_insert AFTER INSERT ON list_members BEGIN
+        UPDATE list_seq SET value = value + 1;
+        UPDATE list_members SET seq = (SELECT value FROM list_seq)
+        WHERE list_id = new.list_id AND user_id = new.user_id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS list_members_seq_delete AFTER DELETE ON list_members BEGIN
+        UPDATE list_seq SET value = value + 1;
+        INSERT INTO list_member_tombstones (list_id, user_id, seq)
+        VALUES (old.list_id, old.user_id, (SELECT value FROM list_seq));
+    END
+    ''')
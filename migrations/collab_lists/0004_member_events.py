@@ -0,0 +1,33 @@
+"""Short-lived change feed of membership and list events for live board updates"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS member_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            list_id INTEGER NOT NULL,
+            user_id INTEGER,
+            kind TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS member_events_insert AFTER INSERT ON list_members BEGIN
+        INSERT INTO member_events (list_id, user_id, kind) VALUES (new.list_id, new.user_id, 'member_added');
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS member_events_delete AFTER DELETE ON list_members BEGIN
+        INSERT INTO member_events (list_id, user_id, kind) VALUES (old.list_id, old.user_id, 'member_removed');
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS member_events_list_update AFTER UPDATE OF name ON collab_lists BEGIN
+        INSERT INTO member_events (list_id, kind) VALUES (new.id, 'list_updated');
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS member_events_list_delete AFTER DELETE ON collab_lists BEGIN
+        INSERT INTO member_events (list_id, kind) VALUES (old.id, 'list_deleted');
+    END
+    ''')
@@ -0,0 +1,25 @@
+"""Owners for lists whose legacy members JSON was empty.
+
+0002 took the owner from the first JSON member and skipped lists without
+any, leaving them with no owner_id and no list_members rows: invisible to
+everyone. The legacy schema didn't record who created a list, so the author
+of the list's earliest task becomes its owner. Lists without tasks either
+stay ownerless; python -m migrations --check-plans reports them.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        SELECT collab_lists.id,
+               (SELECT tasks.user_id FROM tasks
+                WHERE tasks.collab_list_id = collab_lists.id
+                ORDER BY tasks.created_at, tasks.id LIMIT 1) AS creator_id
+        FROM collab_lists
+        WHERE collab_lists.owner_id IS NULL
+    ''')
+    for list_id, creator_id in c.fetchall():
+        if creator_id is None:
+            continue
+        c.execute('UPDATE collab_lists SET owner_id = ? WHERE id = ?', (creator_id, list_id))
+        c.execute("INSERT OR REPLACE INTO list_members (list_id, user_id, role) VALUES (?, ?, 'owner')",
+                  (list_id, creator_id))
@@ -0,0 +1,301 @@
+#migrations/consolidate.py
+# Online move from the split layout (database.db, tasks.db, collab_lists.db)
+# to the single layout (todo.db, see db.SINGLE_DATABASE):
+#
+#   python -m migrations.consolidate            copy, while the app keeps serving
+#   python -m migrations.consolidate --finish   last catch-up and switch over
+#
+# The copy is built in todo.db.partial. The first run creates the tables and
+# indexes - triggers and the search index wait for --finish, so copying never
+# fires them - and copies every table, each source file read from one
+# snapshot. Later runs catch up: tasks, lists and memberships carry change
+# sequence numbers, so only rows changed since the previous pass are copied
+# and deletions come from the tombstones; the small bookkeeping tables are
+# recopied whole. Run it until a pass is quick, then stop the app and run
+# --finish. That holds the write lock on every source file for a final pass,
+# creates the triggers, rebuilds the search index, checks row counts and
+# renames todo.db.partial to todo.db. Start the app again: it detects
+# todo.db. The split files are left untouched as a backup.
+
+import os
+import sqlite3
+import sys
+import time
+
+import db
+import migrations
+
+PARTIAL_SUFFIX = '.partial'
+
+# Tables whose rows carry seq, copied incrementally after the first pass:
+# table -> (counter table, key columns, deleted keys with seq > ?)
+INCREMENTAL = {
+    'tasks': ('task_seq', ('id',), 'SELECT task_id FROM src.task_tombstones WHERE seq > ?'),
+    'list_members': ('list_seq', ('list_id', 'user_id'),
+                     'SELECT list_id, user_id FROM src.list_member_tombstones WHERE seq > ?'),
+    # Deleted lists leave no tombstone; there are few enough lists to anti-join
+    'collab_lists': ('list_seq', ('id',), None),
+}
+
+# FTS5 shadow tables, created by their virtual table
+_SHADOW_SUFFIXES = ('_data', '_idx', '_docsize', '_config', '_content')
+
+
+class ConsolidationError(RuntimeError):
+    pass
+
+
+def _log(message):
+    print(f'[consolidate] {message}', flush=True)
+
+
+def sources(data_dir=None):
+    """logical database -> split layout file"""
+    data_dir = data_dir or db.DATA_DIR
+    return {name: os.path.join(data_dir, db.DATABASES[name]) for name in migrations.DATABASES}
+
+
+def target_path(data_dir=None):
+    return os.path.join(data_dir or db.DATA_DIR, db.SINGLE_DATABASE)
+
+
+def _check_sources(data_dir):
+    if os.path.exists(target_path(data_dir)):
+        raise ConsolidationError(f'{target_path(data_dir)} already exists; nothing to consolidate')
+    for name, path in sources(data_dir).items():
+        if not os.path.exists(path):
+            raise ConsolidationError(f'{path} is missing')
+        conn = sqlite3.connect(path)
+        try:
+            stored = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            stored = 0
+        finally:
+            conn.close()
+        if stored != migrations.latest_version(name):
+            raise ConsolidationError(f'{name} is at schema version {stored}, the code expects '
+                                     f'{migrations.latest_version(name)}; run python -m migrations first')
+
+
+def _schema(conn, kinds):
+    """(type, name, sql) of the attached source's objects worth copying"""
+    rows = conn.execute(f'''
+        SELECT type, name, sql FROM src.sqlite_master
+        WHERE type IN ({', '.join('?' * len(kinds))}) AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+    ''', kinds).fetchall()
+    virtual = [name for _, name, sql in rows if _virtual(sql)]
+    shadows = {name + suffix for name in virtual for suffix in _SHADOW_SUFFIXES}
+    return [row for row in rows if row[1] not in shadows]
+
+
+def _virtual(sql):
+    return sql.upper().startswith('CREATE VIRTUAL TABLE')
+
+
+def _target_name(source, table):
+    return migrations.version_table(source, 'single') if table == 'schema_version' else table
+
+
+def _exists(conn, name):
+    return conn.execute('SELECT 1 FROM main.sqlite_master WHERE name = ?', (name,)).fetchone() is not None
+
+
+def _create_schema(conn, source):
+    """Tables first, then indexes; objects a previous run created are kept"""
+    for kind in ('table', 'index'):
+        for _, name, sql in _schema(conn, (kind,)):
+            if name == 'schema_version':
+                name = _target_name(source, name)
+                sql = sql.replace('schema_version', name, 1)
+            if not _exists(conn, name):
+                conn.execute(sql)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA src.table_info({table})')]
+
+
+def _copy_table(conn, source, table, marks):
+    """Copy one table from src to main; returns the rows written"""
+    columns = ', '.join(_columns(conn, table))
+    target = _target_name(source, table)
+    if table in INCREMENTAL:
+        counter, keys, deleted = INCREMENTAL[table]
+        mark = marks.get(table, -1)
+        key = ', '.join(keys)
+        if deleted is None:
+            conn.execute(f'DELETE FROM main.{table} WHERE ({key}) NOT IN (SELECT {key} FROM src.{table})')
+        elif mark >= 0:
+            conn.execute(f'DELETE FROM main.{table} WHERE ({key}) IN ({deleted})', (mark,))
+        copied = conn.execute(f'INSERT OR REPLACE INTO main.{table} ({columns}) '
+                              f'SELECT {columns} FROM src.{table} WHERE seq > ?', (mark,)).rowcount
+        marks[table] = conn.execute(f'SELECT value FROM src.{counter}').fetchone()[0]
+        return copied
+    conn.execute(f'DELETE FROM main.{target}')
+    return conn.execute(f'INSERT INTO main.{target} ({columns}) SELECT {columns} FROM src.{table}').rowcount
+
+
+def _load_marks(conn, source):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS main.consolidation_state (
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            mark INTEGER NOT NULL,
+            PRIMARY KEY (source, table_name)
+        )
+    ''')
+    rows = conn.execute('SELECT table_name, mark FROM main.consolidation_state WHERE source = ?', (source,))
+    return dict(rows.fetchall())
+
+
+def _save_marks(conn, source, marks):
+    conn.executemany('INSERT OR REPLACE INTO main.consolidation_state (source, table_name, mark) VALUES (?, ?, ?)',
+                     [(source, table, mark) for table, mark in marks.items()])
+
+
+def sync_pass(conn, data_dir):
+    """Create anything missing and copy every source once; returns rows written per table"""
+    written = {}
+    for source, path in sources(data_dir).items():
+        conn.execute('ATTACH DATABASE ? AS src', (path,))
+        try:
+            # One transaction per source: every table is read from the same snapshot
+            conn.execute('BEGIN')
+            _create_schema(conn, source)
+            marks = _load_marks(conn, source)
+            for _, table, sql in _schema(conn, ('table',)):
+                if not _virtual(sql):
+                    written[_target_name(source, table)] = _copy_table(conn, source, table, marks)
+            _copy_sequences(conn)
+            _save_marks(conn, source, marks)
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.execute('DETACH DATABASE src')
+    return written
+
+
+def _copy_sequences(conn):
+    """AUTOINCREMENT counters, so ids are never reused after the switch"""
+    if not _exists(conn, 'sqlite_sequence'):
+        return
+    conn.execute('DELETE FROM main.sqlite_sequence WHERE name IN (SELECT name FROM src.sqlite_sequence)')
+    conn.execute('INSERT INTO main.sqlite_sequence (name, seq) SELECT name, seq FROM src.sqlite_sequence')
+
+
+def _finish_schema(conn, data_dir):
+    """Triggers and search indexes, created once the data is final"""
+    for source, path in sources(data_dir).items():
+        conn.execute('ATTACH DATABASE ? AS src', (path,))
+        try:
+            conn.execute('BEGIN')
+            for _, name, sql in _schema(conn, ('table',)):
+                if _virtual(sql):
+                    # fts5 'rebuild' re-reads the external content table
+                    conn.execute(f"INSERT INTO main.{name} ({name}) VALUES ('rebuild')")
+            for _, name, sql in _schema(conn, ('trigger',)):
+                if not _exists(conn, name):
+                    conn.execute(sql)
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.execute('DETACH DATABASE src')
+
+
+def _verify(conn, data_dir):
+    """Row counts of every copied table must match its source"""
+    mismatches = []
+    for source, path in sources(data_dir).items():
+        conn.execute('ATTACH DATABASE ? AS src', (path,))
+        try:
+            for _, table, sql in _schema(conn, ('table',)):
+                if _virtual(sql):
+                    continue
+                target = _target_name(source, table)
+                expected = conn.execute(f'SELECT COUNT(*) FROM src.{table}').fetchone()[0]
+                actual = conn.execute(f'SELECT COUNT(*) FROM main.{target}').fetchone()[0]
+                if expected != actual:
+                    mismatches.append(f'{target}: {actual} rows, {source} has {expected}')
+        finally:
+            conn.execute('DETACH DATABASE src')
+    if conn.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+        mismatches.append('quick_check failed')
+    return mismatches
+
+
+def _open_target(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def _report(written, seconds):
+    changed = {table: rows for table, rows in written.items() if rows}
+    summary = ', '.join(f'{table} {rows}' for table, rows in sorted(changed.items())) or 'nothing'
+    _log(f'pass took {seconds:.1f} s; rows written: {summary}')
+
+
+def copy(data_dir=None):
+    """One online pass: the first copies everything, later ones catch up"""
+    _check_sources(data_dir)
+    partial = target_path(data_dir) + PARTIAL_SUFFIX
+    _log(('catching up ' if os.path.exists(partial) else 'copying into ') + partial)
+    conn = _open_target(partial)
+    try:
+        started = time.perf_counter()
+        _report(sync_pass(conn, data_dir), time.perf_counter() - started)
+    finally:
+        conn.close()
+    _log('run again to catch up, or stop the app and run with --finish')
+
+
+def finish(data_dir=None):
+    """Final pass under the source write locks, then switch to the single layout"""
+    _check_sources(data_dir)
+    target = target_path(data_dir)
+    partial = target + PARTIAL_SUFFIX
+    # Writers now wait (and time out) instead of committing behind our back
+    locks = []
+    try:
+        for path in sources(data_dir).values():
+            lock = sqlite3.connect(path, timeout=30, isolation_level=None)
+            locks.append(lock)
+            lock.execute('BEGIN IMMEDIATE')
+        conn = _open_target(partial)
+        try:
+            started = time.perf_counter()
+            _report(sync_pass(conn, data_dir), time.perf_counter() - started)
+            _finish_schema(conn, data_dir)
+            mismatches = _verify(conn, data_dir)
+            if mismatches:
+                raise ConsolidationError('copy does not match the sources:\n  ' + '\n  '.join(mismatches))
+            conn.execute('DROP TABLE main.consolidation_state')
+        finally:
+            conn.close()
+        os.rename(partial, target)
+    finally:
+        for lock in locks:
+            lock.close()
+    _log(f'{target} is ready; start the app. The split files are no longer used and can be removed.')
+
+
+def main(argv):
+    try:
+        if '--finish' in argv:
+            finish()
+        else:
+            copy()
+    except ConsolidationError as e:
+        _log(f'error: {e}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,84 @@
+#migrations/plan_checks.py
+# EXPLAIN QUERY PLAN checks proving the hot query shapes use their indexes,
+# plus a data check for lists nobody can see.
+
+import db
+
+# (label, database, query, params, index the plan must use)
+HOT_QUERIES = [
+    ('personal board', 'tasks',
+     'SELECT * FROM tasks WHERE user_id = ? AND collab_list_id IS NULL AND archived = 0 '
+     'ORDER BY created_at DESC, id DESC',
+     (1,), 'idx_tasks_personal_board'),
+    ('personal board page', 'tasks',
+     'SELECT * FROM tasks WHERE user_id = ? AND collab_list_id IS NULL AND archived = 0 '
+     'AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+     (1, '2100-01-01', 1, 100), 'idx_tasks_personal_board'),
+    ('list board', 'tasks',
+     'SELECT * FROM tasks WHERE collab_list_id = ? AND archived = 0 '
+     'ORDER BY created_at DESC, id DESC',
+     (1,), 'idx_tasks_list_board'),
+    ('list board page', 'tasks',
+     'SELECT * FROM tasks WHERE collab_list_id = ? AND archived = 0 '
+     'AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+     (1, '2100-01-01', 1, 100), 'idx_tasks_list_board'),
+    ('personal archived view', 'tasks',
+     'SELECT * FROM tasks WHERE user_id = ? AND collab_list_id IS NULL AND archived = 1 '
+     'ORDER BY created_at DESC, id DESC',
+     (1,), 'idx_tasks_personal_board'),
+    ('list archived view', 'tasks',
+     'SELECT * FROM tasks WHERE collab_list_id = ? AND archived = 1 '
+     'ORDER BY created_at DESC, id DESC',
+     (1,), 'idx_tasks_list_board'),
+    ('due-date lookup', 'tasks',
+     'SELECT * FROM tasks WHERE user_id = ? AND due_date IS NOT NULL AND due_date <= ? AND archived = 0 '
+     'ORDER BY due_date',
+     (1, '2100-01-01'), 'idx_tasks_due'),
+    ('list task counts', 'tasks',
+     "SELECT COUNT(*) FROM tasks WHERE collab_list_id = ? AND archived = 0 AND status = 'pending'",
+     (1,), 'idx_tasks_list_status'),
+    ('lists owned by user', 'collab_lists',
+     'SELECT * FROM collab_lists WHERE owner_id = ? ORDER BY created_at DESC',
+     (1,), 'idx_collab_lists_owner'),
+    ('lists a user belongs to', 'collab_lists',
+     'SELECT list_id FROM list_members WHERE user_id = ?',
+     (1,), 'idx_list_members_user'),
+    ('password reset lookup', 'users',
+     "SELECT * FROM users WHERE reset_token = ? AND reset_token_expires > datetime('now')",
+     ('token',), 'idx_users_reset_token'),
+]
+
+
+def explain(name, query, params=()):
+    """EXPLAIN QUERY PLAN rows (detail strings) for a query"""
+    conn = db.get_connection(name)
+    try:
+        c = conn.cursor()
+        c.execute('EXPLAIN QUERY PLAN ' + query, params)
+        return [row['detail'] for row in c.fetchall()]
+    finally:
+        conn.close()
+
+
+def check_plans():
+    """Run every hot-query check. Returns a list of (label, ok, plan lines)"""
+    results = []
+    for label, name, query, params, index in HOT_QUERIES:
+        plan = explain(name, query, params)
+        uses_index = any(f'INDEX {index}' in line for line in plan)
+        no_sort = not any('USE TEMP B-TREE' in line for line in plan)
+        results.append((label, uses_index and no_sort, plan))
+    results.append(_check_owners())
+    return results
+
+
+def _check_owners():
+    """Lists without an owner are visible to nobody (see collab_lists 0005_owner_backfill)"""
+    conn = db.get_connection('collab_lists')
+    try:
+        c = conn.cursor()
+        c.execute('SELECT id, name FROM collab_lists WHERE owner_id IS NULL ORDER BY id')
+        orphans = [f"list {row['id']} ({row['name']!r}) has no owner" for row in c.fetchall()]
+    finally:
+        conn.close()
+    return 'every list has an owner', not orphans, orphans
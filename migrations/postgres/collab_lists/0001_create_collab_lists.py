@@ -0,0 +1,114 @@
+"""Lists and memberships with their change sequence, membership tombstones
+and event feed (migrations/collab_lists/0001-0004 in the SQLite schema).
+
+The SQLite table's legacy members column is not carried over; list_members
+replaced it.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS collab_lists (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name TEXT NOT NULL,
+            created_at TEXT DEFAULT datetime('now'),
+            updated_at TEXT DEFAULT datetime('now'),
+            owner_id BIGINT,
+            seq BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_collab_lists_owner ON collab_lists (owner_id, created_at)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_members (
+            list_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'member',
+            added_at TEXT DEFAULT datetime('now'),
+            seq BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (list_id, user_id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_list_members_user ON list_members (user_id, list_id)')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value BIGINT NOT NULL,
+            pruned_through BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('INSERT INTO list_seq (id, value) VALUES (1, 0) ON CONFLICT DO NOTHING')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS list_member_tombstones (
+            list_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            seq BIGINT NOT NULL,
+            deleted_at TEXT DEFAULT datetime('now')
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_list_member_tombstones_user ON list_member_tombstones (user_id, seq)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS member_events (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            list_id BIGINT NOT NULL,
+            user_id BIGINT,
+            kind TEXT NOT NULL,
+            created_at TEXT DEFAULT datetime('now')
+        )
+    ''')
+
+    # Every trigger below takes the list_seq row lock first, so seq values
+    # and member_events ids are handed out in commit order (see tasks_stamp)
+    c.execute('''
+        CREATE OR REPLACE FUNCTION lists_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE list_seq SET value = value + 1 RETURNING value INTO NEW.seq;
+            RETURN NEW;
+        END
+        $$
+    ''')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION lists_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            stamp BIGINT;
+        BEGIN
+            IF TG_TABLE_NAME = 'list_members' THEN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO member_events (list_id, user_id, kind) VALUES (NEW.list_id, NEW.user_id, 'member_added');
+                ELSE
+                    UPDATE list_seq SET value = value + 1 RETURNING value INTO stamp;
+                    INSERT INTO list_member_tombstones (list_id, user_id, seq) VALUES (OLD.list_id, OLD.user_id, stamp);
+                    INSERT INTO member_events (list_id, user_id, kind) VALUES (OLD.list_id, OLD.user_id, 'member_removed');
+                END IF;
+            ELSIF TG_OP = 'UPDATE' THEN
+                IF NEW.name IS DISTINCT FROM OLD.name THEN
+                    INSERT INTO member_events (list_id, kind) VALUES (NEW.id, 'list_updated');
+                END IF;
+            ELSE
+                UPDATE list_seq SET value = value + 1;
+                INSERT INTO member_events (list_id, kind) VALUES (OLD.id, 'list_deleted');
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS collab_lists_stamp ON collab_lists')
+    c.execute('''
+        CREATE TRIGGER collab_lists_stamp BEFORE INSERT OR UPDATE ON collab_lists
+        FOR EACH ROW EXECUTE FUNCTION lists_stamp()
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS collab_lists_changed ON collab_lists')
+    c.execute('''
+        CREATE TRIGGER collab_lists_changed AFTER UPDATE OR DELETE ON collab_lists
+        FOR EACH ROW EXECUTE FUNCTION lists_changed()
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS list_members_stamp ON list_members')
+    c.execute('''
+        CREATE TRIGGER list_members_stamp BEFORE INSERT ON list_members
+        FOR EACH ROW EXECUTE FUNCTION lists_stamp()
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS list_members_changed ON list_members')
+    c.execute('''
+        CREATE TRIGGER list_members_changed AFTER INSERT OR DELETE ON list_members
+        FOR EACH ROW EXECUTE FUNCTION lists_changed()
+    ''')
@@ -0,0 +1,48 @@
+"""Stamp list changes with change_stamp() instead of the list_seq row
+(see migrations/postgres/tasks/0003).
+
+list_seq becomes a view over the commit-visibility watermark. Deleting a list
+no longer bumps a counter: its members' rows go first and leave tombstones,
+and collab_lists.get_collab_lists_version() digests the rows themselves.
+"""
+
+
+def upgrade(c):
+    c.execute('UPDATE change_stamp_base SET base = GREATEST(base, (SELECT value + 1 FROM list_seq))')
+    c.execute('ALTER TABLE list_seq RENAME TO list_seq_state')
+    c.execute('ALTER TABLE list_seq_state DROP COLUMN value')
+    c.execute('CREATE VIEW list_seq AS SELECT id, change_watermark() AS value, pruned_through FROM list_seq_state')
+
+    c.execute('ALTER TABLE member_events ADD COLUMN stamp BIGINT NOT NULL DEFAULT change_stamp()')
+    c.execute('CREATE INDEX idx_member_events_stamp ON member_events (stamp)')
+
+    c.execute('''
+        CREATE OR REPLACE FUNCTION lists_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.seq := change_stamp();
+            RETURN NEW;
+        END
+        $$
+    ''')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION lists_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'list_members' THEN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO member_events (list_id, user_id, kind) VALUES (NEW.list_id, NEW.user_id, 'member_added');
+                ELSE
+                    INSERT INTO list_member_tombstones (list_id, user_id, seq)
+                    VALUES (OLD.list_id, OLD.user_id, change_stamp());
+                    INSERT INTO member_events (list_id, user_id, kind) VALUES (OLD.list_id, OLD.user_id, 'member_removed');
+                END IF;
+            ELSIF TG_OP = 'UPDATE' THEN
+                IF NEW.name IS DISTINCT FROM OLD.name THEN
+                    INSERT INTO member_events (list_id, kind) VALUES (NEW.id, 'list_updated');
+                END IF;
+            ELSE
+                INSERT INTO member_events (list_id, kind) VALUES (OLD.id, 'list_deleted');
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    ''')
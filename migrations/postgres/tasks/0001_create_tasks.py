@@ -0,0 +1,129 @@
+"""Tasks with their board indexes, change sequence, tombstones, event feed
+and board versions (migrations/tasks/0001-0008 in the SQLite schema).
+
+As with SQLite, user_id and collab_list_id are not foreign keys: lists are
+created by a later logical database and deleting one removes its tasks in
+the same transaction.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            priority TEXT DEFAULT 'Medium',
+            status TEXT DEFAULT 'pending',
+            due_date TEXT,
+            created_at TEXT DEFAULT datetime('now'),
+            updated_at TEXT DEFAULT datetime('now'),
+            collab_list_id BIGINT,
+            archived INTEGER DEFAULT 0,
+            seq BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tasks_personal_board
+        ON tasks (user_id, collab_list_id, archived, created_at, id)
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_list_board ON tasks (collab_list_id, archived, created_at, id)')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tasks_due
+        ON tasks (user_id, due_date)
+        WHERE due_date IS NOT NULL AND archived = 0
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_list_status ON tasks (collab_list_id, archived, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_personal_seq ON tasks (user_id, collab_list_id, seq)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_list_seq ON tasks (collab_list_id, seq)')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS task_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value BIGINT NOT NULL,
+            pruned_through BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('INSERT INTO task_seq (id, value) VALUES (1, 0) ON CONFLICT DO NOTHING')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS task_tombstones (
+            task_id BIGINT NOT NULL,
+            user_id BIGINT,
+            collab_list_id BIGINT,
+            seq BIGINT NOT NULL,
+            deleted_at TEXT DEFAULT datetime('now')
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_task_tombstones_seq ON task_tombstones (seq)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS task_events (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            list_id BIGINT NOT NULL,
+            task_id BIGINT NOT NULL,
+            kind TEXT NOT NULL,
+            created_at TEXT DEFAULT datetime('now')
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS board_versions (
+            board TEXT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    ''')
+
+    # Stamping takes the task_seq row lock until commit, so seq values become
+    # visible in order and a sync client never skips a later-committed lower one
+    c.execute('''
+        CREATE OR REPLACE FUNCTION tasks_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE task_seq SET value = value + 1 RETURNING value INTO NEW.seq;
+            RETURN NEW;
+        END
+        $$
+    ''')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION tasks_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            stamp BIGINT;
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (
+                    OLD.collab_list_id IS DISTINCT FROM NEW.collab_list_id
+                    OR (OLD.collab_list_id IS NULL AND OLD.user_id IS DISTINCT FROM NEW.user_id))) THEN
+                -- The board the task left (or was deleted from) changes too
+                UPDATE task_seq SET value = value + 1 RETURNING value INTO stamp;
+                INSERT INTO board_versions (board, version)
+                VALUES (CASE WHEN OLD.collab_list_id IS NULL THEN 'u' || OLD.user_id
+                             ELSE 'l' || OLD.collab_list_id END, stamp)
+                ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO task_tombstones (task_id, user_id, collab_list_id, seq)
+                VALUES (OLD.id, OLD.user_id, OLD.collab_list_id, stamp);
+                IF OLD.collab_list_id IS NOT NULL THEN
+                    INSERT INTO task_events (list_id, task_id, kind) VALUES (OLD.collab_list_id, OLD.id, 'task_deleted');
+                END IF;
+                RETURN OLD;
+            END IF;
+            INSERT INTO board_versions (board, version)
+            VALUES (CASE WHEN NEW.collab_list_id IS NULL THEN 'u' || NEW.user_id
+                         ELSE 'l' || NEW.collab_list_id END, NEW.seq)
+            ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+            IF NEW.collab_list_id IS NOT NULL THEN
+                INSERT INTO task_events (list_id, task_id, kind)
+                VALUES (NEW.collab_list_id, NEW.id, CASE
+                    WHEN TG_OP = 'INSERT' THEN 'task_created'
+                    WHEN NEW.status IS DISTINCT FROM OLD.status THEN 'task_moved'
+                    ELSE 'task_updated' END);
+            END IF;
+            RETURN NEW;
+        END
+        $$
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS tasks_stamp ON tasks')
+    c.execute('CREATE TRIGGER tasks_stamp BEFORE INSERT OR UPDATE ON tasks FOR EACH ROW EXECUTE FUNCTION tasks_stamp()')
+    c.execute('DROP TRIGGER IF EXISTS tasks_changed ON tasks')
+    c.execute('''
+        CREATE TRIGGER tasks_changed AFTER INSERT OR UPDATE OR DELETE ON tasks
+        FOR EACH ROW EXECUTE FUNCTION tasks_changed()
+    ''')
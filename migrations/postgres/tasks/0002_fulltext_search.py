@@ -0,0 +1,18 @@
+"""Full-text search over task title and description.
+
+Instead of an FTS5 table kept in sync by triggers, a GIN expression index
+over task_document(): title weighted A, description B, the 'simple'
+configuration (no stemming or stop words, like SQLite's unicode61).
+tasks.search_tasks matches with task_document(title, description) @@ query.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE OR REPLACE FUNCTION task_document(title text, description text) RETURNS tsvector
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+        $$
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING gin (task_document(title, description))')
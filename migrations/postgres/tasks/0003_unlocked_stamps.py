@@ -0,0 +1,69 @@
+"""Stamp task changes with change_stamp() instead of the task_seq row.
+
+0001 stamped every write from the single task_seq row and held its lock
+until commit, so Postgres writers took turns just as they do on SQLite.
+Stamps now come from the writing transaction (migrations/postgres/users/0004)
+and task_seq becomes a view whose value is the commit-visibility watermark,
+so sync.py reads and prunes it unchanged.
+
+Board versions are overwritten with the stamp of the transaction that last
+changed the board, which no other transaction shares. task_events ids are no
+longer given out in commit order either; events.py follows the stamp column.
+"""
+
+
+def upgrade(c):
+    c.execute('UPDATE change_stamp_base SET base = GREATEST(base, (SELECT value + 1 FROM task_seq))')
+    c.execute('ALTER TABLE task_seq RENAME TO task_seq_state')
+    c.execute('ALTER TABLE task_seq_state DROP COLUMN value')
+    c.execute('CREATE VIEW task_seq AS SELECT id, change_watermark() AS value, pruned_through FROM task_seq_state')
+
+    c.execute('ALTER TABLE task_events ADD COLUMN stamp BIGINT NOT NULL DEFAULT change_stamp()')
+    c.execute('CREATE INDEX idx_task_events_stamp ON task_events (stamp)')
+
+    c.execute('''
+        CREATE OR REPLACE FUNCTION tasks_stamp() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.seq := change_stamp();
+            RETURN NEW;
+        END
+        $$
+    ''')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION tasks_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            stamp BIGINT;
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (
+                    OLD.collab_list_id IS DISTINCT FROM NEW.collab_list_id
+                    OR (OLD.collab_list_id IS NULL AND OLD.user_id IS DISTINCT FROM NEW.user_id))) THEN
+                -- The board the task left (or was deleted from) changes too
+                stamp := change_stamp();
+                INSERT INTO board_versions (board, version)
+                VALUES (CASE WHEN OLD.collab_list_id IS NULL THEN 'u' || OLD.user_id
+                             ELSE 'l' || OLD.collab_list_id END, stamp)
+                ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO task_tombstones (task_id, user_id, collab_list_id, seq)
+                VALUES (OLD.id, OLD.user_id, OLD.collab_list_id, stamp);
+                IF OLD.collab_list_id IS NOT NULL THEN
+                    INSERT INTO task_events (list_id, task_id, kind) VALUES (OLD.collab_list_id, OLD.id, 'task_deleted');
+                END IF;
+                RETURN OLD;
+            END IF;
+            INSERT INTO board_versions (board, version)
+            VALUES (CASE WHEN NEW.collab_list_id IS NULL THEN 'u' || NEW.user_id
+                         ELSE 'l' || NEW.collab_list_id END, NEW.seq)
+            ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+            IF NEW.collab_list_id IS NOT NULL THEN
+                INSERT INTO task_events (list_id, task_id, kind)
+                VALUES (NEW.collab_list_id, NEW.id, CASE
+                    WHEN TG_OP = 'INSERT' THEN 'task_created'
+                    WHEN NEW.status IS DISTINCT FROM OLD.status THEN 'task_moved'
+                    ELSE 'task_updated' END);
+            END IF;
+            RETURN NEW;
+        END
+        $$
+    ''')
@@ -0,0 +1,18 @@
+"""SQL functions standing in for the SQLite built-ins the app's queries use.
+
+datetime(value[, modifier]) returns SQLite's 'YYYY-MM-DD HH:MM:SS' text in
+UTC, so timestamps are stored, compared and returned exactly as with SQLite:
+datetime('now'), datetime('now', '+1 hour'), datetime('now', '-30 days').
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE OR REPLACE FUNCTION datetime(value text, modifier text DEFAULT NULL) RETURNS text
+        LANGUAGE sql STABLE AS $$
+            SELECT to_char(
+                CASE WHEN value = 'now' THEN statement_timestamp() AT TIME ZONE 'UTC' ELSE value::timestamp END
+                    + COALESCE(modifier::interval, interval '0'),
+                'YYYY-MM-DD HH24:MI:SS')
+        $$
+    ''')
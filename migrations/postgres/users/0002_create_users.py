@@ -0,0 +1,20 @@
+"""Create the users table (migrations/users/0001-0002 in the SQLite schema)"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            name TEXT NOT NULL,
+            reset_token TEXT,
+            reset_token_expires TEXT,
+            created_at TEXT DEFAULT datetime('now')
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_reset_token
+        ON users (reset_token) WHERE reset_token IS NOT NULL
+    ''')
@@ -0,0 +1,24 @@
+"""Change counter for user names (migrations/users/0004 in the SQLite schema)"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value BIGINT NOT NULL
+        )
+    ''')
+    c.execute('INSERT INTO user_seq (id, value) VALUES (1, 0) ON CONFLICT DO NOTHING')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION users_name_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE user_seq SET value = value + 1;
+            RETURN NULL;
+        END
+        $$
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS users_name_seq ON users')
+    c.execute('''
+        CREATE TRIGGER users_name_seq AFTER UPDATE OF name ON users
+        FOR EACH ROW WHEN (NEW.name IS DISTINCT FROM OLD.name) EXECUTE FUNCTION users_name_changed()
+    ''')
@@ -0,0 +1,34 @@
+"""Change stamps taken without a lock, shared by the tasks and collab_lists
+triggers (Postgres only; SQLite has a single writer and keeps its counters).
+
+A change is stamped with its transaction id plus change_stamp_base, so
+concurrent writers never wait on each other for a stamp. Stamps are unique
+per transaction but not handed out in commit order: a transaction may commit
+after a later one. change_watermark() is one below the oldest transaction
+still running in the reader's snapshot; every change stamped at or below it
+is already visible, so a sync that stops there and next time asks for
+anything above it never skips a late commit (it may see a change twice).
+
+base keeps new stamps above those handed out before this migration (and
+above the SQLite ones migrations/to_postgres.py copies in); it only grows.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_stamp_base (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            base BIGINT NOT NULL
+        )
+    ''')
+    c.execute('INSERT INTO change_stamp_base (id, base) VALUES (1, 0) ON CONFLICT DO NOTHING')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION change_stamp() RETURNS BIGINT LANGUAGE sql AS $$
+            SELECT pg_current_xact_id()::text::bigint + base FROM change_stamp_base
+        $$
+    ''')
+    c.execute('''
+        CREATE OR REPLACE FUNCTION change_watermark() RETURNS BIGINT LANGUAGE sql STABLE AS $$
+            SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint - 1 + base FROM change_stamp_base
+        $$
+    ''')
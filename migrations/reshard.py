@@ -0,0 +1,366 @@
+#migrations/reshard.py
+# Shard the tasks over several SQLite files and move boards between shards
+# (see shards.py):
+#
+#   python -m migrations.reshard status                  tasks and boards per shard
+#   python -m migrations.reshard split N                 shard an unsharded install over N files
+#   python -m migrations.reshard add K                   add K empty shards
+#   python -m migrations.reshard move BOARD SHARD        move one board ('u<user_id>' or 'l<list_id>')
+#   python -m migrations.reshard rebalance [--dry-run]   move boards until the shards hold about as many tasks
+#
+# Stop the app first: every process caches the shard map and the number of
+# shards. New shards are built as tasks-<n>.db.partial - the tasks
+# migrations plus the shard's id range - and renamed into place last, so an
+# interrupted run leaves the app as it was. split copies each board to shard
+# board id % N, the shard it would have been given anyway, and leaves the
+# tasks in tasks.db (or todo.db) as a backup the app no longer reads.
+#
+# A move copies the board's rows and tombstones to the new shard, then
+# switches the shard map, then deletes the rows from the old shard without a
+# trace (no tombstones, events or board version), so syncing clients see the
+# tasks as changed rather than deleted. Each step can be rerun: a move that
+# was cut short is finished, or redone, by running it again. Task ids keep
+# their value.
+#
+# Sync tokens carry one counter per shard, so clients do a full resync after
+# split or add.
+
+import os
+import sqlite3
+import sys
+import time
+
+import db
+import migrations
+import shards
+
+PARTIAL_SUFFIX = '.partial'
+
+# Board key of a task row, as in board_versions
+_BOARD = "CASE WHEN collab_list_id IS NULL THEN 'u' || user_id ELSE 'l' || collab_list_id END"
+
+
+class ReshardError(RuntimeError):
+    pass
+
+
+def _log(message):
+    print(f'[reshard] {message}', flush=True)
+
+
+def _check():
+    if db.BACKEND != 'sqlite':
+        raise ReshardError('sharded task storage is SQLite only')
+    for name in migrations.databases():
+        current, latest = migrations.status(name)
+        if current != latest:
+            raise ReshardError(f'{name} is at schema version {current}, the code expects {latest}; '
+                               f'run python -m migrations first')
+
+
+def _check_sharded():
+    if not shards.enabled():
+        raise ReshardError('tasks are not sharded; run split first')
+
+
+def _board_filter(key):
+    """(WHERE clause, params) matching a board's rows in tasks or task_tombstones"""
+    if len(key) < 2 or key[0] not in 'ul' or not key[1:].isdigit():
+        raise ReshardError(f"{key!r} is not a board: use 'u<user_id>' or 'l<list_id>'")
+    if key[0] == 'u':
+        return 'collab_list_id IS NULL AND user_id = ?', (int(key[1:]),)
+    return 'collab_list_id = ?', (int(key[1:]),)
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def _shard_path(shard):
+    return db.db_path(db.shard_name(shard))
+
+
+def _build_shard(shard):
+    """Create an empty shard in <file>.partial: the tasks schema and the shard's id range"""
+    path = _shard_path(shard) + PARTIAL_SUFFIX
+    if os.path.exists(path):
+        # Left by an interrupted run
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        migrations.migrate_connection(conn, db.shard_name(shard))
+        first, end = shards.id_range(shard)
+        # New tasks take next_id (tasks._insert_sql); the trigger moves it on
+        conn.execute('''
+            CREATE TABLE task_ids (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                next_id INTEGER NOT NULL,
+                end_id INTEGER NOT NULL,
+                CHECK (next_id < end_id)
+            )
+        ''')
+        conn.execute('INSERT INTO task_ids (id, next_id, end_id) VALUES (1, ?, ?)', (first, end))
+        conn.execute('''
+        CREATE TRIGGER task_ids_take AFTER INSERT ON tasks
+        WHEN new.id = (SELECT next_id FROM task_ids) BEGIN
+            UPDATE task_ids SET next_id = new.id + 1;
+        END
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def _columns(conn):
+    return ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(tasks)'))
+
+
+def _counters(conn):
+    """(task_seq, newest task event) of a shard, to tell the rows a copy or delete adds"""
+    return conn.execute('SELECT (SELECT value FROM main.task_seq), '
+                        '(SELECT COALESCE(MAX(id), 0) FROM main.task_events)').fetchone()
+
+
+def _forget_changes(conn, counters):
+    """Drop the tombstones and events written since counters: the rows weren't deleted, only moved"""
+    seq, event = counters
+    conn.execute('DELETE FROM main.task_tombstones WHERE seq > ?', (seq,))
+    conn.execute('DELETE FROM main.task_events WHERE id > ?', (event,))
+
+
+def _placements():
+    conn = db.get_connection('users')
+    try:
+        return dict(conn.execute('SELECT board, shard FROM task_shard_map').fetchall())
+    finally:
+        conn.close()
+
+
+def _place(placements):
+    conn = db.get_connection('users')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany('INSERT OR REPLACE INTO task_shard_map (board, shard) VALUES (?, ?)', placements)
+        conn.commit()
+    finally:
+        conn.close()
+    shards.forget()
+
+
+def _publish(paths):
+    for path in paths:
+        os.rename(path, path[:-len(PARTIAL_SUFFIX)])
+    # Re-detect the shard files
+    db.close_all()
+
+
+def split(count):
+    """Shard an unsharded install over count files"""
+    _check()
+    if shards.enabled():
+        raise ReshardError(f'tasks are already sharded over {shards.count()} files; use add and rebalance')
+    if not 2 <= count <= shards.MAX_SHARDS:
+        raise ReshardError(f'the number of shards must be between 2 and {shards.MAX_SHARDS}')
+    source = db.db_path('tasks')
+    conn = _open(source)
+    try:
+        top = conn.execute('SELECT COALESCE(MAX(id), 0) FROM tasks').fetchone()[0]
+        boards = [row[0] for row in conn.execute(f'SELECT DISTINCT {_BOARD} FROM tasks')]
+        total = conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+    finally:
+        conn.close()
+    if top >= shards.id_range(0)[0]:
+        raise ReshardError(f'task id {top} is inside the ids reserved for shards')
+
+    started = time.perf_counter()
+    paths = []
+    copied = 0
+    for shard in range(count):
+        path = _build_shard(shard)
+        paths.append(path)
+        conn = _open(path)
+        try:
+            conn.execute('ATTACH DATABASE ? AS src', (source,))
+            conn.execute('BEGIN IMMEDIATE')
+            columns = _columns(conn)
+            rows = conn.execute(f'''
+                INSERT INTO main.tasks ({columns})
+                SELECT {columns} FROM src.tasks
+                WHERE (CASE WHEN collab_list_id IS NULL THEN user_id ELSE collab_list_id END) % ? = ?
+                ORDER BY id
+            ''', (count, shard)).rowcount
+            # Copies, not news for live boards
+            conn.execute('DELETE FROM main.task_events')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        copied += rows
+        _log(f'{db.shard_name(shard)}: {rows} tasks')
+    if copied != total:
+        raise ReshardError(f'copied {copied} tasks, the source has {total}; the shards were not switched on')
+
+    _place([(key, int(key[1:]) % count) for key in boards])
+    _publish(paths)
+    _log(f'{total} tasks in {len(boards)} boards split over {count} shards in {time.perf_counter() - started:.1f} s; '
+         f'start the app. The tasks in {source} are no longer used.')
+
+
+def add(extra):
+    """Add extra empty shards; existing boards stay where they are"""
+    _check()
+    _check_sharded()
+    count = shards.count()
+    if extra < 1 or count + extra > shards.MAX_SHARDS:
+        raise ReshardError(f'there can be at most {shards.MAX_SHARDS} shards')
+    _publish([_build_shard(shard) for shard in range(count, count + extra)])
+    _log(f'{count + extra} shards; new boards spread over all of them. Run rebalance to move existing ones.')
+
+
+def _drop_board(name, key):
+    """Delete a board's rows from one shard without a trace; returns the rows deleted"""
+    where, params = _board_filter(key)
+    conn = _open(db.db_path(name))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        counters = _counters(conn)
+        deleted = conn.execute(f'DELETE FROM main.tasks WHERE {where}', params).rowcount
+        _forget_changes(conn, counters)
+        conn.execute('DELETE FROM main.board_versions WHERE board = ?', (key,))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return deleted
+
+
+def move(key, target):
+    """Move one board to shard target; returns the tasks moved"""
+    where, params = _board_filter(key)
+    _check_sharded()
+    if not 0 <= target < shards.count():
+        raise ReshardError(f'there is no shard {target}; shards are 0 to {shards.count() - 1}')
+    source = _placements().get(key, int(key[1:]) % shards.count())
+    moved = 0
+    if source != target:
+        conn = _open(_shard_path(target))
+        try:
+            conn.execute('ATTACH DATABASE ? AS src', (_shard_path(source),))
+            conn.execute('BEGIN IMMEDIATE')
+            counters = _counters(conn)
+            # Leftovers of an earlier, interrupted move
+            conn.execute(f'DELETE FROM main.tasks WHERE {where}', params)
+            _forget_changes(conn, counters)
+            # Clients that no longer read the old shard still need its deletions
+            conn.execute('UPDATE main.task_seq SET value = value + 1')
+            conn.execute(f'''
+                INSERT INTO main.task_tombstones (task_id, user_id, collab_list_id, seq, deleted_at)
+                SELECT task_id, user_id, collab_list_id, (SELECT value FROM main.task_seq), deleted_at
+                FROM src.task_tombstones WHERE {where}
+            ''', params)
+            columns = _columns(conn)
+            moved = conn.execute(f'INSERT INTO main.tasks ({columns}) SELECT {columns} FROM src.tasks '
+                                 f'WHERE {where} ORDER BY id', params).rowcount
+            # Copies, not news for live boards
+            conn.execute('DELETE FROM main.task_events WHERE id > ?', (counters[1],))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+    _place([(key, target)])
+    strays = sum(_drop_board(name, key) for name in shards.all_databases() if name != db.shard_name(target))
+    if strays != moved:
+        _log(f'{key}: removed {strays} rows from other shards, {moved} were copied')
+    return moved
+
+
+def _loads():
+    """{shard: {board: tasks}} of the boards on the shard the map places them on"""
+    placements = _placements()
+    loads = {}
+    for shard in range(shards.count()):
+        conn = _open(_shard_path(shard))
+        try:
+            boards = conn.execute(f'SELECT {_BOARD} AS board, COUNT(*) FROM tasks GROUP BY board').fetchall()
+        finally:
+            conn.close()
+        loads[shard] = {key: tasks for key, tasks in boards
+                        if placements.get(key, int(key[1:]) % shards.count()) == shard}
+    return loads
+
+
+def plan_rebalance(loads):
+    """Greedy moves [(board, tasks, from, to)] evening out the task counts of the shards"""
+    totals = {shard: sum(boards.values()) for shard, boards in loads.items()}
+    boards = {shard: dict(boards) for shard, boards in loads.items()}
+    moves = []
+    while True:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        # The board that brings the two closest together; it must shrink the gap
+        candidates = [(abs(gap - 2 * tasks), key, tasks) for key, tasks in boards[heaviest].items() if tasks < gap]
+        if not candidates:
+            return moves
+        _, key, tasks = min(candidates)
+        del boards[heaviest][key]
+        boards[lightest][key] = tasks
+        totals[heaviest] -= tasks
+        totals[lightest] += tasks
+        moves.append((key, tasks, heaviest, lightest))
+
+
+def rebalance(dry_run=False):
+    _check()
+    _check_sharded()
+    moves = plan_rebalance(_loads())
+    for key, tasks, source, target in moves:
+        _log(f'{"would move" if dry_run else "moving"} {key} ({tasks} tasks) from shard {source} to {target}')
+        if not dry_run:
+            move(key, target)
+    _log(f'{len(moves)} board(s) {"to move" if dry_run else "moved"}')
+
+
+def status():
+    _check_sharded()
+    loads = _loads()
+    for shard in range(shards.count()):
+        conn = _open(_shard_path(shard))
+        try:
+            total = conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+        finally:
+            conn.close()
+        placed = sum(loads[shard].values())
+        strays = f', {total - placed} stray rows (rerun their move)' if total != placed else ''
+        _log(f'{db.shard_name(shard)}: {placed} tasks in {len(loads[shard])} boards{strays}')
+
+
+USAGE = 'usage: python -m migrations.reshard status | split N | add K | move BOARD SHARD | rebalance [--dry-run]'
+
+
+def main(argv):
+    command, args = (argv[0], argv[1:]) if argv else (None, [])
+    try:
+        if command == 'status' and not args:
+            status()
+        elif command == 'split' and len(args) == 1 and args[0].isdigit():
+            split(int(args[0]))
+        elif command == 'add' and len(args) == 1 and args[0].isdigit():
+            add(int(args[0]))
+        elif command == 'move' and len(args) == 2 and args[1].isdigit():
+            _check()
+            _log(f'{args[0]}: {move(args[0], int(args[1]))} tasks moved to shard {args[1]}')
+        elif command == 'rebalance' and args in ([], ['--dry-run']):
+            rebalance(dry_run=bool(args))
+        else:
+            print(USAGE, file=sys.stderr)
+            return 2
+    except ReshardError as e:
+        _log(f'error: {e}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
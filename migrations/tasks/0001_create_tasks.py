@@ -0,0 +1,24 @@
+"""Create the tasks table (adds the archived column to pre-archive databases)"""
+
+
+def upgrade(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        priority TEXT DEFAULT 'Medium',
+        status TEXT DEFAULT 'pending',
+        due_date TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        collab_list_id INTEGER,
+        archived INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (collab_list_id) REFERENCES collab_lists(id)
+    )
+    ''')
+    c.execute('PRAGMA main.table_info(tasks)')
+    if 'archived' not in [row[1] for row in c.fetchall()]:
+        c.execute('ALTER TABLE main.tasks ADD COLUMN archived INTEGER DEFAULT 0')
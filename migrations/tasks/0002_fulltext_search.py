@@ -0,0 +1,33 @@
+"""FTS5 index over task title/description, kept in sync by triggers"""
+
+
+def upgrade(c):
+    c.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'tasks_fts'")
+    fts_exists = c.fetchone() is not None
+    c.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS main.tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    ''')
+    if not fts_exists:
+        # Index tasks that were created before the FTS table existed
+        c.execute("INSERT INTO main.tasks_fts (tasks_fts) VALUES ('rebuild')")
@@ -0,0 +1,24 @@
+"""Composite indexes for the hot board query shapes.
+
+archived is normalized to 0/1 so it can be an equality column in the index:
+  personal board  user_id = ? AND collab_list_id IS NULL AND archived = ?
+                  ORDER BY created_at DESC, id DESC
+  list board      collab_list_id = ? AND archived = ?
+                  ORDER BY created_at DESC, id DESC
+  archived view   the same two shapes with archived = 1
+Both are walked in index order, so pages need no sort step.
+"""
+
+
+def upgrade(c):
+    c.execute('UPDATE main.tasks SET archived = 0 WHERE archived IS NULL')
+    c.execute('DROP INDEX IF EXISTS main.idx_tasks_personal_board')
+    c.execute('DROP INDEX IF EXISTS main.idx_tasks_list_board')
+    c.execute('''
+        CREATE INDEX main.idx_tasks_personal_board
+        ON tasks (user_id, collab_list_id, archived, created_at, id)
+    ''')
+    c.execute('''
+        CREATE INDEX main.idx_tasks_list_board
+        ON tasks (collab_list_id, archived, created_at, id)
+    ''')
@@ -0,0 +1,9 @@
+"""Partial index for due-date lookups on open tasks"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS main.idx_tasks_due
+        ON tasks (user_id, due_date)
+        WHERE due_date IS NOT NULL AND archived = 0
+    ''')
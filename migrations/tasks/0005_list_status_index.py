@@ -0,0 +1,8 @@
+"""Covering index for per-list task counts by status (sidebar badges)"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS main.idx_tasks_list_status
+        ON tasks (collab_list_id, archived, status)
+    ''')
@@ -0,0 +1,54 @@
+"""Change sequence and delete tombstones for delta sync.
+
+Every insert/update stamps the row with the next value of task_seq; every
+delete leaves a tombstone with its own sequence number. Clients ask for
+everything with a sequence above the last one they saw.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS main.task_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL,
+            pruned_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO main.task_seq (id, value) VALUES (1, 0)')
+
+    c.execute('PRAGMA main.table_info(tasks)')
+    if 'seq' not in [row[1] for row in c.fetchall()]:
+        c.execute('ALTER TABLE main.tasks ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS main.task_tombstones (
+            task_id INTEGER NOT NULL,
+            user_id INTEGER,
+            collab_list_id INTEGER,
+            seq INTEGER NOT NULL,
+            deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS main.idx_task_tombstones_seq ON task_tombstones (seq)')
+    c.execute('CREATE INDEX IF NOT EXISTS main.idx_tasks_personal_seq ON tasks (user_id, collab_list_id, seq)')
+    c.execute('CREATE INDEX IF NOT EXISTS main.idx_tasks_list_seq ON tasks (collab_list_id, seq)')
+
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_seq_insert AFTER INSERT ON tasks BEGIN
+        UPDATE task_seq SET value = value + 1;
+        UPDATE tasks SET seq = (SELECT value FROM task_seq) WHERE id = new.id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_seq_update AFTER UPDATE ON tasks WHEN new.seq = old.seq BEGIN
+        UPDATE task_seq SET value = value + 1;
+        UPDATE tasks SET seq = (SELECT value FROM task_seq) WHERE id = new.id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.tasks_seq_delete AFTER DELETE ON tasks BEGIN
+        UPDATE task_seq SET value = value + 1;
+        INSERT INTO task_tombstones (task_id, user_id, collab_list_id, seq)
+        VALUES (old.id, old.user_id, old.collab_list_id, (SELECT value FROM task_seq));
+    END
+    ''')
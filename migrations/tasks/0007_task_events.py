@@ -0,0 +1,37 @@
+"""Short-lived change feed of collaborative task events for live board updates.
+
+The seq triggers re-UPDATE the row they stamp; those inner updates change
+seq, so the WHEN new.seq = old.seq guard keeps them out of the feed.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS main.task_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            list_id INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.task_events_insert AFTER INSERT ON tasks
+    WHEN new.collab_list_id IS NOT NULL BEGIN
+        INSERT INTO task_events (list_id, task_id, kind) VALUES (new.collab_list_id, new.id, 'task_created');
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.task_events_update AFTER UPDATE ON tasks
+    WHEN new.collab_list_id IS NOT NULL AND new.seq = old.seq BEGIN
+        INSERT INTO task_events (list_id, task_id, kind)
+        VALUES (new.collab_list_id, new.id,
+                CASE WHEN new.status IS NOT old.status THEN 'task_moved' ELSE 'task_updated' END);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.task_events_delete AFTER DELETE ON tasks
+    WHEN old.collab_list_id IS NOT NULL BEGIN
+        INSERT INTO task_events (list_id, task_id, kind) VALUES (old.collab_list_id, old.id, 'task_deleted');
+    END
+    ''')
@@ -0,0 +1,54 @@
+"""Per-board version numbers for cheap ETags.
+
+board is 'u<user_id>' for a personal board and 'l<list_id>' for a list.
+The version is bumped from task_seq whenever a task on the board is
+stamped with a new seq (insert/update), moved away or deleted, so checking whether a
+board changed is a single primary-key lookup.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS main.board_versions (
+            board TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # Fires for the seq-stamping UPDATE issued by tasks_seq_insert/tasks_seq_update
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.board_versions_stamp AFTER UPDATE OF seq ON tasks
+    WHEN new.seq != old.seq BEGIN
+        INSERT INTO board_versions (board, version)
+        VALUES (CASE WHEN new.collab_list_id IS NULL THEN 'u' || new.user_id ELSE 'l' || new.collab_list_id END,
+                new.seq)
+        ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+    END
+    ''')
+    # A task moved between boards also changes the board it left
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.board_versions_move AFTER UPDATE OF user_id, collab_list_id ON tasks
+    WHEN old.collab_list_id IS NOT new.collab_list_id
+      OR (old.collab_list_id IS NULL AND old.user_id IS NOT new.user_id) BEGIN
+        UPDATE task_seq SET value = value + 1;
+        INSERT INTO board_versions (board, version)
+        VALUES (CASE WHEN old.collab_list_id IS NULL THEN 'u' || old.user_id ELSE 'l' || old.collab_list_id END,
+                (SELECT value FROM task_seq))
+        ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS main.board_versions_delete AFTER DELETE ON tasks BEGIN
+        UPDATE task_seq SET value = value + 1;
+        INSERT INTO board_versions (board, version)
+        VALUES (CASE WHEN old.collab_list_id IS NULL THEN 'u' || old.user_id ELSE 'l' || old.collab_list_id END,
+                (SELECT value FROM task_seq))
+        ON CONFLICT (board) DO UPDATE SET version = excluded.version;
+    END
+    ''')
+    # Seed boards that already have tasks
+    c.execute('''
+        INSERT OR REPLACE INTO board_versions (board, version)
+        SELECT CASE WHEN collab_list_id IS NULL THEN 'u' || user_id ELSE 'l' || collab_list_id END, MAX(seq)
+        FROM tasks
+        GROUP BY collab_list_id IS NULL, CASE WHEN collab_list_id IS NULL THEN user_id ELSE collab_list_id END
+    ''')
@@ -0,0 +1,180 @@
+#migrations/to_postgres.py
+# Move an SQLite installation (either layout) into PostgreSQL:
+#
+#   TODO_DATABASE_URL=postgresql://... python -m migrations.to_postgres [DATA_DIR]
+#
+# Stop the app first. The PostgreSQL schema is created with its migrations,
+# then every table is streamed through COPY in one transaction, with the
+# triggers switched off so rows keep their seq values: tombstones and board
+# versions come along unchanged. PostgreSQL stamps changes without counters
+# (migrations/postgres/users/0004); its stamps start above the SQLite
+# counters and the prune marks are copied, so sync tokens handed out by the
+# SQLite install stay valid. The short-lived event feeds
+# are not copied. Identity sequences continue after the highest id SQLite
+# ever used. The SQLite files are only read.
+
+import os
+import sqlite3
+import sys
+import time
+
+import db
+import db_postgres
+import migrations
+
+# (logical database, table, has an identity id), in load order
+TABLES = (
+    ('users', 'users', True),
+    ('users', 'user_seq', False),
+    ('collab_lists', 'collab_lists', True),
+    ('collab_lists', 'list_members', False),
+    ('collab_lists', 'list_member_tombstones', False),
+    ('tasks', 'tasks', True),
+    ('tasks', 'task_tombstones', False),
+    ('tasks', 'board_versions', False),
+)
+# SQLite change counters, views over the stamp watermark in PostgreSQL
+COUNTERS = (
+    ('collab_lists', 'list_seq'),
+    ('tasks', 'task_seq'),
+)
+# Tables whose triggers would restamp or log the copied rows
+TRIGGERED = ('tasks', 'collab_lists', 'list_members')
+
+
+class PostgresImportError(RuntimeError):
+    pass
+
+
+def _log(message):
+    print(f'[to_postgres] {message}', flush=True)
+
+
+def sources(data_dir):
+    """(logical database -> SQLite file, layout)"""
+    single = os.path.join(data_dir, db.SINGLE_DATABASE)
+    if os.path.exists(single):
+        return {name: single for name in migrations.DATABASES}, 'single'
+    return {name: os.path.join(data_dir, db.DATABASES[name]) for name in migrations.DATABASES}, 'split'
+
+
+def _open_source(path):
+    if not os.path.exists(path):
+        raise PostgresImportError(f'{path} is missing')
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+
+def _check_sources(paths, layout):
+    for name, path in paths.items():
+        source = _open_source(path)
+        try:
+            table = migrations.version_table(name, layout)
+            stored = source.execute(f'SELECT MAX(version) FROM {table}').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            stored = 0
+        finally:
+            source.close()
+        latest = migrations.latest_version(name, 'sqlite')
+        if stored != latest:
+            raise PostgresImportError(f'{path}: {name} is at schema version {stored}, the code expects {latest}; '
+                                      f'run python -m migrations against it first (without TODO_DATABASE_URL)')
+
+
+def _columns(c, table):
+    c.execute('SELECT column_name FROM information_schema.columns '
+              'WHERE table_schema = current_schema() AND table_name = ? ORDER BY ordinal_position', (table,))
+    return [row[0] for row in c.fetchall()]
+
+
+def _copy_table(c, source, table, identity):
+    source_columns = {row[1] for row in source.execute(f'PRAGMA table_info({table})')}
+    columns = [column for column in _columns(c, table) if column in source_columns]
+    if table.endswith('_seq'):
+        # The migration created the counter row
+        c.execute(f'DELETE FROM {table}')
+    rows = source.execute(f"SELECT {', '.join(columns)} FROM {table}")
+    copied = db_postgres.copy_rows(c.connection, table, columns, rows)
+    if identity:
+        # AUTOINCREMENT never reuses ids, even those of deleted rows
+        last = source.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+        c.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+        top = max(c.fetchone()[0], last[0] if last else 0)
+        if top:
+            c.execute("SELECT setval(pg_get_serial_sequence(?, 'id'), ?)", (table, top))
+    return copied
+
+
+def _copy_counter(c, source, table):
+    value, pruned_through = source.execute(f'SELECT value, pruned_through FROM {table}').fetchone()
+    c.execute(f'UPDATE {table} SET pruned_through = ?', (pruned_through,))
+    c.execute('UPDATE change_stamp_base SET base = GREATEST(base, ?)', (value + 1,))
+    return value
+
+
+def run(data_dir=None):
+    if db.BACKEND != 'postgres':
+        raise PostgresImportError('set TODO_DATABASE_URL to the PostgreSQL database to import into')
+    data_dir = data_dir or db.DATA_DIR
+    if db.shard_files(data_dir):
+        raise PostgresImportError('the tasks are sharded (see migrations/reshard.py), which this import does not read')
+    paths, layout = sources(data_dir)
+    _check_sources(paths, layout)
+
+    for name in migrations.DATABASES:
+        for migration in migrations.migrate(name):
+            _log(f'{name}: applied {migration.version:04d}_{migration.name}')
+
+    conn = db.get_connection('users')
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM tasks) '
+                  'OR EXISTS (SELECT 1 FROM collab_lists)')
+        if c.fetchone()[0]:
+            raise PostgresImportError('the PostgreSQL database already has data; import into an empty one')
+        for table in TRIGGERED:
+            c.execute(f'ALTER TABLE {table} DISABLE TRIGGER USER')
+        started = time.perf_counter()
+        for name, table, identity in TABLES:
+            source = _open_source(paths[name])
+            try:
+                table_started = time.perf_counter()
+                copied = _copy_table(c, source, table, identity)
+                _log(f'{table}: {copied} rows in {time.perf_counter() - table_started:.1f} s')
+            finally:
+                source.close()
+        for name, table in COUNTERS:
+            source = _open_source(paths[name])
+            try:
+                _log(f'{table}: stamps continue above {_copy_counter(c, source, table)}')
+            finally:
+                source.close()
+        for table in TRIGGERED:
+            c.execute(f'ALTER TABLE {table} ENABLE TRIGGER USER')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    conn = db.get_connection('users')
+    try:
+        # Fresh statistics, so the first queries get good plans
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    _log(f'done in {time.perf_counter() - started:.1f} s; start the app with the same TODO_DATABASE_URL')
+
+
+def main(argv):
+    try:
+        run(argv[0] if argv else None)
+    except PostgresImportError as e:
+        _log(f'error: {e}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
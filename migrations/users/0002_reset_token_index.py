@@ -0,0 +1,8 @@
+"""Index reset tokens so the password-reset lookup isn't a full scan of users"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_reset_token
+        ON users (reset_token) WHERE reset_token IS NOT NULL
+    ''')
@@ -0,0 +1,15 @@
+"""Shard map for sharded task storage (shards.py).
+
+board is 'u<user_id>' for a personal board and 'l<list_id>' for a list, as
+in board_versions; shard is the n of the tasks-<n>.db holding its tasks.
+Unused until the tasks are sharded.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS main.task_shard_map (
+            board TEXT PRIMARY KEY,
+            shard INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
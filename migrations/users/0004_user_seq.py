@@ -0,0 +1,20 @@
+"""Change counter for user names.
+
+/collab_lists shows each list's owner by name, so its version includes
+this counter: renaming yourself invalidates your lists' members' ETags.
+"""
+
+
+def upgrade(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO user_seq (id, value) VALUES (1, 0)')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS users_name_seq AFTER UPDATE OF name ON users WHEN new.name IS NOT old.name BEGIN
+        UPDATE user_seq SET value = value + 1;
+    END
+    ''')
@@ -0,0 +1,205 @@
+#passwords.py
+# Password hashing on a small, bounded process pool.
+#
+# bcrypt is deliberately slow (~250 ms at cost 12). Hashing inline would
+# hold a request thread - with sync gunicorn workers, the whole worker -
+# for that long, so every hash runs in a separate process instead. The pool
+# only accepts WORKERS + MAX_QUEUE jobs at a time; beyond that callers get
+# PoolBusy immediately and the route answers 429 instead of piling up. A job
+# keeps its slot until it actually finishes, even after its caller has
+# given up waiting. If a pool process dies the executor is unusable, so it
+# is replaced and the job retried once.
+#
+# Pool processes are started through multiprocessing's forkserver, so, as
+# with any multiprocessing code, scripts that import the app and hash
+# passwords need an `if __name__ == '__main__':` guard.
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+ROUNDS = int(os.environ.get('TODO_BCRYPT_ROUNDS', 12))
+# Processes per app worker; 0 hashes inline (debugging, tiny deployments)
+WORKERS = int(os.environ.get('TODO_BCRYPT_WORKERS', 2))
+# Jobs allowed to wait for a free process before new ones are rejected
+MAX_QUEUE = int(os.environ.get('TODO_BCRYPT_MAX_QUEUE', 8))
+# Longest a request waits for its result
+TIMEOUT_SECONDS = float(os.environ.get('TODO_BCRYPT_TIMEOUT', 5))
+RETRY_AFTER_SECONDS = 1
+
+# bcrypt only uses the first 72 bytes; bcrypt>=5 raises instead of truncating
+MAX_PASSWORD_BYTES = 72
+
+
+class PoolBusy(Exception):
+    """The hashing pool is saturated; try again shortly"""
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+_stats = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'rejected': 0, 'timeouts': 0, 'restarts': 0,
+          'hash_seconds': 0.0, 'queue_wait_seconds': 0.0, 'max_queue_wait_seconds': 0.0}
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+# These run in the pool processes: (result, started_at, seconds)
+
+def _hash_job(password, rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+    return hashed, started, time.time() - started
+
+
+def _check_job(stored_hash, password):
+    started = time.time()
+    if isinstance(stored_hash, str):
+        stored_hash = stored_hash.encode('utf-8')
+    try:
+        ok = bcrypt.checkpw(_encode(password), stored_hash)
+    except ValueError:
+        # Malformed stored hash
+        ok = False
+    return ok, started, time.time() - started
+
+
+def _get_pool():
+    """The pool for this process (a forked app worker gets its own)"""
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # forkserver: never fork an app process that may be running threads
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                # Preload only this module, not the app's __main__ (app.py, gunicorn, ...)
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+            _pool_pid = os.getpid()
+            # Jobs of a discarded pool release the semaphore they took
+            _slots = threading.BoundedSemaphore(WORKERS + MAX_QUEUE)
+        return _pool, _slots
+
+
+def _discard_pool(pool):
+    """Forget a broken pool so the next job starts a fresh one"""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _record(kind, submitted, started, seconds):
+    with _lock:
+        _stats[kind] += 1
+        _stats['hash_seconds'] += seconds
+        wait = max(0.0, started - submitted)
+        _stats['queue_wait_seconds'] += wait
+        _stats['max_queue_wait_seconds'] = max(_stats['max_queue_wait_seconds'], wait)
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def _run(kind, job, *args):
+    submitted = time.time()
+    if WORKERS <= 0:
+        result, started, seconds = job(*args)
+        _record(kind, submitted, started, seconds)
+        return result
+
+    for last_attempt in (False, True):
+        pool, slots = _get_pool()
+        try:
+            future = _submit(pool, slots, job, args)
+            result, started, seconds = future.result(timeout=TIMEOUT_SECONDS)
+        except TimeoutError:
+            # Only a queued job can be cancelled; a running one keeps its slot until it ends
+            future.cancel()
+            _count('timeouts')
+            raise PoolBusy()
+        except BrokenProcessPool:
+            # A pool process died (killed, out of memory) and the executor
+            # refuses all further work
+            _discard_pool(pool)
+            _count('restarts')
+            if last_attempt:
+                raise PoolBusy()
+            continue
+        _record(kind, submitted, started, seconds)
+        return result
+
+
+def _submit(pool, slots, job, args):
+    """Queue a job, holding a slot until the job is done"""
+    if not slots.acquire(blocking=False):
+        _count('rejected')
+        raise PoolBusy()
+    try:
+        future = pool.submit(job, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def hash_password(password, rounds=None):
+    """bcrypt hash (str) of a password at the configured cost. Raises PoolBusy"""
+    return _run('hashes', _hash_job, password, rounds or ROUNDS)
+
+
+def check_password(stored_hash, password):
+    """True if password matches stored_hash (str or bytes). Raises PoolBusy"""
+    if not stored_hash or password is None:
+        return False
+    return _run('checks', _check_job, stored_hash, password)
+
+
+def hash_cost(stored_hash):
+    """The bcrypt cost factor of a stored hash, or None if it can't be read"""
+    if isinstance(stored_hash, bytes):
+        stored_hash = stored_hash.decode('utf-8', 'replace')
+    try:
+        return int(stored_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(stored_hash):
+    """True if a stored hash wasn't made with the configured cost (or is stored as bytes)"""
+    return isinstance(stored_hash, bytes) or hash_cost(stored_hash) != ROUNDS
+
+
+def rehash_if_needed(stored_hash, password):
+    """New hash for a just-verified password if its cost is outdated, else None"""
+    if not needs_rehash(stored_hash):
+        return None
+    _count('rehashes')
+    return hash_password(password)
+
+
+def pool_stats():
+    """Hash counts and timings for this process"""
+    with _lock:
+        stats = dict(_stats)
+    done = stats['hashes'] + stats['checks']
+    stats['avg_hash_seconds'] = stats['hash_seconds'] / done if done else 0.0
+    stats['avg_queue_wait_seconds'] = stats['queue_wait_seconds'] / done if done else 0.0
+    stats['workers'] = WORKERS
+    stats['max_queue'] = MAX_QUEUE
+    stats['rounds'] = ROUNDS
+    return stats
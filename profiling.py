@@ -0,0 +1,244 @@
+#profiling.py
+# On-demand profiling of single requests, safe to leave enabled in production.
+#
+# With TODO_PROFILING=1, a request carrying "X-Todo-Profile: <flag>" (or
+# ?_profile=<flag>) runs under cProfile plus a stack sampler when either
+#   - <flag> equals TODO_PROFILE_TOKEN, or
+#   - the session user's id is listed in TODO_PROFILE_ADMINS (comma-separated)
+# Each capture writes to TODO_PROFILE_DIR (default ./profiles):
+#   <name>.collapsed  sampled stacks, one "root;...;leaf count" line each -
+#                     feed to flamegraph.pl or speedscope
+#   <name>.txt        per-function summary (cumulative and own time)
+#   <name>.pstats     raw cProfile data (snakeviz, pstats)
+# and the response names the capture in its X-Todo-Profile header.
+#
+# At most TODO_PROFILE_PER_MINUTE captures run per process per minute and
+# only one at a time; flagged requests beyond that run normally. Only the
+# newest TODO_PROFILE_KEEP captures are kept on disk.
+#
+# Under gunicorn's gevent worker the request is a greenlet and the threading
+# and time functions are gevent's. The sampler then runs on a real OS
+# thread, so it can interrupt the request, and follows the request's
+# greenlet: its frames while it runs, its suspended stack while it waits.
+
+import collections
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+from flask import current_app, g, request, session
+
+try:
+    from gevent.monkey import get_original
+except ImportError:
+    import _thread
+    _get_ident, _start_thread, _allocate_lock, _sleep = (
+        _thread.get_ident, _thread.start_new_thread, _thread.allocate_lock, time.sleep)
+else:
+    # The unpatched functions: sys._current_frames() is keyed by OS thread id
+    # and a greenlet sampler only runs when the request yields
+    _get_ident, _start_thread, _allocate_lock = get_original('_thread', ['get_ident', 'start_new_thread', 'allocate_lock'])
+    _sleep = get_original('time', 'sleep')
+
+ENABLED = os.environ.get('TODO_PROFILING', '0') == '1'
+TOKEN = os.environ.get('TODO_PROFILE_TOKEN')
+ADMINS = {int(user_id) for user_id in os.environ.get('TODO_PROFILE_ADMINS', '').split(',') if user_id.strip()}
+PROFILE_DIR = os.environ.get('TODO_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PER_MINUTE = int(os.environ.get('TODO_PROFILE_PER_MINUTE', 6))
+KEEP = int(os.environ.get('TODO_PROFILE_KEEP', 200))
+SAMPLE_INTERVAL = float(os.environ.get('TODO_PROFILE_INTERVAL_MS', 1)) / 1000
+SUMMARY_LINES = 40
+
+HEADER = 'X-Todo-Profile'
+QUERY_ARG = '_profile'
+SUFFIXES = ('.collapsed', '.txt', '.pstats')
+
+_lock = threading.Lock()
+_recent = collections.deque()
+# One capture at a time: cProfile hooks are process-wide on newer Pythons
+_busy = threading.Lock()
+
+
+class StackSampler:
+    """Samples the calling thread's (or greenlet's) Python stack every interval
+    from an OS thread, counting collapsed stacks"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.thread_id = _get_ident()
+        greenlet = sys.modules.get('greenlet')
+        self.greenlet = greenlet.getcurrent() if greenlet is not None else None
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopping = False
+        self._running = _allocate_lock()
+
+    def start(self):
+        # Returns once the sampler runs, as threading.Thread.start() does
+        started = _allocate_lock()
+        started.acquire()
+        self._running.acquire()
+        _start_thread(self._run, (started,))
+        started.acquire()
+
+    def _frame(self):
+        # A greenlet's gr_frame is set while it is switched out
+        frame = self.greenlet.gr_frame if self.greenlet is not None else None
+        return frame if frame is not None else sys._current_frames().get(self.thread_id)
+
+    def _run(self, started):
+        started.release()
+        try:
+            while not self._stopping:
+                _sleep(self.interval)
+                self._sample()
+        finally:
+            self._running.release()
+
+    def _sample(self):
+        frame = self._frame()
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == __file__:
+                # The request thread is inside the profiler's own start/stop
+                stack = []
+                break
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopping = True
+        with self._running:
+            pass
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _flag():
+    return request.headers.get(HEADER) or request.args.get(QUERY_ARG)
+
+
+def _authorized(flag):
+    if TOKEN and hmac.compare_digest(flag.encode(), TOKEN.encode()):
+        return True
+    return session.get('user_id') in ADMINS
+
+
+def _take_slot():
+    """Claim one of this minute's captures"""
+    now = time.monotonic()
+    with _lock:
+        while _recent and now - _recent[0] >= 60:
+            _recent.popleft()
+        if len(_recent) >= PER_MINUTE:
+            return False
+        _recent.append(now)
+        return True
+
+
+def _capture_name():
+    endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return f'{stamp}-{int(time.time() * 1000) % 1000:03d}-{request.method}-{endpoint}-{os.getpid()}'
+
+
+def _start_request():
+    flag = _flag()
+    if not flag or not _authorized(flag):
+        return
+    if not _busy.acquire(blocking=False):
+        return
+    if not _take_slot():
+        _busy.release()
+        return
+    sampler = StackSampler()
+    profiler = cProfile.Profile()
+    g.profile = {'name': _capture_name(), 'sampler': sampler, 'profiler': profiler,
+                 'started': time.perf_counter(), 'seconds': None, 'switch_interval': sys.getswitchinterval()}
+    # Let the sampler take the GIL every interval instead of every 5 ms
+    sys.setswitchinterval(SAMPLE_INTERVAL / 2)
+    sampler.start()
+    profiler.enable()
+
+
+def _stop(capture):
+    if capture['seconds'] is None:
+        capture['profiler'].disable()
+        capture['sampler'].stop()
+        sys.setswitchinterval(capture['switch_interval'])
+        capture['seconds'] = time.perf_counter() - capture['started']
+
+
+def _finish_request(response):
+    capture = g.get('profile')
+    if capture is not None:
+        _stop(capture)
+        response.headers[HEADER] = capture['name']
+    return response
+
+
+def _summary(capture, path):
+    out = io.StringIO()
+    out.write(f"{path}  {capture['seconds'] * 1000:.1f} ms  "
+              f"{sum(capture['sampler'].stacks.values())} samples\n\n")
+    stats = pstats.Stats(capture['profiler'], stream=out)
+    stats.strip_dirs()
+    out.write('--- by cumulative time ---\n')
+    stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    out.write('--- by own time ---\n')
+    stats.sort_stats('tottime').print_stats(SUMMARY_LINES)
+    return out.getvalue()
+
+
+def _prune():
+    names = sorted({name.rsplit('.', 1)[0] for name in os.listdir(PROFILE_DIR) if name.endswith(SUFFIXES)})
+    for name in names[:max(0, len(names) - KEEP)]:
+        for suffix in SUFFIXES:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def save(capture, path):
+    """Write a finished capture's three files; returns the base path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, capture['name'])
+    with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+        f.write(capture['sampler'].collapsed())
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(_summary(capture, path))
+    capture['profiler'].dump_stats(base + '.pstats')
+    _prune()
+    return base
+
+
+def _end_request(error=None):
+    # Saved at teardown so requests that raised are captured too
+    capture = g.pop('profile', None)
+    if capture is None:
+        return
+    try:
+        _stop(capture)
+        # path only: the query string may carry the profile token
+        save(capture, f'{request.method} {request.path}')
+    except OSError as e:
+        current_app.logger.warning('could not save profile %s: %s', capture['name'], e)
+    finally:
+        _busy.release()
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
@@ -0,0 +1,174 @@
+#querytrace.py
+# Opt-in query tracer: slow-query log, N+1 detector and per-endpoint budgets.
+#
+# Enable with TODO_QUERY_TRACE=1. Then, for every request:
+#   - statements slower than TODO_SLOW_QUERY_MS are logged with their
+#     EXPLAIN QUERY PLAN
+#   - a normalized statement (literals and IN lists folded) that runs more
+#     than TODO_QUERY_REPEAT_LIMIT times is reported as a likely N+1
+#   - views decorated with @query_budget(n) that run more than n statements
+#     are reported
+# With TODO_QUERY_TRACE_STRICT=1 the last two raise QueryBudgetExceeded
+# instead of logging, so a test hitting the endpoint fails. Tests can also
+# wrap any block in `with assert_max_queries(n):`.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+import db
+
+ENABLED = os.environ.get('TODO_QUERY_TRACE', '0') == '1'
+STRICT = os.environ.get('TODO_QUERY_TRACE_STRICT', '0') == '1'
+SLOW_QUERY_MS = float(os.environ.get('TODO_SLOW_QUERY_MS', 50))
+REPEAT_LIMIT = int(os.environ.get('TODO_QUERY_REPEAT_LIMIT', 5))
+
+logger = logging.getLogger('todo.queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_SPACE = re.compile(r'\s+')
+
+_local = threading.local()
+# assert_max_queries blocks running in any thread; the last one out removes
+# the observer unless init_app installed it for every request
+_blocks = 0
+_blocks_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    """A request or block ran more statements than it declared"""
+
+
+def normalize(sql):
+    """Statement shape with literals replaced by ?, for grouping repeats"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_budget(max_statements):
+    """Declare the most SQL statements a view may run per request"""
+    def decorate(view):
+        view.query_budget = max_statements
+        return view
+    return decorate
+
+
+def explain(cursor, sql, params):
+    """EXPLAIN QUERY PLAN (PostgreSQL: EXPLAIN) lines for a statement, run on the same connection"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+        return []
+    if db.BACKEND == 'postgres':
+        return cursor.explain(sql, params)
+    try:
+        # A plain cursor, so the EXPLAIN itself isn't traced
+        plan = cursor.connection.cursor(sqlite3.Cursor)
+        plan.execute('EXPLAIN QUERY PLAN ' + sql, params if params is not None else ())
+        return [row[3] for row in plan.fetchall()]
+    except sqlite3.Error as e:
+        return [f'(plan unavailable: {e})']
+
+
+def _trace():
+    return getattr(_local, 'trace', None)
+
+
+def _observe(cursor, sql, params, seconds):
+    trace = _trace()
+    if trace is None or sql is None:
+        return
+    trace['count'] += 1
+    shape = normalize(sql)
+    trace['shapes'][shape] = trace['shapes'].get(shape, 0) + 1
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        plan = '\n'.join('    ' + line for line in explain(cursor, sql, params))
+        logger.warning('slow query (%.1f ms) in %s: %s\n%s', seconds * 1000, trace['label'], shape, plan)
+
+
+def _begin(label):
+    previous = _trace()
+    _local.trace = {'label': label, 'count': 0, 'shapes': {}}
+    return previous
+
+
+def _problems(trace, budget):
+    problems = []
+    for shape, count in trace['shapes'].items():
+        if count > REPEAT_LIMIT:
+            problems.append(f'possible N+1: ran {count} times: {shape}')
+    if budget is not None and trace['count'] > budget:
+        problems.append(f"ran {trace['count']} statements, budget is {budget}")
+    return problems
+
+
+def _report(trace, budget):
+    problems = _problems(trace, budget)
+    for problem in problems:
+        logger.warning('%s: %s', trace['label'], problem)
+    if problems and STRICT:
+        raise QueryBudgetExceeded(f"{trace['label']}: " + '; '.join(problems))
+
+
+@contextmanager
+def assert_max_queries(max_statements, label='block'):
+    """Raise QueryBudgetExceeded if the block runs more statements than allowed or repeats one"""
+    global _blocks
+    with _blocks_lock:
+        _blocks += 1
+        db.add_statement_observer(_observe)
+    previous = _begin(label)
+    try:
+        yield
+        trace = _trace()
+        problems = _problems(trace, max_statements)
+        if problems:
+            raise QueryBudgetExceeded(f'{label}: ' + '; '.join(problems))
+    finally:
+        _local.trace = previous
+        with _blocks_lock:
+            _blocks -= 1
+            if not _blocks and not ENABLED:
+                db.remove_statement_observer(_observe)
+
+
+def _start_request():
+    if _trace() is not None:
+        # Inside assert_max_queries: the block's trace counts this request
+        g.querytrace_nested = True
+        return
+    _begin(f'{request.method} {request.path}')
+
+
+def _finish_request(response):
+    if g.get('querytrace_nested'):
+        return response
+    trace = _trace()
+    _local.trace = None
+    if trace is None:
+        return response
+    view = current_app.view_functions.get(request.endpoint)
+    _report(trace, getattr(view, 'query_budget', None))
+    return response
+
+
+def _end_request(error=None):
+    # after_request is skipped when a view raises; never leak a trace into the next request
+    if not g.pop('querytrace_nested', False):
+        _local.trace = None
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    db.add_statement_observer(_observe)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
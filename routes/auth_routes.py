@@ -1,18 +1,28 @@
 # routes/auth_routes.py
 # routes: login, register -> tasks -> profile -> reset password -> logout -> login
 from flask import Blueprint, request, jsonify, session, render_template, make_response, redirect, url_for
-from flask_bcrypt import Bcrypt
 from database import get_db_connection
 from functools import wraps
-from app import bcrypt 
+from passwords import PoolBusy, RETRY_AFTER_SECONDS, hash_password, check_password, rehash_if_needed
 import secrets
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+@auth_bp.errorhandler(PoolBusy)
+def password_pool_busy(error):
+    """Every password hashing process is busy: ask the client to retry instead of queueing"""
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again in a moment'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
 def nocache(view):
     @wraps(view)
     def no_cache(*args, **kwargs):
         response = make_response(view(*args, **kwargs))
+        if response.headers.get('ETag'):
+            # Conditional GET responses may be stored, but only revalidated (see http_cache)
+            return response
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
         response.headers['Pragma'] = 'no-cache'
         return response
@@ -46,6 +56,9 @@ def register():
         if not all([username, email, password, name]):
             return jsonify({'success': False, 'message': 'All fields are required'})
         
+        # Hash before touching the database so a busy pool leaves nothing open
+        hashed_password = hash_password(password)
+        
         conn = get_db_connection()
         c = conn.cursor()
         
@@ -56,11 +69,10 @@ def register():
             return jsonify({'success': False, 'message': 'Username or email already exists'})
         
         # Create new user
-        hashed_password = bcrypt.generate_password_hash(password)
-        c.execute('INSERT INTO users (username, email, password_hash, name) VALUES (?, ?, ?, ?)',
+        c.execute('INSERT INTO users (username, email, password_hash, name) VALUES (?, ?, ?, ?) RETURNING id',
                   (username, email, hashed_password, name))
+        user_id = c.fetchone()[0]
         conn.commit()
-        user_id = c.lastrowid
         c.execute('SELECT id, username, name FROM users WHERE id = ?', (user_id,))
         user = c.fetchone()
         conn.close()
@@ -93,7 +105,14 @@ def login():
     user = cursor.fetchone()
     conn.close()
 
-    if user and bcrypt.check_password_hash(user['password_hash'], password):
+    if user and check_password(user['password_hash'], password):
+        # Upgrade hashes made with an older work factor while we have the password
+        new_hash = rehash_if_needed(user['password_hash'], password)
+        if new_hash:
+            conn = get_db_connection()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+            conn.commit()
+            conn.close()
         session['user_id'] = user['id']
         session['username'] = user['username']
         session['name'] = user['name']
@@ -118,10 +137,17 @@ def profile():
         c.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],))
         user = c.fetchone()
         
-        # Verify current password if changing password
-        if new_password and not bcrypt.check_password_hash(user['password_hash'], current_password):
+        # Verify current password and hash the new one if changing password
+        hashed_password = None
+        try:
+            if new_password and not check_password(user['password_hash'], current_password):
+                conn.close()
+                return jsonify({'success': False, 'message': 'Current password is incorrect'})
+            if new_password:
+                hashed_password = hash_password(new_password)
+        except PoolBusy:
             conn.close()
-            return jsonify({'success': False, 'message': 'Current password is incorrect'})
+            raise
         
         # Check if new username is already taken
         if new_username != user['username']:
@@ -131,8 +157,7 @@ def profile():
                 return jsonify({'success': False, 'message': 'Username already taken'})
         
         # Update user data
-        if new_password:
-            hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+        if hashed_password:
             c.execute('UPDATE users SET username = ?, name = ?, password_hash = ? WHERE id = ?',
                       (new_username, new_name, hashed_password, session['user_id']))
         else:
@@ -171,7 +196,7 @@ def forgot_password():
         if user:
             # Generate reset token
             reset_token = secrets.token_urlsafe(32)
-            c.execute('UPDATE users SET reset_token = ?, reset_token_expires = datetime("now", "+1 hour") WHERE id = ?',
+            c.execute("UPDATE users SET reset_token = ?, reset_token_expires = datetime('now', '+1 hour') WHERE id = ?",
                       (reset_token, user[0]))
             conn.commit()
             conn.close()
@@ -197,11 +222,15 @@ def reset_password(token):
         
         conn = get_db_connection()
         c = conn.cursor()
-        c.execute('SELECT * FROM users WHERE reset_token = ? AND reset_token_expires > datetime("now")', (token,))
+        c.execute("SELECT * FROM users WHERE reset_token = ? AND reset_token_expires > datetime('now')", (token,))
         user = c.fetchone()
         
         if user:
-            hashed_password = bcrypt.generate_password_hash(new_password)
+            try:
+                hashed_password = hash_password(new_password)
+            except PoolBusy:
+                conn.close()
+                raise
             c.execute('UPDATE users SET password_hash = ?, reset_token = NULL, reset_token_expires = NULL WHERE id = ?',
                       (hashed_password, user[0]))
             conn.commit()
@@ -1,105 +1,77 @@
 # routes/collab_routes.py
-from flask import Blueprint, request, jsonify, session
+import json
+import queue
+
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from collab_lists import (
-    create_collab_list, get_collab_list_by_id, get_collab_lists_by_owner, 
-    delete_collab_list, get_list_owner_id, edit_collab_list
+    create_collab_list, get_collab_list_for_user, get_collab_list_summaries, get_collab_lists_version,
+    delete_collab_list, edit_collab_list
 )
 from collab_members import (
-    add_collab_member, get_collab_members, get_collab_lists_for_user,
-    is_user_member, remove_collab_member, count_collab_members, is_user_owner
+    add_collab_member, get_list_member_details, remove_collab_member
 )
 from database import get_db_connection
+from events import get_hub, streaming_supported, REVOKING_EVENTS
+from http_cache import make_etag, is_fresh, tag, not_modified
 from routes.auth_routes import login_required
-from tasks import get_tasks_for_collab_list
+from querytrace import query_budget
+from routes.task_routes import page_args
+from serializers import task_payload, task_list_response
+from tasks import get_board_version, get_tasks_for_collab_list, get_tasks_page
 
 collab_bp = Blueprint('collab_bp', __name__)
 
+SSE_HEARTBEAT_SECONDS = 15
+
 
 def _ensure_list_access(list_id, user_id, owner_only=False):
-    """Helper to check if user has access to a list"""
-    collab_list = get_collab_list_by_id(list_id)
+    """Helper to check if user has access to a list (one query)"""
+    collab_list = get_collab_list_for_user(list_id, user_id)
     if not collab_list:
         return None, False, (jsonify({'success': False, 'message': 'List not found'}), 404)
 
-    # Get owner_id from collab_members table
-    owner_id = get_list_owner_id(list_id)
-    is_owner = owner_id == user_id
+    is_owner = collab_list['owner_id'] == user_id
     
     if owner_only and not is_owner:
         return None, False, (jsonify({'success': False, 'message': 'Only the owner can perform this action'}), 403)
 
-    if not is_owner:
-        if not is_user_member(list_id, user_id):
-            return None, False, (jsonify({'success': False, 'message': 'Access denied'}), 403)
+    if not is_owner and not collab_list['role']:
+        return None, False, (jsonify({'success': False, 'message': 'Access denied'}), 403)
 
     return collab_list, is_owner, None
 
-
-def _fetch_owner_names(owner_ids):
-    """Fetch owner names for given owner IDs"""
-    if not owner_ids:
-        return {}
-    placeholders = ','.join(['?'] * len(owner_ids))
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute(f'SELECT id, name FROM users WHERE id IN ({placeholders})', tuple(owner_ids))
-    owners = {row['id']: row['name'] for row in c.fetchall()}
-    conn.close()
-    return owners
-
 # Get all collaborative lists that the user owns or is a member of
 @collab_bp.route('/collab_lists', methods=['GET'])
 @login_required
+@query_budget(2)
 def get_user_collab_lists():
     user_id = session.get('user_id')
 
-    owned_lists = get_collab_lists_by_owner(user_id)
-
-    member_list_ids = get_collab_lists_for_user(user_id)
-    member_lists = []
-    
-    for list_id in member_list_ids:
-        collab_list = get_collab_list_by_id(list_id)
-        if collab_list:
-            owner_id = get_list_owner_id(list_id)
-            if owner_id != user_id:  # Exclude lists where user is owner (already in owned_lists)
-                member_lists.append(collab_list)
-    
-    # Get all unique owner IDs from member_lists
-    owner_ids = {get_list_owner_id(l['id']) for l in member_lists}
-    owner_name_lookup = _fetch_owner_names(owner_ids)
+    # The fallback owner name comes from the session, so it is part of the tag
+    etag = make_etag(user_id, get_collab_lists_version(user_id), session.get('name', ''))
+    if is_fresh(etag):
+        return not_modified(etag)
 
+    # List metadata, owner name, member count and task counts in one query
     all_lists = []
-    
-    # Add owned lists
-    for list_item in owned_lists:
+    for list_item in get_collab_list_summaries(user_id):
+        is_owner = list_item['owner_id'] == user_id
         all_lists.append({
             'id': list_item['id'],
             'name': list_item['name'],
-            'owner_id': user_id,
-            'owner_name': session.get('name', 'You'),
-            'is_owner': True,
-            'member_count': count_collab_members(list_item['id']),
-            'created_at': list_item['created_at']
-        })
-
-    # Add member lists
-    for list_item in member_lists:
-        owner_id = get_list_owner_id(list_item['id'])
-        all_lists.append({
-            'id': list_item['id'],
-            'name': list_item['name'],
-            'owner_id': owner_id,
-            'owner_name': owner_name_lookup.get(owner_id, 'Owner'),
-            'is_owner': False,
-            'member_count': count_collab_members(list_item['id']),
+            'owner_id': list_item['owner_id'],
+            'owner_name': list_item['owner_name'] or (session.get('name', 'You') if is_owner else 'Owner'),
+            'is_owner': is_owner,
+            'member_count': list_item['member_count'],
+            'task_counts': {
+                'pending': list_item['pending_count'],
+                'in_progress': list_item['in_progress_count'],
+                'completed': list_item['completed_count']
+            },
             'created_at': list_item['created_at']
         })
     
-    # Sort with owned lists first, then alphabetically
-    all_lists.sort(key=lambda l: (0 if l['is_owner'] else 1, l['name'].lower()))
-    
-    return jsonify({'success': True, 'lists': all_lists})
+    return tag(jsonify({'success': True, 'lists': all_lists}), etag)
 
 # Create a new collaborative list
 @collab_bp.route('/collab_lists', methods=['POST'])
@@ -131,47 +103,23 @@ def create_list():
 # Get a specific collaborative list
 @collab_bp.route('/collab_lists/<int:list_id>', methods=['GET'])
 @login_required
+@query_budget(2)
 def get_list(list_id):
     user_id = session.get('user_id')
     collab_list, is_owner, error = _ensure_list_access(list_id, user_id)
     if error:
         return error
     
-    owner_id = get_list_owner_id(list_id)
-    
-    # Get owner info
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT id, username, name, email FROM users WHERE id = ?', (owner_id,))
-    owner = c.fetchone()
-    
-    # Get members
-    members = get_collab_members(list_id)
-    member_ids = members  # members is now a list of user IDs, not database rows
-    member_list = []
+    owner_id = collab_list['owner_id']
 
-    if member_ids:
-        placeholders = ','.join(['?'] * len(member_ids))
-        c.execute(f'''
-            SELECT id, username, name, email
-            FROM users
-            WHERE id IN ({placeholders})
-        ''', tuple(member_ids))
-        users_by_id = {row['id']: row for row in c.fetchall()}
-        for user_id_iter in member_ids:
-            user = users_by_id.get(user_id_iter)
-            if user:
-                member_list.append({
-                    'id': user['id'],
-                    'username': user['username'],
-                    'name': user['name'],
-                    'email': user['email'],
-                    'is_owner': user['id'] == owner_id
-                })
-    conn.close()
-    
-    # Ensure owner appears first
-    member_list.sort(key=lambda m: (0 if m['is_owner'] else 1, m['name'].lower()))
+    # Members with their user details, owner first, in one joined query
+    member_list = [{
+        'id': member['id'],
+        'username': member['username'],
+        'name': member['name'],
+        'email': member['email'],
+        'is_owner': member['id'] == owner_id
+    } for member in get_list_member_details(list_id)]
     
     return jsonify({
         'success': True,
@@ -303,30 +251,76 @@ def remove_member(list_id, member_id):
 #Get all tasks for a collab list
 @collab_bp.route('/collab_lists/<int:list_id>/tasks', methods=['GET'])
 @login_required
+@query_budget(3)
 def get_list_tasks(list_id):
     user_id = session.get('user_id')
     collab_list, _, error = _ensure_list_access(list_id, user_id)
     if error:
         return error
     
+    etag = make_etag(user_id, get_board_version(collab_list_id=list_id))
+    if is_fresh(etag):
+        return not_modified(etag)
+    
     status = request.args.get('status')
     priority = request.args.get('priority')
     
-    tasks = get_tasks_for_collab_list(list_id, status=status, priority=priority)
+    next_cursor = None
+    try:
+        limit, cursor = page_args()
+        if limit:
+            tasks, next_cursor = get_tasks_page(None, limit, cursor=cursor, collab_list_id=list_id,
+                                                status=status, priority=priority)
+        else:
+            tasks = get_tasks_for_collab_list(list_id, status=status, priority=priority)
+    except ValueError as e:
+        # A malformed limit or cursor
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    tasks_list = []
-    for task in tasks:
-        tasks_list.append({
-            'id': task['id'],
-            'title': task['title'],
-            'description': task['description'] or '',
-            'priority': task['priority'],
-            'status': task['status'],
-            'due_date': task['due_date'] or '',
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at'],
-            'user_id': task['user_id'],
-            'collab_list_id': task['collab_list_id']
-        })
+    extra = {'next_cursor': next_cursor} if limit else {}
+    return tag(task_list_response(tasks, **extra), etag)
+
+#Live updates for a collab list as Server-Sent Events
+@collab_bp.route('/collab_lists/<int:list_id>/events', methods=['GET'])
+@login_required
+def list_events(list_id):
+    user_id = session.get('user_id')
+    collab_list, _, error = _ensure_list_access(list_id, user_id)
+    if error:
+        return error
+    if not streaming_supported():
+        # A sync worker would be tied up for as long as the page stays open
+        return jsonify({'success': False, 'message': 'Live updates are not available on this server'}), 503
+    
+    hub = get_hub()
+    events = hub.subscribe(list_id)
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                data = {'list_id': event.list_id}
+                if event.task_id is not None:
+                    data['task_id'] = event.task_id
+                if event.task is not None:
+                    data['task'] = task_payload(event.task)
+                if event.user_id is not None:
+                    data['user_id'] = event.user_id
+                yield f'id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(data)}\n\n'
+                
+                # Stop streaming once this user loses access to the list
+                if event.kind == 'list_deleted' or (event.kind in REVOKING_EVENTS and event.user_id == user_id):
+                    return
+        finally:
+            hub.unsubscribe(list_id, events)
     
-    return jsonify({'success': True, 'tasks': tasks_list})
\ No newline at end of file
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,42 @@
+# routes/sync_routes.py
+from flask import Blueprint, request, jsonify, session
+from routes.auth_routes import login_required, nocache
+from querytrace import query_budget
+from serializers import task_payloads
+from sync import get_changes
+
+sync_bp = Blueprint('sync_bp', __name__)
+
+#Everything that changed on the user's boards since a sync token
+@sync_bp.route('/sync', methods=['GET'])
+@login_required
+@nocache
+@query_budget(8)
+def sync_changes():
+    user_id = session.get('user_id')
+    since = request.args.get('since')
+    
+    try:
+        changes = get_changes(user_id, since)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid sync token'}), 400
+    
+    return jsonify({
+        'success': True,
+        'token': changes['token'],
+        'reset': changes['reset'],
+        'lists': [{
+            'id': list_item['id'],
+            'name': list_item['name'],
+            'owner_id': list_item['owner_id'],
+            'is_owner': list_item['owner_id'] == user_id,
+            'created_at': list_item['created_at'],
+            'updated_at': list_item['updated_at']
+        } for list_item in changes['lists']],
+        'removed_list_ids': changes['removed_list_ids'],
+        'tasks': task_payloads(changes['tasks']),
+        'deleted_tasks': [{
+            'id': task['task_id'],
+            'collab_list_id': task['collab_list_id']
+        } for task in changes['deleted_tasks']]
+    })
@@ -1,20 +1,78 @@
 # routes/task_routes.py
-from flask import Blueprint, request, jsonify, session, render_template
+from flask import Blueprint, current_app, request, jsonify, session, render_template
 from tasks import (
-    initialize_db, create_task, get_tasks, get_task_by_id,
-    update_task, delete_task, search_tasks, archive_task, unarchive_task
+    create_task, get_tasks, get_tasks_page, get_task_for_user, get_board_version,
+    update_task, delete_task, search_tasks, archive_task, unarchive_task, apply_task_batch
 )
+from collab_members import get_list_access
+from http_cache import make_etag, is_fresh, tag, not_modified
+from events import streaming_supported
+from serializers import SEARCH_FIELDS, task_payload, task_list_response
 from routes.auth_routes import login_required
 from routes.auth_routes import nocache
+from querytrace import query_budget
+from group_commit import WriteTimeout
 
 task_bp = Blueprint('task_bp', __name__)
 
-initialize_db()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 500
+
+
+@task_bp.errorhandler(WriteTimeout)
+def write_timeout(error):
+    """The group-commit writer is backed up (group_commit.TIMEOUT_SECONDS)"""
+    if error.withdrawn:
+        # Nothing was written, so the client can simply retry
+        response = jsonify({'success': False, 'message': 'Server is busy, please try again in a moment'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    else:
+        # The write may still commit: the client reloads before retrying
+        response = jsonify({'success': False, 'resync': True,
+                            'message': 'The change may not have been saved, reload and check before retrying'})
+        response.status_code = 504
+    return response
+
+
+def page_args():
+    """Read ?limit=&cursor= for keyset pagination.
+
+    Returns (limit, cursor); limit is None when the caller didn't ask for
+    pagination, so existing clients still get every task. A cursor without
+    a limit pages by DEFAULT_PAGE_SIZE, and limits above MAX_PAGE_SIZE are
+    capped. Raises ValueError for a limit that isn't a positive integer.
+    """
+    cursor = request.args.get('cursor') or None
+    raw_limit = request.args.get('limit')
+    if raw_limit is None and cursor is None:
+        return None, None
+    if raw_limit is None:
+        return DEFAULT_PAGE_SIZE, cursor
+    try:
+        limit = int(raw_limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE), cursor
+
+
+def _task_access_error(task_id, user_id):
+    """Explain why an access-checked task mutation matched no row"""
+    task = get_task_for_user(task_id, user_id)
+    if not task:
+        return jsonify({'success': False, 'message': 'Task not found'}), 404
+    if not task['can_access']:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return None
 
 #Get all tasks for the logged-in user (personal or collaborative)
 @task_bp.route('/tasks', methods=['GET'])
 @login_required
 @nocache
+@query_budget(3)
 def get_user_tasks():
     #get all values
     user_id = session.get('user_id')
@@ -27,57 +85,75 @@ def get_user_tasks():
     
     if collab_list_id:
         # Get tasks for a specific collaborative list
-        from collab_members import is_user_owner, is_user_member
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(collab_list_id)
-        if not collab_list:
+        list_exists, role = get_list_access(collab_list_id, user_id)
+        if not list_exists:
             return jsonify({'success': False, 'message': 'List not found'}), 404
         
         # Check if user has access (is owner or member)
-        if not is_user_owner(collab_list_id, user_id) and not is_user_member(collab_list_id, user_id):
+        if not role:
             return jsonify({'error': 'Unauthorized'}), 403
                 
-        from tasks import get_tasks_for_collab_list
-        if archived_only:
-            # Get only archived tasks
-            tasks = get_tasks_for_collab_list(collab_list_id, status=status, priority=priority, include_archived=True)
-            tasks = [t for t in tasks if (t['archived'] or 0) == 1]
-        else:
-            tasks = get_tasks_for_collab_list(collab_list_id, status=status, priority=priority, include_archived=include_archived)
-    else:
-        # Get personal tasks
-        if archived_only:
-            # Get only archived tasks
-            tasks = get_tasks(user_id, status=status, priority=priority, include_archived=True)
-            tasks = [t for t in tasks if (t['archived'] or 0) == 1]
-        elif search:
-            tasks = search_tasks(user_id, search)
-        else:
-            tasks = get_tasks(user_id, status=status, priority=priority, include_archived=include_archived)
+    elif search and not archived_only:
+        # The legacy search filter returns every match, ranked; it predates
+        # pagination and ignores limit/cursor (/tasks/search pages by limit)
+        tasks = search_tasks(user_id, search, status=status, priority=priority,
+                             include_archived=include_archived, personal_only=True, limit=None)
+        return task_list_response(tasks)
     
-    # Convert Row objects to dictionaries
-    tasks_list = []
-    for task in tasks:
-        tasks_list.append({
-            'id': task['id'],
-            'title': task['title'],
-            'description': task['description'] or '',
-            'priority': task['priority'],
-            'status': task['status'],
-            'due_date': task['due_date'] or '',
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at'],
-            'collab_list_id': task['collab_list_id'],
-            'archived': task['archived'] if task['archived'] is not None else 0
-        })
+    # Answer revalidations from the board version before touching task rows
+    etag = make_etag(user_id, get_board_version(user_id=user_id, collab_list_id=collab_list_id))
+    if is_fresh(etag):
+        return not_modified(etag)
     
-    return jsonify({'success': True, 'tasks': tasks_list})
+    filters = dict(status=status, priority=priority, collab_list_id=collab_list_id,
+                   include_archived=include_archived, archived_only=archived_only)
+    next_cursor = None
+    try:
+        limit, cursor = page_args()
+        if limit:
+            tasks, next_cursor = get_tasks_page(user_id, limit, cursor=cursor, **filters)
+        else:
+            tasks = get_tasks(user_id, **filters)
+    except ValueError as e:
+        # A malformed limit or cursor
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    extra = {'next_cursor': next_cursor} if limit else {}
+    return tag(task_list_response(tasks, **extra), etag)
+
+#Ranked full-text search across personal tasks and every list the user belongs to
+@task_bp.route('/tasks/search', methods=['GET'])
+@login_required
+@nocache
+@query_budget(1)
+def search_user_tasks():
+    user_id = session.get('user_id')
+    query = request.args.get('q', '').strip()
+    status = request.args.get('status')
+    priority = request.args.get('priority')
+    include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+    archived_only = request.args.get('archived_only', 'false').lower() == 'true'
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+
+    if not query:
+        return jsonify({'success': False, 'message': 'Search query is required'}), 400
+
+    results = search_tasks(
+        user_id, query,
+        status=status,
+        priority=priority,
+        include_archived=include_archived,
+        archived_only=archived_only,
+        limit=limit
+    )
+
+    return task_list_response(results, fields=SEARCH_FIELDS, query=query)
 
 #Create a new task (personal or collaborative)
 @task_bp.route('/tasks', methods=['POST'])
 @login_required
 @nocache
+@query_budget(3)
 def add_task():
     user_id = session.get('user_id')
     data = request.get_json()
@@ -101,15 +177,12 @@ def add_task():
     
     # If collab_list_id is provided, verify user has access
     if collab_list_id:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(collab_list_id)
-        if not collab_list:
+        list_exists, role = get_list_access(collab_list_id, user_id)
+        if not list_exists:
             return jsonify({'success': False, 'message': 'List not found'}), 404
         
         # Check if user has access (is owner or member)
-        if not is_user_owner(collab_list_id, user_id) and not is_user_member(collab_list_id, user_id):
+        if not role:
             return jsonify({'success': False, 'message': 'Access denied'}), 403
     
     try:
@@ -126,92 +199,74 @@ def add_task():
         return jsonify({
             'success': True,
             'message': 'Task created successfully',
-            'task': {
-                'id': task['id'],
-                'title': task['title'],
-                'description': task['description'] or '',
-                'priority': task['priority'],
-                'status': task['status'],
-                'due_date': task['due_date'] or '',
-                'created_at': task['created_at'],
-                'collab_list_id': task['collab_list_id']
-            }
+            'task': task_payload(task)
         }), 201
+    except WriteTimeout:
+        raise
     except Exception as e:
-        import traceback
-        error_msg = str(e)
-        print(f"Error creating task: {error_msg}")
-        print(traceback.format_exc())
-        return jsonify({'success': False, 'message': f'Error creating task: {error_msg}'}), 500
+        current_app.logger.exception('Error creating task')
+        return jsonify({'success': False, 'message': f'Error creating task: {str(e)}'}), 500
+
+#Apply many create/update/status/archive/delete operations in one transaction
+@task_bp.route('/tasks/batch', methods=['POST'])
+@login_required
+@nocache
+def batch_tasks():
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'success': False, 'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_SIZE} operations per batch'}), 400
+    
+    try:
+        results = apply_task_batch(user_id, operations)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error applying batch: {str(e)}'}), 500
+    
+    for result in results:
+        if result.get('task') is not None:
+            result['task'] = task_payload(result['task'])
+        elif 'task' in result:
+            del result['task']
+    
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'results': results
+    })
 
 #Get a specific task by ID
 @task_bp.route('/tasks/<int:task_id>', methods=['GET'])
 @login_required
 @nocache
+@query_budget(1)
 def get_task(task_id):
     user_id = session.get('user_id')
-    task = get_task_by_id(task_id)
+    # Task, list and permission come back from a single query
+    task = get_task_for_user(task_id, user_id)
     
     if not task:
         return jsonify({'success': False, 'message': 'Task not found'}), 404
     
-    # Check access: personal task or collaborative task user has access to
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        # Personal task - check ownership
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
+    if not task['can_access']:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
     
     return jsonify({
         'success': True,
-        'task': {
-            'id': task['id'],
-            'title': task['title'],
-            'description': task['description'] or '',
-            'priority': task['priority'],
-            'status': task['status'],
-            'due_date': task['due_date'] or '',
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at'],
-            'collab_list_id': task['collab_list_id']
-        }
+        'task': task_payload(task)
     })
 
 #Update a task
 @task_bp.route('/tasks/<int:task_id>', methods=['PUT'])
 @login_required
 @nocache
+@query_budget(2)
 def update_user_task(task_id):
     user_id = session.get('user_id')
     data = request.get_json()
     
-    # Check if task exists and user has access
-    task = get_task_by_id(task_id)
-    if not task:
-        return jsonify({'success': False, 'message': 'Task not found'}), 404
-    
-    # Check access
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
-    
     # Get update fields
     title = data.get('title')
     description = data.get('description')
@@ -239,21 +294,16 @@ def update_user_task(task_id):
         )
         
         if not updated_task:
-            return jsonify({'success': False, 'message': 'No fields to update'}), 400
+            return _task_access_error(task_id, user_id) or (
+                jsonify({'success': False, 'message': 'No fields to update'}), 400)
         
         return jsonify({
             'success': True,
             'message': 'Task updated successfully',
-            'task': {
-                'id': updated_task['id'],
-                'title': updated_task['title'],
-                'description': updated_task['description'] or '',
-                'priority': updated_task['priority'],
-                'status': updated_task['status'],
-                'due_date': updated_task['due_date'] or '',
-                'updated_at': updated_task['updated_at']
-            }
+            'task': task_payload(updated_task)
         })
+    except WriteTimeout:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error updating task: {str(e)}'}), 500
 
@@ -261,34 +311,19 @@ def update_user_task(task_id):
 @task_bp.route('/tasks/<int:task_id>', methods=['DELETE'])
 @login_required
 @nocache
+@query_budget(2)
 def delete_user_task(task_id):
     user_id = session.get('user_id')
     
-    # Check if task exists and user has access
-    task = get_task_by_id(task_id)
-    if not task:
-        return jsonify({'success': False, 'message': 'Task not found'}), 404
-    
-    # Check access
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
-    
     try:
         deleted = delete_task(task_id, user_id)
         if deleted:
             return jsonify({'success': True, 'message': 'Task deleted successfully'})
         else:
-            return jsonify({'success': False, 'message': 'Failed to delete task'}), 500
+            return _task_access_error(task_id, user_id) or (
+                jsonify({'success': False, 'message': 'Failed to delete task'}), 500)
+    except WriteTimeout:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error deleting task: {str(e)}'}), 500
 
@@ -296,6 +331,7 @@ def delete_user_task(task_id):
 @task_bp.route('/tasks/<int:task_id>/status', methods=['PUT'])
 @login_required
 @nocache
+@query_budget(2)
 def update_task_status(task_id):
     user_id = session.get('user_id')
     data = request.get_json()
@@ -304,38 +340,20 @@ def update_task_status(task_id):
     if not new_status:
         return jsonify({'success': False, 'message': 'Status is required'}), 400
     
-    # Check if task exists and user has access
-    task = get_task_by_id(task_id)
-    if not task:
-        return jsonify({'success': False, 'message': 'Task not found'}), 404
-    
-    # Check access
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
-    
+    # Access is checked inside the UPDATE, so a status drag is one round trip
     try:
         updated_task = update_task(task_id, user_id, status=new_status)
         if updated_task:
             return jsonify({
                 'success': True,
                 'message': 'Task status updated successfully',
-                'task': {
-                    'id': updated_task['id'],
-                    'status': updated_task['status']
-                }
+                'task': task_payload(updated_task)
             })
         else:
-            return jsonify({'success': False, 'message': 'Failed to update status'}), 500
+            return _task_access_error(task_id, user_id) or (
+                jsonify({'success': False, 'message': 'Failed to update status'}), 500)
+    except WriteTimeout:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error updating status: {str(e)}'}), 500
 
@@ -343,41 +361,23 @@ def update_task_status(task_id):
 @task_bp.route('/tasks/<int:task_id>/archive', methods=['POST'])
 @login_required
 @nocache
+@query_budget(2)
 def archive_user_task(task_id):
     user_id = session.get('user_id')
     
-    # Check if task exists and user has access
-    task = get_task_by_id(task_id)
-    if not task:
-        return jsonify({'success': False, 'message': 'Task not found'}), 404
-    
-    # Check access
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
-    
     try:
         archived_task = archive_task(task_id, user_id)
         if archived_task:
             return jsonify({
                 'success': True,
                 'message': 'Task archived successfully',
-                'task': {
-                    'id': archived_task['id'],
-                    'archived': archived_task['archived']
-                }
+                'task': task_payload(archived_task)
             })
         else:
-            return jsonify({'success': False, 'message': 'Failed to archive task'}), 500
+            return _task_access_error(task_id, user_id) or (
+                jsonify({'success': False, 'message': 'Failed to archive task'}), 500)
+    except WriteTimeout:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error archiving task: {str(e)}'}), 500
 
@@ -385,41 +385,23 @@ def archive_user_task(task_id):
 @task_bp.route('/tasks/<int:task_id>/unarchive', methods=['POST'])
 @login_required
 @nocache
+@query_budget(2)
 def unarchive_user_task(task_id):
     user_id = session.get('user_id')
     
-    # Check if task exists and user has access
-    task = get_task_by_id(task_id)
-    if not task:
-        return jsonify({'success': False, 'message': 'Task not found'}), 404
-    
-    # Check access
-    if task['collab_list_id']:
-        from collab_members import is_user_member, is_user_owner
-        from collab_lists import get_collab_list_by_id
-        
-        collab_list = get_collab_list_by_id(task['collab_list_id'])
-        if collab_list:
-            # Check if user has access (is owner or member)
-            if not is_user_owner(task['collab_list_id'], user_id) and not is_user_member(task['collab_list_id'], user_id):
-                return jsonify({'success': False, 'message': 'Access denied'}), 403
-    else:
-        if task['user_id'] != user_id:
-            return jsonify({'success': False, 'message': 'Access denied'}), 403
-    
     try:
         unarchived_task = unarchive_task(task_id, user_id)
         if unarchived_task:
             return jsonify({
                 'success': True,
                 'message': 'Task unarchived successfully',
-                'task': {
-                    'id': unarchived_task['id'],
-                    'archived': unarchived_task['archived']
-                }
+                'task': task_payload(unarchived_task)
             })
         else:
-            return jsonify({'success': False, 'message': 'Failed to unarchive task'}), 500
+            return _task_access_error(task_id, user_id) or (
+                jsonify({'success': False, 'message': 'Failed to unarchive task'}), 500)
+    except WriteTimeout:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error unarchiving task: {str(e)}'}), 500
 
@@ -427,4 +409,4 @@ def unarchive_user_task(task_id):
 @login_required
 @nocache
 def tasks_page():
-    return render_template('tasks.html')
\ No newline at end of file
+    return render_template('tasks.html', live_events=streaming_supported())
\ No newline at end of file
@@ -0,0 +1,120 @@
+#serializers.py
+# One shared task row -> response payload serializer.
+#
+# Every route returns tasks in the same shape, built from sqlite3.Row (or a
+# dict) by a getter compiled once per field list. List responses are
+# negotiated from the Accept header (or ?format=):
+#   application/json                  {"tasks": [{...}, ...]}
+#   application/vnd.todo.compact+json {"fields": [...], "tasks": [[...], ...]}
+#   application/msgpack               compact shape, MessagePack encoded
+# orjson and msgpack are in requirements.txt but still imported optionally:
+# without orjson the stdlib json module is used, and without msgpack a client
+# that only accepts MessagePack gets 406 Not Acceptable.
+
+import json
+from operator import itemgetter
+
+from flask import Response, jsonify, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+TASK_FIELDS = (
+    'id', 'title', 'description', 'priority', 'status', 'due_date',
+    'created_at', 'updated_at', 'user_id', 'collab_list_id', 'archived',
+)
+SEARCH_FIELDS = TASK_FIELDS + ('rank', 'title_snippet', 'description_snippet')
+
+# NULL columns the client expects as '' or 0
+BLANK_IF_NULL = ('description', 'due_date')
+ZERO_IF_NULL = ('archived',)
+
+JSON = 'application/json'
+COMPACT_JSON = 'application/vnd.todo.compact+json'
+MSGPACK = 'application/msgpack'
+
+_FORMATS = {'json': JSON, 'compact': COMPACT_JSON, 'msgpack': MSGPACK}
+_compiled = {}
+
+
+def _compile(fields):
+    """Build a row -> list of values function for a field tuple"""
+    getter = itemgetter(*fields)
+    fixes = [(i, '') for i, field in enumerate(fields) if field in BLANK_IF_NULL]
+    fixes += [(i, 0) for i, field in enumerate(fields) if field in ZERO_IF_NULL]
+
+    def values(row):
+        out = list(getter(row))
+        for i, default in fixes:
+            if out[i] is None:
+                out[i] = default
+        return out
+    return values
+
+
+def row_values(fields=TASK_FIELDS):
+    """Cached row -> values function for a field tuple"""
+    values = _compiled.get(fields)
+    if values is None:
+        values = _compiled[fields] = _compile(fields)
+    return values
+
+
+def task_payload(row, fields=TASK_FIELDS):
+    """A single task as a dict"""
+    return dict(zip(fields, row_values(fields)(row)))
+
+
+def task_payloads(rows, fields=TASK_FIELDS):
+    values = row_values(fields)
+    return [dict(zip(fields, values(row))) for row in rows]
+
+
+def negotiate():
+    """Pick the response format for a task list; None if the client only
+    accepts MessagePack and msgpack is not installed"""
+    requested = _FORMATS.get(request.args.get('format', ''))
+    if requested is None:
+        requested = request.accept_mimetypes.best_match((JSON, COMPACT_JSON, MSGPACK, 'application/x-msgpack'),
+                                                        default=JSON)
+        if requested == 'application/x-msgpack':
+            requested = MSGPACK
+        if requested == MSGPACK and msgpack is None:
+            # Fall back only to a format the client listed
+            return request.accept_mimetypes.best_match((JSON, COMPACT_JSON))
+    if requested == MSGPACK and msgpack is None:
+        return None
+    return requested
+
+
+def dumps(data):
+    """Encode JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'))
+
+
+def task_list_response(rows, fields=TASK_FIELDS, **extra):
+    """Response for a list of task rows plus extra top-level keys, in the negotiated format"""
+    mimetype = negotiate()
+    if mimetype is None:
+        return jsonify({'success': False, 'message': 'MessagePack is not available on this server'}), 406
+    values = row_values(fields)
+    body = {'success': True, **extra}
+    if mimetype == JSON:
+        body['tasks'] = [dict(zip(fields, values(row))) for row in rows]
+        data = dumps(body)
+    else:
+        body['fields'] = list(fields)
+        body['tasks'] = [values(row) for row in rows]
+        data = msgpack.packb(body) if mimetype == MSGPACK else dumps(body)
+    response = Response(data, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
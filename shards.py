@@ -0,0 +1,184 @@
+#shards.py
+# Optional sharded task storage: tasks spread over several SQLite files, so
+# task writes are no longer capped by one file's write lock.
+#
+# Sharding is switched on by `python -m migrations.reshard split N`, which
+# moves the tasks into tasks-0.db ... tasks-<N-1>.db; each shard has the
+# whole tasks schema (search index, change counter, tombstones, board
+# versions, events). Every board - a user's personal tasks ('u<user_id>') or
+# a list ('l<list_id>'), named as in board_versions - lives on one shard,
+# recorded in the shard map (task_shard_map, users database). A board gets
+# its place, shard id % N, with its first task; the map only changes
+# otherwise through reshard move/rebalance, which run with the app stopped,
+# so each process caches it.
+#
+# Reads and writes of one board go to its shard only. The few queries that
+# span boards fan out to the shards holding the user's boards and merge:
+# search, sync, due dates, list summaries, and lookups by task id. Task ids
+# stay unique across shards because each shard hands out ids from its own
+# range (see _ID_RANGE_BITS), and keep their value when a board moves; a
+# lookup by id tries the shard whose range the id is from first.
+#
+# Unsharded, every function here answers 'tasks' without touching the
+# database, so the data modules have one code path. Not available with
+# PostgreSQL, which has no single-writer limit.
+
+import json
+import threading
+
+import db
+
+# Shard n issues task ids from (n + 1) << _ID_RANGE_BITS on; ids of an
+# unsharded install stay below 1 << _ID_RANGE_BITS. Every id stays below
+# 2 ** 53, so JavaScript clients read them exactly.
+_ID_RANGE_BITS = 40
+MAX_SHARDS = 2 ** (53 - _ID_RANGE_BITS) - 2
+
+_lock = threading.Lock()
+# data directory -> {board: shard}
+_boards = {}
+
+
+def count():
+    """Number of task shards; 0 when tasks aren't sharded"""
+    return db.shard_count()
+
+
+def enabled():
+    return count() > 0
+
+
+def board(user_id=None, collab_list_id=None):
+    """Shard map key of a personal board (user_id) or list board"""
+    return f'l{collab_list_id}' if collab_list_id else f'u{user_id}'
+
+
+def id_range(shard):
+    """(first, end) of the task ids shard n hands out"""
+    return (shard + 1) << _ID_RANGE_BITS, (shard + 2) << _ID_RANGE_BITS
+
+
+def database_of(task_id):
+    """The shard that issued a task id - where the task is unless its board
+    moved since - or None for ids from before the split"""
+    if not enabled():
+        return 'tasks'
+    shard = (task_id >> _ID_RANGE_BITS) - 1
+    return db.shard_name(shard) if 0 <= shard < count() else None
+
+
+def _cache():
+    return _boards.setdefault(db.DATA_DIR, {})
+
+
+def forget():
+    """Drop cached placements (after reshard changed the map)"""
+    with _lock:
+        _boards.clear()
+
+
+def _remember(placements):
+    shards = count()
+    for key, shard in placements:
+        if shard >= shards:
+            raise RuntimeError(f'shard map places {key} on shard {shard}, but there are {shards} shards')
+    with _lock:
+        _cache().update(placements)
+
+
+def _place(key):
+    """Shard of a board, placing it if it has none yet"""
+    conn = db.get_connection('users')
+    c = conn.cursor()
+    # The first process to place a board wins; everyone reads its choice back
+    c.execute('INSERT OR IGNORE INTO task_shard_map (board, shard) VALUES (?, ?)', (key, int(key[1:]) % count()))
+    c.execute('SELECT shard FROM task_shard_map WHERE board = ?', (key,))
+    shard = c.fetchone()[0]
+    conn.commit()
+    conn.close()
+    _remember([(key, shard)])
+    return shard
+
+
+def database_for(user_id=None, collab_list_id=None, place=False):
+    """Logical database holding a board's tasks.
+
+    place=True (for writes) records the board's shard when it has none. A
+    read of a board without one goes to the shard it would get; it has no
+    tasks anywhere yet.
+    """
+    if not enabled():
+        return 'tasks'
+    key = board(user_id, collab_list_id)
+    shard = _cache().get(key)
+    if shard is None:
+        if place:
+            shard = _place(key)
+        else:
+            conn = db.get_connection('users')
+            c = conn.cursor()
+            c.execute('SELECT shard FROM task_shard_map WHERE board = ?', (key,))
+            row = c.fetchone()
+            conn.close()
+            if row is None:
+                return db.shard_name(int(key[1:]) % count())
+            shard = row[0]
+            _remember([(key, shard)])
+    return db.shard_name(shard)
+
+
+def user_databases(user_id):
+    """Logical databases holding the user's personal board or any of their lists, personal first.
+
+    Boards without tasks (none on any shard yet) are left out.
+    """
+    if not enabled():
+        return ['tasks']
+    # collab_lists connections see the users database: the same file, or attached
+    conn = db.get_connection('collab_lists')
+    c = conn.cursor()
+    c.execute('''
+        SELECT board, shard FROM task_shard_map WHERE board = 'u' || :user_id
+        UNION ALL
+        SELECT task_shard_map.board, task_shard_map.shard
+        FROM list_members
+        JOIN task_shard_map ON task_shard_map.board = 'l' || list_members.list_id
+        WHERE list_members.user_id = :user_id
+    ''', {'user_id': user_id})
+    placements = [tuple(row) for row in c.fetchall()]
+    conn.close()
+    _remember(placements)
+    names = []
+    for _, shard in placements:
+        if db.shard_name(shard) not in names:
+            names.append(db.shard_name(shard))
+    return names
+
+
+def list_databases(list_ids):
+    """{logical database: [list ids]} for the lists with tasks"""
+    if not enabled():
+        return {'tasks': list(list_ids)} if list_ids else {}
+    conn = db.get_connection('users')
+    c = conn.cursor()
+    c.execute("SELECT board, shard FROM task_shard_map WHERE board IN (SELECT 'l' || value FROM json_each(?))",
+              (json.dumps(list(list_ids)),))
+    placements = [tuple(row) for row in c.fetchall()]
+    conn.close()
+    _remember(placements)
+    grouped = {}
+    for key, shard in placements:
+        grouped.setdefault(db.shard_name(shard), []).append(int(key[1:]))
+    return grouped
+
+
+def all_databases():
+    """Every logical database holding tasks"""
+    if not enabled():
+        return ['tasks']
+    return [db.shard_name(shard) for shard in range(count())]
+
+
+def board_version(name, version):
+    """A board's version as used in ETags: qualified by its shard, whose counter it comes from"""
+    return f'{name}:{version}' if db.is_shard(name) else version
@@ -205,7 +205,9 @@ document.addEventListener("DOMContentLoaded", () => {
                 collabLists.forEach(list => {
                     const option = document.createElement('option');
                     option.value = list.id;
-                    option.textContent = list.name + (list.is_owner ? ' (Owner)' : '');
+                    const counts = list.task_counts || {};
+                    const openCount = (counts.pending || 0) + (counts.in_progress || 0);
+                    option.textContent = list.name + (list.is_owner ? ' (Owner)' : '') + (openCount ? ` · ${openCount} open` : '');
                     listSelector.appendChild(option);
                 });
                 const desiredValue = currentListId ? currentListId.toString() : 'personal';
@@ -1128,6 +1130,7 @@ document.addEventListener("DOMContentLoaded", () => {
     });
 
     function updateCollabContext(list) {
+        subscribeToListEvents(list ? list.id : null);
         if (!list) {
             collabListInfo.style.display = 'none';
             collabOwnerBadge.textContent = '';
@@ -1154,5 +1157,38 @@ document.addEventListener("DOMContentLoaded", () => {
         // show/hide buttons based on ownership
         editListBtn.style.display = list.is_owner ? 'flex' : 'none';
         deleteListBtn.style.display = list.is_owner ? 'flex' : 'none';
-    }    
+    }
+
+    // =====================================================
+    // LIVE UPDATES (Server-Sent Events per collab list)
+    // =====================================================
+    let listEventSource = null;
+    let listEventSourceId = null;
+    let liveReloadTimer = null;
+
+    function subscribeToListEvents(listId) {
+        if (listId === listEventSourceId) return;
+        if (listEventSource) {
+            listEventSource.close();
+            listEventSource = null;
+        }
+        listEventSourceId = listId;
+        // The server says whether it can hold a stream open (async workers only)
+        if (!listId || !window.EventSource || !window.LIVE_EVENTS) return;
+
+        listEventSource = new EventSource(`/collab_lists/${listId}/events`);
+        const taskEvents = ['task_created', 'task_updated', 'task_moved', 'task_deleted', 'resync'];
+        taskEvents.forEach(kind => listEventSource.addEventListener(kind, scheduleLiveReload));
+        ['member_added', 'member_removed', 'list_updated', 'list_deleted'].forEach(kind => {
+            listEventSource.addEventListener(kind, () => loadCollabLists());
+        });
+    }
+
+    // Coalesce bursts of events (e.g. a batch move) into one board refresh
+    function scheduleLiveReload() {
+        clearTimeout(liveReloadTimer);
+        liveReloadTimer = setTimeout(() => {
+            if (currentListId === listEventSourceId) loadTasks();
+        }, 150);
+    }
 });
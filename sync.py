@@ -0,0 +1,156 @@
+#sync.py
+# Delta sync: everything that changed for a user since a sync token.
+#
+# tasks.db and collab_lists.db each keep their own change counter
+# (task_seq / list_seq), so a sync token is "<task_seq>.<list_seq>". With
+# sharded tasks (shards.py) every shard has its own task_seq and the token
+# carries them all: "<task_seq of shard 0>-<shard 1>-...-<shard N-1>.<list_seq>".
+# A token with a different number of shards gets a full reset, as does a
+# plain integer: a seq kept by a client from before tokens had this form.
+# On PostgreSQL task_seq and list_seq are views over the commit-visibility
+# watermark (migrations/postgres/users/0004): changes above a token may
+# already have been sent once, and clients apply them idempotently.
+
+import json
+
+import db
+import shards
+
+def get_db_connection():
+    # collab_lists connections have tasks and users attached
+    return db.get_connection('collab_lists')
+
+def encode_token(task_seqs, list_seq):
+    return f"{'-'.join(str(seq) for seq in task_seqs)}.{list_seq}"
+
+def decode_token(token):
+    """Parse a sync token into (task_seqs, list_seq); task_seqs is None for "never synced"
+    (None, '' or '0') and empty for a legacy plain integer, which forces a reset.
+    Raises ValueError if malformed"""
+    if not token or token == '0':
+        return None, 0
+    if token.isascii() and token.isdigit():
+        return (), 0
+    task_seqs, list_seq = token.split('.')
+    task_seqs, list_seq = tuple(int(seq) for seq in task_seqs.split('-')), int(list_seq)
+    if min(task_seqs) < 0 or list_seq < 0:
+        raise ValueError('Invalid sync token')
+    return task_seqs, list_seq
+
+def get_changes(user_id, since=None):
+    """Rows created, updated, archived or deleted since a sync token.
+
+    Covers the user's personal board and every list they belong to. Lists the
+    user joined after the token are sent in full. If the token predates
+    pruned tombstones, a full snapshot is returned with reset=True.
+    """
+    since_tasks, since_lists = decode_token(since)
+
+    sharded = shards.enabled()
+    conn = get_db_connection()
+    c = conn.cursor()
+    # Sharded, each shard is read through its own connection
+    task_conns = [db.get_connection(name) for name in shards.all_databases()] if sharded else [conn]
+    try:
+        # One read transaction per file so every query sees the same snapshot
+        c.execute('BEGIN')
+        task_cursors = [task_conn.cursor() for task_conn in task_conns]
+        counters = []
+        for tc in task_cursors:
+            if sharded:
+                tc.execute('BEGIN')
+            tc.execute('SELECT value, pruned_through FROM task_seq')
+            counters.append(tuple(tc.fetchone()))
+        c.execute('SELECT value, pruned_through FROM list_seq')
+        list_seq, list_pruned = c.fetchone()
+
+        if since_tasks is None:
+            since_tasks = (0,) * len(counters)
+        reset = (len(since_tasks) != len(counters) or since_lists < list_pruned
+                 or any(since < pruned for since, (_, pruned) in zip(since_tasks, counters)))
+        if reset:
+            since_tasks, since_lists = (0,) * len(counters), 0
+
+        c.execute('''
+            SELECT collab_lists.id, collab_lists.name, collab_lists.owner_id, collab_lists.created_at,
+                   collab_lists.updated_at, collab_lists.seq, list_members.role,
+                   list_members.seq AS member_seq
+            FROM list_members
+            JOIN collab_lists ON collab_lists.id = list_members.list_id
+            WHERE list_members.user_id = ?
+        ''', (user_id,))
+        memberships = c.fetchall()
+        member_list_ids = [row['id'] for row in memberships]
+        joined_list_ids = [row['id'] for row in memberships if row['member_seq'] > since_lists]
+        known_list_ids = [list_id for list_id in member_list_ids if list_id not in joined_list_ids]
+        changed_lists = [row for row in memberships
+                         if row['seq'] > since_lists or row['member_seq'] > since_lists]
+
+        changed_tasks, deleted_tasks = [], []
+        relevant = shards.user_databases(user_id) if sharded else None
+        for name, tc, since in zip(shards.all_databases(), task_cursors, since_tasks):
+            if relevant is not None and name not in relevant:
+                continue
+            changed, deleted = _task_changes(tc, user_id, since, known_list_ids, joined_list_ids, member_list_ids)
+            changed_tasks += changed
+            deleted_tasks += deleted
+
+        c.execute('''
+            SELECT DISTINCT list_id FROM list_member_tombstones
+            WHERE user_id = ? AND seq > ?
+        ''', (user_id, since_lists))
+        removed_list_ids = [row['list_id'] for row in c.fetchall() if row['list_id'] not in member_list_ids]
+
+        for task_conn in task_conns:
+            task_conn.commit()
+        conn.commit()
+    finally:
+        if sharded:
+            for task_conn in task_conns:
+                task_conn.close()
+        conn.close()
+
+    return {
+        'token': encode_token([value for value, _ in counters], list_seq),
+        'reset': reset,
+        'lists': changed_lists,
+        'removed_list_ids': removed_list_ids,
+        'tasks': changed_tasks,
+        'deleted_tasks': deleted_tasks,
+    }
+
+def _task_changes(c, user_id, since, known_list_ids, joined_list_ids, member_list_ids):
+    """(changed tasks, deleted tasks) of one tasks database since its seq"""
+    c.execute('''
+        SELECT * FROM tasks WHERE user_id = ? AND collab_list_id IS NULL AND seq > ?
+        UNION ALL
+        SELECT * FROM tasks WHERE collab_list_id IN (SELECT value FROM json_each(?)) AND seq > ?
+        UNION ALL
+        SELECT * FROM tasks WHERE collab_list_id IN (SELECT value FROM json_each(?))
+        ORDER BY seq
+    ''', (user_id, since, json.dumps(known_list_ids), since, json.dumps(joined_list_ids)))
+    changed = c.fetchall()
+
+    c.execute('''
+        SELECT DISTINCT task_id, collab_list_id FROM task_tombstones
+        WHERE seq > ?
+          AND ((collab_list_id IS NULL AND user_id = ?)
+               OR collab_list_id IN (SELECT value FROM json_each(?)))
+    ''', (since, user_id, json.dumps(member_list_ids)))
+    return changed, c.fetchall()
+
+def prune_tombstones(max_age_days=30):
+    """Drop old tombstones. Tokens older than the newest pruned one get a full reset"""
+    databases = [(name, 'task_tombstones', 'task_seq') for name in shards.all_databases()]
+    for name, table, counter in databases + [('collab_lists', 'list_member_tombstones', 'list_seq')]:
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        cutoff = f'-{int(max_age_days)} days'
+        c.execute(f"SELECT MAX(seq) FROM main.{table} WHERE deleted_at < datetime('now', ?)", (cutoff,))
+        pruned_through = c.fetchone()[0]
+        if pruned_through:
+            c.execute(f'DELETE FROM main.{table} WHERE seq <= ?', (pruned_through,))
+            c.execute(f'UPDATE main.{counter} SET pruned_through = ? WHERE pruned_through < ?',
+                      (pruned_through, pruned_through))
+            conn.commit()
+        conn.close()
@@ -1,59 +1,62 @@
 #tasks.py
 
-import sqlite3
+import base64
+import html
+import json
+import re
 from datetime import datetime
 
-def initialize_db():
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
+import db
+import group_commit
+import migrations
+import shards
 
-    # Create tasks table
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        title TEXT NOT NULL,
-        description TEXT,
-        priority TEXT DEFAULT 'Medium',
-        status TEXT DEFAULT 'pending',
-        due_date TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        collab_list_id INTEGER,
-        archived INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (collab_list_id) REFERENCES collab_lists(id)
-    )
-    ''')
-    # Add archived column if it doesn't exist (for existing databases)
-    try:
-        c.execute('ALTER TABLE tasks ADD COLUMN archived INTEGER DEFAULT 0')
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    conn.commit()
-    conn.close()
+def initialize_db():
+    # Schema lives in migrations/tasks; this applies whatever is pending
+    migrations.ensure_current('tasks')
 
 def get_db_connection():
-    conn = sqlite3.connect('tasks.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.get_connection('tasks')
 
-def create_task(user_id, title, description=None, priority='Medium', status='pending', due_date=None, collab_list_id=None):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO tasks (user_id, title, description, priority, status, due_date, collab_list_id) 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, title, description, priority, status, due_date, collab_list_id))
-    task_id = c.lastrowid
-    conn.commit()
+def _insert_sql(name):
+    """INSERT for one task into a logical database; a shard hands out the id from its own range (shards.py)"""
+    if db.is_shard(name):
+        return '''INSERT INTO tasks (id, user_id, title, description, priority, status, due_date, collab_list_id)
+                  VALUES ((SELECT next_id FROM task_ids), ?, ?, ?, ?, ?, ?, ?)'''
+    return '''INSERT INTO tasks (user_id, title, description, priority, status, due_date, collab_list_id)
+              VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+def _insert_task(c, sql, params):
+    c.execute(sql + ' RETURNING id', params)
+    task_id = c.fetchone()[0]
     c.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
-    task = c.fetchone()
-    conn.close()
-    return task
+    return c.fetchone()
+
+def create_task(user_id, title, description=None, priority='Medium', status='pending', due_date=None, collab_list_id=None):
+    # Committed inline, or by the group-commit writer (group_commit.py)
+    name = shards.database_for(user_id, collab_list_id, place=True)
+    return group_commit.run(name, _insert_task, _insert_sql(name),
+                            (user_id, title, description, priority, status, due_date, collab_list_id))
+
+def encode_cursor(task):
+    """Opaque pagination cursor pointing just past the given task row"""
+    raw = json.dumps([task['created_at'], task['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-def get_tasks(user_id, status=None, priority=None, collab_list_id=None, include_archived=False):
-    conn = get_db_connection()
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(created_at, str) or not isinstance(task_id, int):
+        raise ValueError('Invalid cursor')
+    return created_at, task_id
+
+def get_tasks(user_id, status=None, priority=None, collab_list_id=None, include_archived=False,
+              archived_only=False, limit=None, cursor=None):
+    conn = db.get_connection(shards.database_for(user_id, collab_list_id))
     c = conn.cursor()
     
     if collab_list_id:
@@ -74,75 +77,177 @@ def get_tasks(user_id, status=None, priority=None, collab_list_id=None, include_
         params.append(priority)
     
     # Filter out archived tasks unless explicitly requested
-    if not include_archived:
-        query += ' AND (archived IS NULL OR archived = 0)'
+    if archived_only:
+        query += ' AND archived = 1'
+    elif not include_archived:
+        query += ' AND archived = 0'
+    
+    # Keyset pagination: continue strictly after the cursor's (created_at, id)
+    if cursor:
+        query += ' AND (created_at, id) < (?, ?)'
+        params.extend(decode_cursor(cursor))
     
-    query += ' ORDER BY created_at DESC'
+    query += ' ORDER BY created_at DESC, id DESC'
+    
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
     
     c.execute(query, tuple(params))
     tasks = c.fetchall()
     conn.close()
     return tasks
 
-def get_tasks_for_collab_list(collab_list_id, status=None, priority=None, include_archived=False):
+def get_board_version(user_id=None, collab_list_id=None):
+    """Version of a personal board (user_id) or list board; changes whenever any of its tasks does"""
+    name = shards.database_for(user_id, collab_list_id)
+    conn = db.get_connection(name)
+    c = conn.cursor()
+    c.execute('SELECT version FROM board_versions WHERE board = ?', (shards.board(user_id, collab_list_id),))
+    result = c.fetchone()
+    conn.close()
+    return shards.board_version(name, result['version'] if result else 0)
+
+def get_tasks_page(user_id, limit, cursor=None, **filters):
+    """One page of get_tasks() plus the cursor for the next page (None on the last page)"""
+    tasks = get_tasks(user_id, limit=limit + 1, cursor=cursor, **filters)
+    next_cursor = encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    return tasks[:limit], next_cursor
+
+def get_tasks_due(user_id, due_before):
+    """Open (unarchived) tasks of a user due on or before the given ISO date, soonest first"""
+    tasks = []
+    # The user's tasks on lists they have left still count, so ask every shard
+    for name in shards.all_databases():
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute('''
+            SELECT * FROM tasks
+            WHERE user_id = ? AND due_date IS NOT NULL AND due_date <= ? AND archived = 0
+            ORDER BY due_date
+        ''', (user_id, due_before))
+        tasks += c.fetchall()
+        conn.close()
+    if shards.enabled():
+        tasks.sort(key=lambda task: task['due_date'])
+    return tasks
+
+def get_tasks_for_collab_list(collab_list_id, status=None, priority=None, include_archived=False, archived_only=False):
     """Get all tasks for a collaborative list"""
-    return get_tasks(None, status=status, priority=priority, collab_list_id=collab_list_id, include_archived=include_archived)
+    return get_tasks(None, status=status, priority=priority, collab_list_id=collab_list_id,
+                     include_archived=include_archived, archived_only=archived_only)
+
+def _task_databases(user_id=None, task_id=None, everywhere=True):
+    """Where a task known only by id may be, most likely first: the shard that
+    issued the id, the user's shards, then (everywhere) the rest. Lazy, so a
+    hit on the first skips the shard map lookups."""
+    seen = set()
+    def fresh(names):
+        for name in names:
+            if name and name not in seen:
+                seen.add(name)
+                yield name
+    if task_id is not None:
+        yield from fresh([shards.database_of(task_id)])
+    if user_id:
+        yield from fresh(shards.user_databases(user_id))
+    if everywhere:
+        yield from fresh(shards.all_databases())
 
 def get_task_by_id(task_id, user_id=None):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
-    task = c.fetchone()
-    conn.close()
-    return task
+    for name in _task_databases(user_id, task_id):
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
+        task = c.fetchone()
+        conn.close()
+        if task is not None:
+            return task
+    return None
+
+# Permission check shared by the access-checked reads and writes below.
+# Personal tasks belong to their creator; list tasks to every list member.
+# list_members lives in the attached collab_lists database.
+TASK_ACCESS_CHECK = '''
+    CASE WHEN tasks.collab_list_id IS NULL THEN tasks.user_id = :user_id
+    ELSE EXISTS (
+        SELECT 1 FROM list_members
+        WHERE list_members.list_id = tasks.collab_list_id AND list_members.user_id = :user_id
+    ) END
+'''
+
+def get_task_for_user(task_id, user_id):
+    """Fetch a task together with its list and the caller's permission in one query.
+
+    Returns None if the task doesn't exist; otherwise the row carries
+    can_access (0/1), collab_list_name and collab_list_owner_id.
+    """
+    for name in _task_databases(user_id, task_id):
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT tasks.*,
+                   collab_lists.name AS collab_list_name,
+                   collab_lists.owner_id AS collab_list_owner_id,
+                   {TASK_ACCESS_CHECK} AS can_access
+            FROM tasks
+            LEFT JOIN collab_lists ON collab_lists.id = tasks.collab_list_id
+            WHERE tasks.id = :task_id
+        ''', {'task_id': task_id, 'user_id': user_id})
+        task = c.fetchone()
+        conn.close()
+        if task is not None:
+            return task
+    return None
+
+def _write_returning(c, query, params):
+    c.execute(query, params)
+    return c.fetchone()
 
 def update_task(task_id, user_id=None, title=None, description=None, priority=None, status=None, due_date=None, archived=None):
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+    """Update a task and return the new row.
+
+    When user_id is given the permission check is part of the UPDATE itself,
+    so None means nothing to update, no such task, or no access.
+    """
     updates = []
-    params = []
+    params = {'task_id': task_id, 'user_id': user_id}
     
     if title is not None:
-        updates.append('title = ?')
-        params.append(title)
+        updates.append('title = :title')
+        params['title'] = title
     if description is not None:
-        updates.append('description = ?')
-        params.append(description)
+        updates.append('description = :description')
+        params['description'] = description
     if priority is not None:
-        updates.append('priority = ?')
-        params.append(priority)
+        updates.append('priority = :priority')
+        params['priority'] = priority
     if status is not None:
-        updates.append('status = ?')
-        params.append(status)
+        updates.append('status = :status')
+        params['status'] = status
     if due_date is not None:
-        updates.append('due_date = ?')
-        params.append(due_date)
+        updates.append('due_date = :due_date')
+        params['due_date'] = due_date
     if archived is not None:
-        updates.append('archived = ?')
-        params.append(1 if archived else 0)
+        updates.append('archived = :archived')
+        params['archived'] = 1 if archived else 0
     
     if not updates:
-        conn.close()
         return None
     
-    updates.append('updated_at = ?')
-    params.append(datetime.now().isoformat())
-    params.append(task_id)
+    updates.append('updated_at = :updated_at')
+    params['updated_at'] = datetime.now().isoformat()
     
+    query = f'UPDATE tasks SET {", ".join(updates)} WHERE id = :task_id'
     if user_id:
-        query = f'UPDATE tasks SET {", ".join(updates)} WHERE id = ? AND (user_id = ? OR collab_list_id IS NOT NULL)'
-        params.append(user_id)
-    else:
-        query = f'UPDATE tasks SET {", ".join(updates)} WHERE id = ?'
-    
-    c.execute(query, tuple(params))
-    conn.commit()
-    
-    c.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
-    task = c.fetchone()
-    conn.close()
-    return task
+        query += f' AND {TASK_ACCESS_CHECK}'
+    query += ' RETURNING *'
+    # With user_id the task can only be on a shard holding one of the user's boards
+    for name in _task_databases(user_id, task_id, everywhere=not user_id):
+        task = group_commit.run(name, _write_returning, query, params)
+        if task is not None:
+            return task
+    return None
 
 def archive_task(task_id, user_id=None):
     """Archive a task"""
@@ -152,31 +257,306 @@ def unarchive_task(task_id, user_id=None):
     """Unarchive a task"""
     return update_task(task_id, user_id=user_id, archived=False)
 
-def delete_task(task_id, user_id=None):
-    conn = get_db_connection()
-    c = conn.cursor()
+def _delete_task(c, task_id, user_id):
     if user_id:
-        # Allow deletion if user owns the task or it's in a collab list they have access to
-        c.execute('DELETE FROM tasks WHERE id = ? AND (user_id = ? OR collab_list_id IS NOT NULL)', (task_id, user_id))
+        # Only delete if the user owns the task or is a member of its list
+        c.execute(f'DELETE FROM tasks WHERE id = :task_id AND {TASK_ACCESS_CHECK}',
+                  {'task_id': task_id, 'user_id': user_id})
     else:
         c.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
-    return deleted
+    return c.rowcount > 0
+
+def delete_task(task_id, user_id=None):
+    for name in _task_databases(user_id, task_id, everywhere=not user_id):
+        if group_commit.run(name, _delete_task, task_id, user_id):
+            return True
+    return False
+
+BATCH_OPS = ('create', 'update', 'status', 'archive', 'unarchive', 'delete')
+UPDATABLE_FIELDS = ('title', 'description', 'priority', 'status', 'due_date')
+
+def _batch_error(index, op, task_id, code, message):
+    return {'index': index, 'op': op, 'id': task_id, 'success': False, 'code': code, 'message': message}
+
+def _batch_write(name, op, item):
+    """(sql, params) for one authorized batch item; runs of identical sql share one executemany"""
+    if op == 'create':
+        return (_insert_sql(name),
+                (item['user_id'], item['title'], item.get('description') or None,
+                 item.get('priority') or 'Medium', item.get('status') or 'pending',
+                 item.get('due_date') or None, item.get('collab_list_id')))
+    if op == 'delete':
+        return 'DELETE FROM tasks WHERE id = ?', (item['id'],)
+    if op in ('archive', 'unarchive'):
+        return 'UPDATE tasks SET archived = ?, updated_at = ? WHERE id = ?', (
+            1 if op == 'archive' else 0, item['updated_at'], item['id'])
+    fields = [field for field in UPDATABLE_FIELDS if item.get(field) is not None]
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+    return (f'UPDATE tasks SET {assignments}, updated_at = ? WHERE id = ?',
+            tuple(item[field] for field in fields) + (item['updated_at'], item['id']))
+
+def apply_task_batch(user_id, operations):
+    """Authorize and apply many task operations in a single transaction.
+
+    operations is a list of dicts with an 'op' from BATCH_OPS plus 'id' (for
+    everything but create) and the task fields. Access for every referenced
+    task and list is resolved with one query each; consecutive updates of
+    the same shape are written with one executemany, creates one by one, and
+    the whole batch is committed once. Returns one result dict per operation, in order.
+    Items that fail validation or authorization are skipped and reported;
+    a database error rolls back the entire batch. With sharded tasks each
+    shard's items are one transaction, so an error there leaves the parts
+    already committed on other shards in place.
+    """
+    results = [None] * len(operations)
+    pending = []
+    now = datetime.now().isoformat()
+
+    # Validate item shapes before touching the database
+    for index, raw in enumerate(operations):
+        op = raw.get('op') if isinstance(raw, dict) else None
+        task_id = raw.get('id') if isinstance(raw, dict) else None
+        if op not in BATCH_OPS:
+            results[index] = _batch_error(index, op, task_id, 400, 'Unknown operation')
+            continue
+        item = {field: raw.get(field) for field in UPDATABLE_FIELDS}
+        item.update(id=task_id, user_id=user_id, updated_at=now, collab_list_id=raw.get('collab_list_id'))
+        if isinstance(item['title'], str):
+            item['title'] = item['title'].strip()
+        if isinstance(item['description'], str):
+            item['description'] = item['description'].strip() or None
+        if op == 'status':
+            item = {**item, 'title': None, 'description': None, 'priority': None, 'due_date': None}
+        # Task fields are strings, as in the single-task routes; anything else is the item's error
+        wrong_type = next((field for field in UPDATABLE_FIELDS
+                           if item[field] is not None and not isinstance(item[field], str)), None)
+        if op != 'create' and (not isinstance(task_id, int) or isinstance(task_id, bool)):
+            results[index] = _batch_error(index, op, task_id, 400, 'Task id is required')
+        elif wrong_type:
+            results[index] = _batch_error(index, op, task_id, 400, f'{wrong_type} must be a string')
+        elif op == 'create' and not item['title']:
+            results[index] = _batch_error(index, op, None, 400, 'Task title is required')
+        elif op == 'update' and item['title'] is not None and not item['title']:
+            results[index] = _batch_error(index, op, task_id, 400, 'Task title cannot be empty')
+        elif op == 'status' and not item['status']:
+            results[index] = _batch_error(index, op, task_id, 400, 'Status is required')
+        elif op == 'update' and all(item[field] is None for field in UPDATABLE_FIELDS):
+            results[index] = _batch_error(index, op, task_id, 400, 'No fields to update')
+        elif op == 'create' and item['collab_list_id'] is not None and (
+                not isinstance(item['collab_list_id'], int) or isinstance(item['collab_list_id'], bool)):
+            results[index] = _batch_error(index, op, None, 400, 'Invalid collab_list_id')
+        else:
+            pending.append((index, op, item))
+
+    if not pending:
+        return results
 
-def search_tasks(user_id, search_term, include_archived=False):
-    conn = get_db_connection()
+    for name, items in _batch_databases(user_id, pending).items():
+        authorized, rows = _apply_batch(name, user_id, items, results)
+        for index, op, item in authorized:
+            results[index] = {'index': index, 'op': op, 'id': item['id'], 'success': True,
+                              'task': rows.get(item['id'])}
+    return results
+
+def _batch_databases(user_id, pending):
+    """{logical database: batch items} - creates go to their board's shard, the rest to their task's"""
+    if not shards.enabled():
+        return {'tasks': pending}
+    task_ids = sorted({item['id'] for _, op, item in pending if op != 'create'})
+    located = {}
+    for name in _task_databases(user_id):
+        missing = [task_id for task_id in task_ids if task_id not in located]
+        if not missing:
+            break
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute('SELECT id FROM tasks WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(missing),))
+        located.update((row['id'], name) for row in c.fetchall())
+        conn.close()
+    grouped = {}
+    for index, op, item in pending:
+        if op == 'create':
+            name = shards.database_for(user_id, item['collab_list_id'], place=True)
+        else:
+            # Tasks found nowhere are reported as not found by the personal board's shard
+            name = located.get(item['id']) or shards.database_for(user_id)
+        grouped.setdefault(name, []).append((index, op, item))
+    return grouped
+
+def _apply_batch(name, user_id, pending, results):
+    """Authorize and write batch items in one transaction on one database; returns (authorized, rows by id)"""
+    conn = db.get_connection(name)
     c = conn.cursor()
-    query = '''
-        SELECT * FROM tasks 
-        WHERE user_id = ? 
-        AND (title LIKE ? OR description LIKE ?)
-    '''
-    if not include_archived:
-        query += ' AND (archived IS NULL OR archived = 0)'
-    query += ' ORDER BY created_at DESC'
-    c.execute(query, (user_id, f'%{search_term}%', f'%{search_term}%'))
-    tasks = c.fetchall()
-    conn.close()
+    try:
+        # Lock first so the access checks below still hold when we write
+        c.execute('BEGIN IMMEDIATE')
+
+        task_ids = sorted({item['id'] for _, op, item in pending if op != 'create'})
+        list_ids = sorted({item['collab_list_id'] for _, op, item in pending
+                           if op == 'create' and item['collab_list_id']})
+        access = {}
+        if task_ids:
+            c.execute(f'''
+                SELECT id, {TASK_ACCESS_CHECK} AS can_access FROM tasks
+                WHERE id IN (SELECT value FROM json_each(:ids))
+            ''', {'ids': json.dumps(task_ids), 'user_id': user_id})
+            access = {row['id']: row['can_access'] for row in c.fetchall()}
+        member_lists = set()
+        if list_ids:
+            c.execute('''
+                SELECT list_id FROM list_members
+                WHERE user_id = :user_id AND list_id IN (SELECT value FROM json_each(:ids))
+            ''', {'ids': json.dumps(list_ids), 'user_id': user_id})
+            member_lists = {row['list_id'] for row in c.fetchall()}
+
+        authorized = []
+        for index, op, item in pending:
+            if op == 'create':
+                if item['collab_list_id'] and item['collab_list_id'] not in member_lists:
+                    results[index] = _batch_error(index, op, None, 403, 'Access denied')
+                    continue
+            elif item['id'] not in access:
+                results[index] = _batch_error(index, op, item['id'], 404, 'Task not found')
+                continue
+            elif not access[item['id']]:
+                results[index] = _batch_error(index, op, item['id'], 403, 'Access denied')
+                continue
+            authorized.append((index, op, item))
+
+        # Group consecutive items with identical SQL so order is preserved
+        runs = []
+        for index, op, item in authorized:
+            sql, params = _batch_write(name, op, item)
+            if runs and runs[-1][0] == sql:
+                runs[-1][1].append(params)
+                runs[-1][2].append((index, op, item))
+            else:
+                runs.append((sql, [params], [(index, op, item)]))
+
+        for sql, params, items in runs:
+            if items[0][1] != 'create':
+                c.executemany(sql, params)
+                continue
+            # Creates one at a time: RETURNING is the only portable way to learn each new id
+            for row_params, (_, _, item) in zip(params, items):
+                c.execute(sql + ' RETURNING id', row_params)
+                item['id'] = c.fetchone()[0]
+
+        touched = sorted({item['id'] for _, _, item in authorized})
+        c.execute('SELECT * FROM tasks WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(touched),))
+        rows = {row['id']: row for row in c.fetchall()}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return authorized, rows
+
+# Snippet markers are control characters so task text can be HTML-escaped
+# before they are turned into <mark> tags
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+def _fts_query(search_term):
+    """Turn free text into an FTS5 prefix query: 'buy mil' -> '"buy"* "mil"*'
+
+    (PostgreSQL tsquery: 'buy mil' -> "'buy':* & 'mil':*")
+    """
+    tokens = re.findall(r'\w+', search_term or '')
+    if db.BACKEND == 'postgres':
+        return ' & '.join(f"'{token}':*" for token in tokens)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def _highlight(snippet):
+    if not snippet:
+        return ''
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+def search_tasks(user_id, search_term, status=None, priority=None, include_archived=False,
+                 archived_only=False, personal_only=False, limit=50):
+    """Ranked full-text search over the user's personal tasks and every list they belong to.
+
+    Returns dicts with the task columns plus rank (bm25, lower is better) and
+    HTML-safe title_snippet/description_snippet with matches in <mark> tags.
+    limit=None returns every match. With sharded tasks every shard holding one of the user's boards returns
+    its best matches and these are merged by rank; bm25 weighs terms by their
+    frequency on each shard, so ranks across shards are close, not exact.
+    """
+    match = _fts_query(search_term)
+    if not match:
+        return []
+
+    if db.BACKEND == 'postgres':
+        # ts_rank with title weighted 10:1 over description, negated so lower is better as with bm25.
+        # ts_headline drops anything that looks like an HTML tag, so '<' is hidden from it as chr(1).
+        query = f'''
+        SELECT tasks.*,
+               -ts_rank('{{0, 0, 0.1, 1.0}}', task_document(tasks.title, tasks.description), query) AS rank,
+               replace(ts_headline('simple', replace(tasks.title, '<', chr(1)), query,
+                       'StartSel={_MARK_OPEN}, StopSel={_MARK_CLOSE}, MaxWords=12, MinWords=4'), chr(1), '<')
+                   AS title_snippet,
+               replace(ts_headline('simple', replace(tasks.description, '<', chr(1)), query,
+                       'StartSel={_MARK_OPEN}, StopSel={_MARK_CLOSE}, MaxWords=24, MinWords=8'), chr(1), '<')
+                   AS description_snippet
+        FROM tasks, to_tsquery('simple', ?) AS query
+        WHERE task_document(tasks.title, tasks.description) @@ query
+        '''
+    else:
+        query = f'''
+        SELECT tasks.*,
+               bm25(tasks_fts, 10.0, 1.0) AS rank,
+               snippet(tasks_fts, 0, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 12) AS title_snippet,
+               snippet(tasks_fts, 1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 24) AS description_snippet
+        FROM tasks_fts
+        JOIN tasks ON tasks.id = tasks_fts.rowid
+        WHERE tasks_fts MATCH ?
+        '''
+    params = [match]
+
+    if personal_only:
+        query += ' AND tasks.user_id = ? AND tasks.collab_list_id IS NULL'
+        params.append(user_id)
+    else:
+        query += '''
+        AND ((tasks.user_id = ? AND tasks.collab_list_id IS NULL)
+             OR tasks.collab_list_id IN (SELECT list_id FROM list_members WHERE user_id = ?))
+        '''
+        params.extend([user_id, user_id])
+
+    if status:
+        query += ' AND tasks.status = ?'
+        params.append(status)
+
+    if priority:
+        query += ' AND tasks.priority = ?'
+        params.append(priority)
+
+    if archived_only:
+        query += ' AND tasks.archived = 1'
+    elif not include_archived:
+        query += ' AND tasks.archived = 0'
+
+    query += ' ORDER BY rank'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    rows = []
+    for name in [shards.database_for(user_id)] if personal_only else shards.user_databases(user_id):
+        conn = db.get_connection(name)
+        c = conn.cursor()
+        c.execute(query, tuple(params))
+        rows += c.fetchall()
+        conn.close()
+    if shards.enabled():
+        rows = sorted(rows, key=lambda row: row['rank'])[:limit]
+
+    tasks = []
+    for row in rows:
+        task = dict(row)
+        task['title_snippet'] = _highlight(task['title_snippet'])
+        task['description_snippet'] = _highlight(task['description_snippet'])
+        tasks.append(task)
     return tasks